@@ -1,13 +1,15 @@
 import json
+import re
 from typing import List, Any
 
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from states import AgentState, DebugInfo, EmotionalState
 from langchain_core.tools import tool
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 from Configurations import Configuration
 from dataclasses import asdict
 from json_parser_utils import robust_json_parse, create_fallback_dict
+from llm import llm_semaphore
 
 
 def _extract_llm_usage(output_obj: Any) -> dict:
@@ -103,7 +105,30 @@ def _fallback_evaluation(action: str, response: str, current_stage: str, emotion
 
     return max(0.1, min(1.0, score))  # 确保在合理范围内
 
-def _generate_and_evaluate_action(
+# 需要交给评估模型复核的回复特征：绝对化承诺、医疗功效断言、不当用语
+_RISKY_REPLY_RE = re.compile(
+    r"保证|包你|绝对|百分之百|100%|根治|永久|无副作用|零风险|不反弹|治愈|最便宜|最好的|傻|滚|有病"
+)
+# 超过该长度的回复容易跑题或堆砌信息，交给评估模型复核
+_VERIFY_MAX_CHARS = 200
+
+
+def _needs_verification(response: str, state_data: dict) -> bool:
+    """
+    判断候选回复是否需要调用评估模型打分。
+
+    多个候选动作需要靠模型评分排序，必须评估；只有一个候选时评分不影响选择，
+    仅在回复为空/过长或命中风险规则时才调用评估模型。
+    """
+    if len(state_data.get("candidate_actions") or []) > 1:
+        return True
+    text = (response or "").strip()
+    if len(text) < 3 or len(text) > _VERIFY_MAX_CHARS:
+        return True
+    return _RISKY_REPLY_RE.search(text) is not None
+
+
+async def _generate_and_evaluate_action(
         action: str,
         state_data: dict,  # 传递整个状态以获取更丰富的上下文
 ):
@@ -400,10 +425,12 @@ def _generate_and_evaluate_action(
         # 调用模型生成回复
         try:
             # 明确要求返回 JSON，降低空响应概率
-            response_result = response_sampler.invoke(
-                messages_for_sampler,
-                response_format={"type": "json_object"}
-            )
+            # 与其他会话共享提供商的并发上限，高峰期排队而不是各自直连触发 429
+            async with llm_semaphore(model_provider):
+                response_result = await response_sampler.ainvoke(
+                    messages_for_sampler,
+                    response_format={"type": "json_object"}
+                )
             print(f"[DEBUG] [{action}] 生成模型调用成功，返回类型: {type(response_result)}")
             
             response_text = response_result.content if hasattr(response_result, 'content') else str(response_result)
@@ -445,6 +472,24 @@ def _generate_and_evaluate_action(
 
         response = _safe_json_parse(response_text, fallback_response)
 
+        # 单一候选且未命中风险规则：用规则评分代替评估模型，省掉一次模型调用
+        if not _needs_verification(response, state_data):
+            score = _fallback_evaluation(action, response, current_stage, emotional_state, customer_intent_level or "low")
+            reasoning = "单一候选且未命中风险规则，跳过评估模型，使用规则评估"
+            evaluated_response = {
+                "action": action,
+                "response": response,
+                "score": score,
+                "reasoning": reasoning
+            }
+            monologue_entry = f"  - [{action}] 生成回复: '{response[:30]}...' -> 评估得分: {score} (原因: {reasoning})"
+            round_usage = {
+                "input_tokens": generation_usage.get("input", 0),
+                "output_tokens": generation_usage.get("output", 0),
+                "total_tokens": generation_usage.get("total", 0),
+            }
+            return evaluated_response, monologue_entry, round_usage
+
         # 然后评估回复
         print(f"[DEBUG] [{action}] 创建评估模型实例...")
         # 评估模型也来自运行时配置（若缺失则回退到生成模型）
@@ -498,10 +543,11 @@ def _generate_and_evaluate_action(
 JSON格式: {{"score": 数值, "reasoning": "简短理由"}}
 """
         try:
-            raw_feedback = feedback_sampler.invoke(
-                [HumanMessage(content=feedback_prompt)],
-                response_format={"type": "json_object"}
-            )
+            async with llm_semaphore(model_provider):
+                raw_feedback = await feedback_sampler.ainvoke(
+                    [HumanMessage(content=feedback_prompt)],
+                    response_format={"type": "json_object"}
+                )
             print(f"[DEBUG] [{action}] 评估模型调用成功，返回类型: {type(raw_feedback)}")
             
         except Exception as e:
@@ -578,7 +624,7 @@ JSON格式: {{"score": 数值, "reasoning": "简短理由"}}
     return evaluated_response, monologue_entry, round_usage
 
 @tool
-def generate_and_evaluate_node(state_data: dict):
+async def generate_and_evaluate_node(state_data: dict):
     """
     并行地为每个候选动作生成回复并获取反馈。
     """
@@ -598,33 +644,25 @@ def generate_and_evaluate_node(state_data: dict):
 
     max_concurrent_requests = min(3, len(candidate_actions) or 1)
 
-    # 使用 ThreadPoolExecutor 来处理异步函数
-    print(f"[DEBUG] 创建 ThreadPoolExecutor...")
-    with ThreadPoolExecutor(max_workers=max_concurrent_requests) as executor:
-        print(f"[DEBUG] 开始提交任务...")
-        # 提交所有任务
-        future_to_action = {}
-        for action in candidate_actions:
-            print(f"[DEBUG] 提交任务: {action}")
-            future = executor.submit(_generate_and_evaluate_action, action, state_data)
-            future_to_action[future] = action
-        print(f"[DEBUG] 所有任务提交完成，共 {len(future_to_action)} 个任务")
-
-        # 收集结果
-        results = []
-        for future in as_completed(future_to_action):
+    # 各候选动作在事件循环上并发生成与评估（模型调用为原生异步），不再占用线程池；同时在途的动作数受限
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+    async def _run_action(action: str):
+        async with semaphore:
+            print(f"[DEBUG] 开始任务: {action}")
             try:
-                print(f"[DEBUG] 等待任务完成...")
-                result = future.result()
-                print(f"[DEBUG] 任务完成，结果类型: {type(result)}")
-                results.append(result)
+                result = await _generate_and_evaluate_action(action, state_data)
             except Exception as e:
-                action = future_to_action[future]
                 print(f"[DEBUG] 任务 {action} 执行失败，错误类型: {type(e)}")
                 print(f"[DEBUG] 错误信息: {e}")
                 import traceback
                 print(f"[DEBUG] 完整错误堆栈: {traceback.format_exc()}")
-                results.append(e)
+                return e
+            print(f"[DEBUG] 任务完成，结果类型: {type(result)}")
+            return result
+
+    # 结果顺序与 candidate_actions 一致
+    results = await asyncio.gather(*(_run_action(action) for action in candidate_actions))
 
 
 
@@ -5,17 +5,9 @@
 """
 import json
 import os
-import sys
-from pathlib import Path
 from typing import Dict, Any, Optional
 from threading import Lock
 
-# 添加项目根目录到Python路径
-current_dir = Path(__file__).parent
-project_root = current_dir.parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
-
 from Configurations import Configuration
 
 
@@ -2,23 +2,21 @@
 
 每个 assistant_id 都有自己独立的配置文件，存储在 assistants_config/{assistant_id}.json
 """
+import copy
 import json
 import os
-import sys
-from pathlib import Path
 from typing import Dict, Any, Optional, List
 from threading import RLock
 import uuid
 from datetime import datetime
 
-# 添加项目根目录到Python路径
-current_dir = Path(__file__).parent
-project_root = current_dir.parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
+from cachetools import TTLCache
 
 from Configurations import Configuration
 
+# 助手配置读取缓存的有效期（秒）：每轮对话都会读取配置，缓存后不再每次读盘解析 JSON
+_CONFIG_CACHE_TTL = int(os.environ.get("ASSISTANT_CONFIG_CACHE_TTL", "60"))
+
 
 class MultiAssistantConfigManager:
     """多助手配置管理器，支持按 assistant_id 独立配置管理."""
@@ -43,6 +41,9 @@ class MultiAssistantConfigManager:
             # 默认配置文件
             self._default_config_file = os.path.join(self._config_dir, "default_assistant.json")
             
+            # assistant_id -> 配置；通过本管理器修改/删除/创建配置时立即失效，外部直接改文件则在有效期后生效
+            self._config_cache: TTLCache = TTLCache(maxsize=256, ttl=_CONFIG_CACHE_TTL)
+            
             self._initialized = True
     
     def _ensure_config_dir(self):
@@ -80,8 +81,12 @@ class MultiAssistantConfigManager:
             return False
     
     def get_assistant_config(self, assistant_id: str) -> Dict[str, Any]:
-        """获取指定 assistant 的配置."""
+        """获取指定 assistant 的配置（返回深拷贝，调用方修改嵌套字段也不会影响缓存）."""
         with self._lock:
+            cached = self._config_cache.get(assistant_id)
+            if cached is not None:
+                return copy.deepcopy(cached)
+
             config_file = self._get_config_file_path(assistant_id)
             config = self._load_config_from_file(config_file)
             
@@ -92,6 +97,8 @@ class MultiAssistantConfigManager:
                     print(f"[MultiAssistantConfigManager] 使用默认配置初始化 assistant {assistant_id}")
                     config = default_config.copy()
             
+            if config:
+                self._config_cache[assistant_id] = copy.deepcopy(config)
             return config
     
     def update_assistant_config(self, assistant_id: str, config_updates: Dict[str, Any]) -> bool:
@@ -117,6 +124,7 @@ class MultiAssistantConfigManager:
                 # 保存配置
                 config_file = self._get_config_file_path(assistant_id)
                 success = self._save_config_to_file(current_config, config_file)
+                self._config_cache.pop(assistant_id, None)
                 
                 if success:
                     print(f"[MultiAssistantConfigManager] 成功更新 assistant {assistant_id} 的 {len(valid_updates)} 个配置项")
@@ -160,6 +168,7 @@ class MultiAssistantConfigManager:
         try:
             with self._lock:
                 config_file = self._get_config_file_path(assistant_id)
+                self._config_cache.pop(assistant_id, None)
                 if os.path.exists(config_file):
                     # 删除文件
                     os.remove(config_file)
@@ -189,6 +198,7 @@ class MultiAssistantConfigManager:
                 if default_config:
                     config_file = self._get_config_file_path(assistant_id)
                     success = self._save_config_to_file(default_config, config_file)
+                    self._config_cache.pop(assistant_id, None)
                     if success:
                         print(f"[MultiAssistantConfigManager] 从默认配置创建 assistant {assistant_id}")
                     return success
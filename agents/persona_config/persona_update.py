@@ -2,14 +2,13 @@
 定义了一个 LangGraph 图，可以通过 API 调用来安全地修改 runtime_config.json，从而实现配置的动态更新
 """
 import sys
-import os
 from pathlib import Path
 
-# 添加项目根目录到Python路径
-current_dir = Path(__file__).parent
-project_root = current_dir.parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
+# 本文件是 langgraph.json 注册的入口，会被按文件路径直接加载；
+# 项目根目录的路径设置只在这里做一次，其余模块按包路径正常导入
+project_root = str(Path(__file__).resolve().parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
 
 from typing import Dict, Any, Optional
 from typing_extensions import TypedDict
@@ -20,28 +19,9 @@ from dataclasses import dataclass, field
 import json
 from Configurations import Configuration
 
-# 尝试多种导入方式
-try:
-    from agents.persona_config.config_manager import config_manager
-    from agents.persona_config.multi_assistant_config_manager import multi_assistant_config_manager
-except ImportError:
-    try:
-        from .config_manager import config_manager
-        from .multi_assistant_config_manager import multi_assistant_config_manager
-    except ImportError:
-        # 如果都失败，直接导入同目录下的文件
-        import importlib.util
-        config_manager_path = current_dir / "config_manager.py"
-        spec = importlib.util.spec_from_file_location("config_manager", config_manager_path)
-        config_manager_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(config_manager_module)
-        config_manager = config_manager_module.config_manager
-        
-        multi_config_manager_path = current_dir / "multi_assistant_config_manager.py"
-        spec2 = importlib.util.spec_from_file_location("multi_assistant_config_manager", multi_config_manager_path)
-        multi_config_manager_module = importlib.util.module_from_spec(spec2)
-        spec2.loader.exec_module(multi_config_manager_module)
-        multi_assistant_config_manager = multi_config_manager_module.multi_assistant_config_manager
+# 只走包路径导入：按文件路径重复加载会生成第二份模块和第二个单例
+from agents.persona_config.config_manager import config_manager
+from agents.persona_config.multi_assistant_config_manager import multi_assistant_config_manager
 
 
 class PersonaConfigInput(TypedDict):
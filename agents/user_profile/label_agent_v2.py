@@ -6,13 +6,17 @@
 3. 自动验证和修正不合规标签
 """
 
-import asyncio
-import json
+import functools
+import hashlib
 import logging
+import re
+
+import orjson
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
+from cachetools import TTLCache
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
-from llm import create_llm # 导入新的 LLM 工厂函数
+from llm import get_llm, cached_text_block, llm_semaphore # 导入新的 LLM 工厂函数
 # 默认模型使用 OpenRouter 可用的快速模型
 from agents.shared.profile_variables import profile_variables
 from dataclasses import dataclass, field
@@ -23,6 +27,75 @@ from langchain_core.messages import trim_messages, RemoveMessage
 
 logger = logging.getLogger(__name__)
 
+def _is_json_invalid(error: ValidationError) -> bool:
+    """区分“不是合法 JSON”与“JSON 合法但字段校验失败”"""
+    return any(item.get("type") == "json_invalid" for item in error.errors())
+
+
+# JSON 回退解析时剥离 markdown 代码块标记
+_MD_JSON_PREFIX = re.compile(r'^\s*```(?:json)?\s*')
+_MD_JSON_SUFFIX = re.compile(r'\s*```\s*$')
+
+# 结果缓存：两步都是输入的纯函数，相同历史/相同分析结果在有效期内直接复用，跳过 LLM 往返
+# 键包含 (provider, model, temperature)，不同模型的结果互不复用
+_ANALYSIS_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+_LABEL_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+
+
+def _content_hash(payload: Any) -> str:
+    """对可 JSON 序列化的内容计算稳定的短哈希"""
+    data = orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+# 字典消息的角色到 LangChain 消息类的映射，未识别角色降级为 human
+_ROLE_TO_MESSAGE = {
+    "user": HumanMessage,
+    "human": HumanMessage,
+    "assistant": AIMessage,
+    "ai": AIMessage,
+    "system": SystemMessage,
+}
+
+
+def _extract_text(content: Any) -> str:
+    """提取消息文本：字符串原样返回，多模态 list 只拼接其中的 text 部分"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            str(part.get("text", ""))
+            for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    return str(content) if content is not None else ""
+
+# 历史裁剪水位：超过高水位后按整块丢弃最旧消息，裁剪点每 _HISTORY_CHUNK 条才移动一次，
+# 使“摘要 + 保留历史”的前缀在连续多轮内保持不变，不破坏提示缓存
+_HISTORY_HIGH_WATER = 60
+_HISTORY_CHUNK = 20
+
+
+def _reduce_history(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """按块裁剪过长的历史，被丢弃的部分替换为一条确定性的摘要消息"""
+    overflow = len(messages) - _HISTORY_HIGH_WATER
+    if overflow <= 0:
+        return messages
+
+    cut = -(-overflow // _HISTORY_CHUNK) * _HISTORY_CHUNK
+    dropped = messages[:cut]
+
+    def _first_line(msg: BaseMessage) -> str:
+        content = msg.content if isinstance(msg.content, str) else str(msg.content)
+        return content.strip().split("\n", 1)[0][:50]
+
+    human_msgs = [m for m in dropped if m.type == "human"]
+    human_count = len(human_msgs)
+    topics = f"首条「{_first_line(human_msgs[0])}」，末条「{_first_line(human_msgs[-1])}」" if human_msgs else "无用户消息"
+    summary = SystemMessage(
+        content=f"[此前 {cut} 条消息已省略：用户 {human_count} 条，其余 {cut - human_count} 条；用户话题 {topics}]"
+    )
+    return [summary] + messages[cut:]
+
 
 class UserProfile(BaseModel):
     """用户画像结构 - 按业务逻辑分组排序"""
@@ -58,76 +131,87 @@ class UserProfile(BaseModel):
 
     def get_filled_count(self) -> int:
         """获取已填充字段数量"""
-        return sum(1 for v in self.model_dump().values() if v is not None)
+        return sum(1 for name in _PROFILE_FIELD_NAMES if getattr(self, name) is not None)
     
     def get_total_count(self) -> int:
         """获取总字段数量"""
-        return len(self.model_fields)
+        return len(_PROFILE_FIELD_NAMES)
     
     def get_grouped_data(self) -> Dict[str, Dict[str, Optional[str]]]:
         """获取按分组组织的数据"""
-        data = self.model_dump()
         return {
-            "社会画像": {
-                "occupation": data["occupation"],
-                "age": data["age"], 
-                "region": data["region"],
-                "lifestyle": data["lifestyle"],
-                "family_status": data["family_status"],
-                "emotion": data["emotion"]
-            },
-            "性格特征": {
-                "character": data["character"],
-                "values": data["values"],
-                "aesthetic_style": data["aesthetic_style"]
-            },
-            "消费画像": {
-                "ability": data["ability"],
-                "willingness": data["willingness"],
-                "preferences": data["preferences"]
-            },
-            "产品意图": {
-                "current_use": data["current_use"],
-                "potential_needs": data["potential_needs"],
-                "decision_factors": data["decision_factors"],
-                "purchase_intent_score": data["purchase_intent_score"]
-            },
-            "客户生命周期": {
-                "stage": data["stage"],
-                "value": data["value"],
-                "retention_strategy": data["retention_strategy"]
-            }
+            group: {name: getattr(self, name) for name in names}
+            for group, names in _PROFILE_FIELD_GROUPS
         }
 
+
+# 画像字段分组（顺序即输出顺序），与 UserProfile 的字段定义保持一致
+_PROFILE_FIELD_GROUPS = (
+    ("社会画像", ("occupation", "age", "region", "lifestyle", "family_status", "emotion")),
+    ("性格特征", ("character", "values", "aesthetic_style")),
+    ("消费画像", ("ability", "willingness", "preferences")),
+    ("产品意图", ("current_use", "potential_needs", "decision_factors", "purchase_intent_score")),
+    ("客户生命周期", ("stage", "value", "retention_strategy")),
+)
+_PROFILE_FIELD_NAMES = tuple(UserProfile.model_fields)
+
 # 定义分析结果数据模型 - 必须在ProfileGenerator类之前定义
 class AnalysisResult(BaseModel):
     """第一步分析结果结构"""
-    basic_info: str = Field(description="用户基本信息摘要")
-    personality: str = Field(description="性格特征摘要")
-    consumption: str = Field(description="消费行为摘要")
-    beauty_needs: str = Field(description="美容需求摘要")
-    customer_status: str = Field(description="客户状态摘要")
-    dialogue_quality: str = Field(description="对话信息充足度(1-10分)")
-    summarize: str = Field(description="综合所有分析内容的一句话总结")
-
-
-class ProfileGenerator:
-    """分步式用户画像生成器"""
+    # 字段描述即结构化输出的 schema 说明，会随工具定义一并发送给模型
+    basic_info: str = Field(description="用户基本信息摘要（从对话时间、表达方式、关注点等推断年龄段、职业类型、地区等）")
+    personality: str = Field(description="性格特征摘要（从对话方式、情绪表达、语言风格等分析性格类型、价值观等）")
+    consumption: str = Field(description="消费行为摘要（从工作状态、对话时间、表达方式等推断消费能力、消费偏好等）")
+    beauty_needs: str = Field(description="美容需求摘要（从对话中的美容话题、关注点、询问方式等分析需求）")
+    customer_status: str = Field(description="客户状态摘要（从对话态度、服务满意度、互动方式等判断客户阶段、购买意向、流失风险等）")
+    dialogue_quality: str = Field(description="对话信息充足度(字符串格式，如\"5\")，1=信息很少，10=信息丰富")
+    summarize: str = Field(description="综合以上分析，形成用户的整体画像描述")
+
+
+@functools.cache
+def _format_profile_options() -> str:
+    """格式化预定义选项（profile_variables 运行期不变，只构建一次）"""
+    sections = []
     
-    def __init__(self, model_provider: str, model_name: str, temperature: float):
-        # 创建支持JSON格式输出的模型
-        # 统一通过工厂创建，底层已将 openai 路由到 openrouter
-        self.model = create_llm(
-            model_provider=model_provider,
-            model_name=model_name,
-            temperature=temperature,
-        )
+    # 社会画像
+    social = profile_variables["social_profile"]
+    sections.append(f"occupation: {social['occupation']}")
+    sections.append(f"age: {social['age']}")
+    sections.append(f"region: {social['region']}")
+    sections.append(f"lifestyle: {social['lifestyle']}")
+    sections.append(f"family_status: {social['family_status']}")
+    sections.append(f"emotion: {social['emotion']}")
     
-    def _build_analysis_prompt(self) -> str:
-        """第一步：构建对话分析提示"""
-        return """你是专业的用户画像分析专家。请基于上述聊天记录进行用户画像分析。
+    # 性格特征
+    personality = profile_variables["personality_traits"]
+    sections.append(f"character: {personality['character']}")
+    sections.append(f"values: {personality['values']}")
+    sections.append(f"aesthetic_style: {personality['aesthetic_style']}")
+    
+    # 消费画像
+    consumption = profile_variables["consumption_profile"]
+    sections.append(f"ability: {consumption['ability']}")
+    sections.append(f"willingness: {consumption['willingness']}")
+    sections.append(f"preferences: {consumption['preferences']}")
+    
+    # 产品意图
+    product = profile_variables["product_intent"]
+    sections.append(f"current_use: {product['current_use']}")
+    sections.append(f"potential_needs: {product['potential_needs']}")
+    sections.append(f"decision_factors: {product['decision_factors']}")
+    sections.append(f"purchase_intent_score: {product['purchase_intent_score']}")
+    
+    # 客户生命周期
+    lifecycle = profile_variables["customer_lifecycle"]
+    sections.append(f"stage: {lifecycle['stage']}")
+    sections.append(f"value: {lifecycle['value']}")
+    sections.append(f"retention_strategy: {lifecycle['retention_strategy']}")
+    
+    return "\n".join(sections)
+
 
-**重要：你必须严格按照JSON格式返回分析结果，不要包含任何其他文本或格式标记。**
+# 静态提示词在导入时构建一次，作为各会话逐字节一致的缓存前缀
+_ANALYSIS_PROMPT = """你是专业的用户画像分析专家。请基于随后提供的聊天记录进行用户画像分析。
 
 **分析指导：通过用户的表达方式、语言习惯、关注点等信息，进行专业的用户画像分析。**
 
@@ -137,24 +221,80 @@ class ProfileGenerator:
 - 消费行为：了解用户的消费偏好和能力
 - 美容需求：分析用户对美容服务的需求
 - 客户状态：评估用户的服务满意度和购买意向
-- 对话质量：评估本次对话信息的丰富程度
-
-请严格按照以下JSON格式返回分析结果：
-{
-    "basic_info": "用户基本信息摘要（从对话时间、表达方式、关注点等推断年龄段、职业类型、地区等）",
-    "personality": "性格特征摘要（从对话方式、情绪表达、语言风格等分析性格类型、价值观等）", 
-    "consumption": "消费行为摘要（从工作状态、对话时间、表达方式等推断消费能力、消费偏好等）",
-    "beauty_needs": "美容需求摘要（从对话中的美容话题、关注点、询问方式等分析需求）",
-    "customer_status": "客户状态摘要（从对话态度、服务满意度、互动方式等判断客户阶段、购买意向、流失风险等）",
-    "dialogue_quality": "对话信息充足度(字符串格式，如\"5\")，1=信息很少，10=信息丰富",
-    "summarize": "综合以上分析，形成用户的整体画像描述"
-}
+- 对话质量：评估本次对话信息的丰富程度"""
+
+_LABELING_PROMPT_PREFIX = f"""基于分析结果，生成标准化用户画像标签。根据对话质量调整推理积极度。
+
+可选标签：
+{_format_profile_options()}
+
+标签生成策略：
+1. 对话质量≥7分：积极推理，基于线索合理推断标签
+2. 对话质量4-6分：适度推理，明确线索才填写标签  
+3. 对话质量≤3分：保守策略，只填写非常确定的标签
+
+推理指导：
+- 工作繁忙+加班 → lifestyle可能是"熬夜"
+- 情绪从正常变消极 → emotion填写最终状态
+- 要求转人工+攻击性语言 → stage可能是"流失客户期"
+- 消极情绪用户 → retention_strategy建议"客户关怀"
+- 周末加班 → 可能是高压职业类型
+
+规则：
+1. 只能选择上述预定义选项，不能自创
+2. 多个选项用英文逗号分隔：如"程序员,设计师"
+3. 无合适选项时填null
+4. 不能用"和"、"与"等连接词"""
 
-输出要求：
-1. 必须返回有效的JSON格式
-2. 基于对话内容进行专业分析
-2. 严格按照上述JSON格式输出
-3. 只输出JSON内容，不要添加其他文字"""
+
+class ProfileGenerator:
+    """分步式用户画像生成器"""
+    
+    def __init__(self, model_provider: str, model_name: str, temperature: float):
+        # 统一通过工厂创建（按参数复用实例），底层已将 openai 路由到 openrouter
+        self.model = get_llm(model_provider, model_name, temperature)
+        self._model_provider = model_provider
+        self._cache_scope = (model_provider, model_name, temperature)
+        # 结构化输出：schema 通过工具定义下发，不再靠提示词约束 JSON 格式
+        # include_raw=True 保留原始响应，供模型未走工具调用时回退解析
+        self.analysis_model = self.model.with_structured_output(AnalysisResult, include_raw=True)
+        self.label_model = self.model.with_structured_output(UserProfile, include_raw=True)
+
+    async def _ainvoke(self, runnable, messages: List[BaseMessage]):
+        """在提供商共享的并发上限内以原生异步方式调用模型"""
+        async with llm_semaphore(self._model_provider):
+            return await runnable.ainvoke(messages)
+
+    def _parse_structured(self, result: Dict[str, Any], schema: type):
+        """取出结构化输出结果；模型未按 schema 返回时，回退解析原始文本中的 JSON"""
+        if result.get("parsed") is not None:
+            return result["parsed"]
+
+        raw = result.get("raw")
+        content = (getattr(raw, "content", "") or "").strip()
+        logger.warning(f"结构化输出解析失败: {result.get('parsing_error')}，尝试解析原始文本")
+        # model_validate_json 在 pydantic-core 中一次完成 JSON 解析与校验，不经过中间 dict
+        try:
+            return schema.model_validate_json(content)
+        except ValidationError as e:
+            if not _is_json_invalid(e):
+                raise
+            logger.error(f"JSON解析失败: {e}")
+            logger.error(f"原始响应内容: {repr(content)}")
+        # 如果直接解析失败，尝试清理markdown标记
+        content = _MD_JSON_PREFIX.sub('', _MD_JSON_SUFFIX.sub('', content)).strip()
+        try:
+            parsed = schema.model_validate_json(content)
+        except ValidationError as e:
+            if not _is_json_invalid(e):
+                raise
+            raise ValueError(f"AI模型返回的不是有效JSON格式: {content[:200]}...")
+        logger.warning("通过清理markdown标记成功解析JSON")
+        return parsed
+    
+    def _build_analysis_prompt(self) -> str:
+        """第一步：构建对话分析提示（静态指令，作为可缓存前缀放在聊天记录之前）"""
+        return _ANALYSIS_PROMPT
 
     def _normalize_messages(self, messages: List[Any]) -> List[BaseMessage]:
         """将输入的消息列表统一转换为 LangChain 的 BaseMessage 列表，避免 MESSAGE_COERCION_FAILURE。
@@ -166,139 +306,56 @@ class ProfileGenerator:
         - 大小写不规范的角色名（如 "Human"）
         未识别角色降级为 human。
         """
-        normalized: List[BaseMessage] = []
         if not messages:
-            return normalized
-
-        def _extract_text(content: Any) -> str:
-            if isinstance(content, list):
-                parts: List[str] = []
-                for part in content:
-                    if isinstance(part, dict) and part.get("type") == "text":
-                        parts.append(str(part.get("text", "")))
-                return "".join(parts)
-            return str(content) if content is not None else ""
-
-        for msg in messages:
+            return []
+
+        normalized: List[BaseMessage] = [None] * len(messages)
+        for i, msg in enumerate(messages):
             if isinstance(msg, BaseMessage):
-                normalized.append(msg)
-                continue
-            if isinstance(msg, dict):
+                normalized[i] = msg
+            elif isinstance(msg, dict):
                 role = str(msg.get("role", "")).strip().lower()
-                content = _extract_text(msg.get("content", ""))
-                if role in ("user", "human"):
-                    normalized.append(HumanMessage(content=content))
-                elif role in ("assistant", "ai"):
-                    normalized.append(AIMessage(content=content))
-                elif role == "system":
-                    normalized.append(SystemMessage(content=content))
-                else:
-                    normalized.append(HumanMessage(content=content))
-                continue
-            normalized.append(HumanMessage(content=str(msg)))
+                message_cls = _ROLE_TO_MESSAGE.get(role, HumanMessage)
+                normalized[i] = message_cls(content=_extract_text(msg.get("content", "")))
+            else:
+                normalized[i] = HumanMessage(content=str(msg))
         return normalized
 
-    def _build_labeling_prompt(self, analysis: Dict[str, str]) -> str:
-        """第二步：构建标签生成提示"""
-        options_str = self._format_options()
-        
+    def _build_labeling_prompt(self, analysis: Dict[str, str]) -> List[Dict[str, Any]]:
+        """第二步：构建标签生成提示
+
+        返回内容块列表：第一块为所有会话共用的静态指令（带缓存断点），
+        第二块才是本次的对话质量与分析结果，保证缓存前缀逐字节一致。
+        """
         dialogue_quality = analysis.get("dialogue_quality", "5")
         
-        return f"""基于分析结果，生成标准化用户画像标签。根据对话质量({dialogue_quality}分)调整推理积极度。
-
-**重要：你必须严格按照JSON格式返回标签结果，不要包含任何其他文本或格式标记。**
+        dynamic_suffix = f"""对话质量：{dialogue_quality}分
 
 分析结果：
-{json.dumps(analysis, ensure_ascii=False, indent=2)}
+{orjson.dumps(analysis, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()}"""
 
-可选标签：
-{options_str}
+        return [cached_text_block(_LABELING_PROMPT_PREFIX), {"type": "text", "text": dynamic_suffix}]
 
-标签生成策略：
-1. 对话质量≥7分：积极推理，基于线索合理推断标签
-2. 对话质量4-6分：适度推理，明确线索才填写标签  
-3. 对话质量≤3分：保守策略，只填写非常确定的标签
+    def _format_options(self) -> str:
+        """格式化预定义选项"""
+        return _format_profile_options()
+
+    def _build_analysis_messages(self, normalized_history: List[BaseMessage]) -> List[BaseMessage]:
+        """静态分析指令在前（可缓存），规范化后的对话记录在后"""
+        return (
+            [SystemMessage(content=[cached_text_block(self._build_analysis_prompt())])]
+            + normalized_history
+            + [HumanMessage(content="请基于以上聊天记录完成用户画像分析。")]
+        )
 
-推理指导：
-- 工作繁忙+加班 → lifestyle可能是"熬夜"
-- 情绪从正常变消极 → emotion填写最终状态
-- 要求转人工+攻击性语言 → stage可能是"流失客户期"
-- 消极情绪用户 → retention_strategy建议"客户关怀"
-- 周末加班 → 可能是高压职业类型
+    def _build_labeling_messages(self, analysis_data: Dict[str, str]) -> List[BaseMessage]:
+        return [SystemMessage(content="你是标签生成专家"), HumanMessage(content=self._build_labeling_prompt(analysis_data))]
 
-规则：
-1. 只能选择上述预定义选项，不能自创
-2. 多个选项用英文逗号分隔：如"程序员,设计师"
-3. 无合适选项时填null
-4. 不能用"和"、"与"等连接词
-
-请严格按照以下JSON格式返回标签结果，不要添加任何其他文本：
-{{
-    "occupation": "从预定义选项选择或null",
-    "age": "从预定义选项选择或null",
-    "region": "从预定义选项选择或null",
-    "lifestyle": "从预定义选项选择或null",
-    "family_status": "从预定义选项选择或null",
-    "emotion": "从预定义选项选择或null",
-    "character": "从预定义选项选择或null",
-    "values": "从预定义选项选择或null",
-    "aesthetic_style": "从预定义选项选择或null",
-    "ability": "从预定义选项选择或null",
-    "willingness": "从预定义选项选择或null",
-    "preferences": "从预定义选项选择或null",
-    "current_use": "从预定义选项选择或null",
-    "potential_needs": "从预定义选项选择或null",
-    "decision_factors": "从预定义选项选择或null",
-    "purchase_intent_score": "从预定义选项选择或null",
-    "stage": "从预定义选项选择或null",
-    "value": "从预定义选项选择或null",
-    "retention_strategy": "从预定义选项选择或null"
-}}
-
-输出要求：
-1. 必须返回有效的JSON格式
-2. 只输出JSON内容，不要添加其他文字
-3. 严格按照上述JSON格式输出"""
+    def _analysis_cache_key(self, normalized_history: List[BaseMessage]) -> tuple:
+        return (self._cache_scope, _content_hash([(m.type, m.content) for m in normalized_history]))
 
-    def _format_options(self) -> str:
-        """格式化预定义选项"""
-        sections = []
-        
-        # 社会画像
-        social = profile_variables["social_profile"]
-        sections.append(f"occupation: {social['occupation']}")
-        sections.append(f"age: {social['age']}")
-        sections.append(f"region: {social['region']}")
-        sections.append(f"lifestyle: {social['lifestyle']}")
-        sections.append(f"family_status: {social['family_status']}")
-        sections.append(f"emotion: {social['emotion']}")
-        
-        # 性格特征
-        personality = profile_variables["personality_traits"]
-        sections.append(f"character: {personality['character']}")
-        sections.append(f"values: {personality['values']}")
-        sections.append(f"aesthetic_style: {personality['aesthetic_style']}")
-        
-        # 消费画像
-        consumption = profile_variables["consumption_profile"]
-        sections.append(f"ability: {consumption['ability']}")
-        sections.append(f"willingness: {consumption['willingness']}")
-        sections.append(f"preferences: {consumption['preferences']}")
-        
-        # 产品意图
-        product = profile_variables["product_intent"]
-        sections.append(f"current_use: {product['current_use']}")
-        sections.append(f"potential_needs: {product['potential_needs']}")
-        sections.append(f"decision_factors: {product['decision_factors']}")
-        sections.append(f"purchase_intent_score: {product['purchase_intent_score']}")
-        
-        # 客户生命周期
-        lifecycle = profile_variables["customer_lifecycle"]
-        sections.append(f"stage: {lifecycle['stage']}")
-        sections.append(f"value: {lifecycle['value']}")
-        sections.append(f"retention_strategy: {lifecycle['retention_strategy']}")
-        
-        return "\n".join(sections)
+    def _label_cache_key(self, analysis_data: Dict[str, str]) -> tuple:
+        return (self._cache_scope, _content_hash(analysis_data))
 
     async def analyze_conversation(self, config: Optional[Dict] = None, state: Optional[Dict] = None) -> AnalysisResult:
         """🔍 【核心方法1】执行第一步对话分析 - 自动获取当前会话历史记录
@@ -321,40 +378,23 @@ class ProfileGenerator:
             if not messages:
                 raise ValueError("当前会话没有历史聊天记录")
             
-            # 构建分析提示词
-            analysis_prompt = self._build_analysis_prompt()
-            # 🎯 关键步骤：将对话记录与分析提示组合（先规范化历史消息）
-            normalized_history = self._normalize_messages(messages)
-            analysis_messages = normalized_history + [HumanMessage(content=analysis_prompt)]
+            normalized_history = _reduce_history(self._normalize_messages(messages))
+
+            cache_key = self._analysis_cache_key(normalized_history)
+            cached = _ANALYSIS_CACHE.get(cache_key)
+            if cached is not None:
+                logger.info("对话分析命中缓存，跳过模型调用")
+                return cached.model_copy()
+
+            analysis_messages = self._build_analysis_messages(normalized_history)
             
             logger.info(f"执行第一步对话分析，使用{len(messages)}条对话消息")
             # 🤖 调用AI模型分析历史聊天记录
-            analysis_response = await asyncio.to_thread(self.model.invoke, analysis_messages)
-            
-            # 调试：打印原始响应
-            logger.info(f"[DEBUG] AI模型原始响应: {analysis_response.content}")
-            
-            # 解析JSON响应（使用response_format后应该直接是JSON格式）
-            import json
-            
-            try:
-                analysis_data = json.loads(analysis_response.content.strip())
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON解析失败: {e}")
-                logger.error(f"原始响应内容: {repr(analysis_response.content)}")
-                # 如果直接解析失败，尝试清理markdown标记
-                import re
-                content = analysis_response.content.strip()
-                content = re.sub(r'^```json\s*', '', content)
-                content = re.sub(r'\s*```$', '', content)
-                content = content.strip()
-                try:
-                    analysis_data = json.loads(content)
-                    logger.warning("通过清理markdown标记成功解析JSON")
-                except json.JSONDecodeError:
-                    raise ValueError(f"AI模型返回的不是有效JSON格式: {analysis_response.content[:200]}...")
+            analysis_response = await self._ainvoke(self.analysis_model, analysis_messages)
             
-            return AnalysisResult(**analysis_data)
+            analysis_result = self._parse_structured(analysis_response, AnalysisResult)
+            _ANALYSIS_CACHE[cache_key] = analysis_result.model_copy()
+            return analysis_result
             
         except Exception as e:
             logger.error(f"对话分析失败: {e}")
@@ -372,9 +412,8 @@ class ProfileGenerator:
             raise ValueError("聊天记录为空")
         
         try:
-            # 🔍 第一步：分析历史对话记录（内部会自动过滤消息）
-            config_dict = {"configurable": {"messages": messages}}
-            analysis_result = await self.analyze_conversation(config_dict)
+            # 🔍 第一步：分析历史对话记录（analyze_conversation 从 state 读取历史）
+            analysis_result = await self.analyze_conversation(state={"long_term_messages": messages})
             
             # 🏷️ 第二步：基于分析结果生成标准化标签
             profile = await self.generate_labels_from_analysis(analysis_result)
@@ -389,43 +428,26 @@ class ProfileGenerator:
         """基于分析结果生成用户画像标签"""
         try:
             analysis_data = analysis_result.model_dump()
+
+            cache_key = self._label_cache_key(analysis_data)
+            cached = _LABEL_CACHE.get(cache_key)
+            if cached is not None:
+                logger.info("标签生成命中缓存，跳过模型调用")
+                return cached.model_copy()
             
-            # 输出分析结果（调试用）
-            print("🔍 基于分析结果生成标签:")
-            for key, value in analysis_data.items():
-                print(f"  {key}: {value}")
-            print()
+            # 输出分析结果（调试用，仅在 DEBUG 级别下格式化）
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔍 基于分析结果生成标签:\n%s", "\n".join(f"  {key}: {value}" for key, value in analysis_data.items()))
             
             # 生成标签
-            labeling_prompt = self._build_labeling_prompt(analysis_data)
-            labeling_messages = [SystemMessage(content="你是标签生成专家"), HumanMessage(content=labeling_prompt)]
+            labeling_messages = self._build_labeling_messages(analysis_data)
             
             logger.info("生成标准化标签")
-            labeling_response = await asyncio.to_thread(self.model.invoke, labeling_messages)
-            
-            # 调试：打印原始响应
-            logger.info(f"[DEBUG] 标签生成原始响应: {labeling_response.content}")
+            labeling_response = await self._ainvoke(self.label_model, labeling_messages)
             
-            # 解析JSON响应（使用response_format后应该直接是JSON格式）
-            import json
-            try:
-                profile_data = json.loads(labeling_response.content.strip())
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON解析失败: {e}")
-                logger.error(f"原始响应内容: {repr(labeling_response.content)}")
-                # 如果直接解析失败，尝试清理markdown标记
-                import re
-                content = labeling_response.content.strip()
-                content = re.sub(r'^```json\s*', '', content)
-                content = re.sub(r'\s*```$', '', content)
-                content = content.strip()
-                try:
-                    profile_data = json.loads(content)
-                    logger.warning("通过清理markdown标记成功解析JSON")
-                except json.JSONDecodeError:
-                    raise ValueError(f"AI模型返回的不是有效JSON格式: {labeling_response.content[:200]}...")
-            
-            return UserProfile(**profile_data)
+            profile = self._parse_structured(labeling_response, UserProfile)
+            _LABEL_CACHE[cache_key] = profile.model_copy()
+            return profile
             
         except Exception as e:
             logger.error(f"基于分析结果生成标签失败: {e}")
@@ -438,13 +460,14 @@ from langchain_core.runnables import RunnableConfig
 
 
 # 自定义输出类 - 只包含需要的字段
-@dataclass
+# 输出 schema 只作为图的输出通道定义，节点仍返回 dict 以便 LangGraph 按字段合并更新
+@dataclass(slots=True, frozen=True)
 class ProfileLabelOutput:
     """用户画像标签输出 - 只包含必要字段"""
     user_profile_label: Optional[UserProfile] = field(default=None)
     error_message: Optional[str] = field(default=None)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ProfileAnalysisOutput:
     """用户画像分析输出 - 只包含必要字段"""
     analysis_result: Optional[AnalysisResult] = field(default=None)
@@ -453,13 +476,21 @@ class ProfileAnalysisOutput:
 # 导入AgentState
 from states import AgentState
 
+
+class ProfileState(AgentState):
+    """画像标签工作流状态 - 在 AgentState 基础上增加分析节点与标签节点之间传递的字段"""
+    analysis_result: Optional[AnalysisResult]
+    user_profile_label: Optional[UserProfile]
+    error_message: Optional[str]
+
 async def profile_analysis_node(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
     """🔄 【LangGraph节点1】第一步分析节点 - 自动获取当前会话历史聊天记录分析"""
     try:
         # 📝 自动获取当前会话的历史聊天记录
+        # 失败时同时清空 analysis_result，避免下游标签节点沿用线程里上一轮的旧结果
         thread_id = config.get("configurable", {}).get("thread_id")
         if not thread_id:
-            return {"error_message": "缺少会话线程ID，无法获取历史聊天记录"}
+            return {"analysis_result": None, "error_message": "缺少会话线程ID，无法获取历史聊天记录"}
         
         # 直接从state中获取完整历史消息（LangGraph状态机制）
         # 直接使用long_term_messages获取完整历史对话
@@ -468,7 +499,7 @@ async def profile_analysis_node(state: AgentState, config: RunnableConfig) -> Di
             logger.info(f"profile_analysis_node从long_term_messages获取到{len(messages)}条历史消息")
         
         if not messages:
-            return {"error_message": "当前会话暂无历史聊天记录"}
+            return {"analysis_result": None, "error_message": "当前会话暂无历史聊天记录"}
         
         # 获取配置
         model_provider = config.get("configurable", {}).get("model_provider", "openrouter")
@@ -486,7 +517,7 @@ async def profile_analysis_node(state: AgentState, config: RunnableConfig) -> Di
     
     except Exception as e:
         logger.error(f"对话分析失败: {e}")
-        return {"error_message": str(e)}
+        return {"analysis_result": None, "error_message": str(e)}
 
 def create_profile_analysis_graph():
     """创建第一步分析工作流 - 专门用于替代profile_agent"""
@@ -505,12 +536,17 @@ def create_profile_analysis_graph():
 # 导出第一步分析工作流
 profile_analysis_graph = create_profile_analysis_graph()
 
-async def profile_label_node(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
-    """🔄 【LangGraph节点2】用户画像标签生成节点 - 自动获取当前会话历史聊天记录的完整流程"""
+async def profile_label_node(state: ProfileState, config: RunnableConfig) -> Dict[str, Any]:
+    """🔄 【LangGraph节点2】用户画像标签生成节点 - 基于上游 profile_analysis_node 写入的分析结果生成标签"""
     try:
-        # 🔍 调试信息：打印完整的config内容
-        logger.info(f"[DEBUG] profile_label_node 接收到的 config: {config}")
-        logger.info(f"[DEBUG] profile_label_node 接收到的 state: {state}")
+        # 🔍 调试信息：只记录概要，state 中含完整历史消息，不整体格式化
+        logger.debug("profile_label_node configurable keys=%s", list(config.get("configurable", {})))
+        logger.debug("profile_label_node state keys=%s msg_count=%d", list(state), len(state.get("long_term_messages") or []))
+        
+        # 分析结果必须由上游分析节点提供，这里不再静默补跑分析
+        analysis_result = state.get("analysis_result")
+        if not analysis_result:
+            return {"error_message": state.get("error_message") or "缺少上游分析结果(analysis_result)，无法生成标签"}
         
         # 获取配置
         model_provider = config.get("configurable", {}).get("model_provider", "openrouter")
@@ -518,36 +554,10 @@ async def profile_label_node(state: AgentState, config: RunnableConfig) -> Dict[
         temperature = config.get("configurable", {}).get("temperature", 0.3)
         
         generator = ProfileGenerator(model_provider, model_name, temperature)
-        
-        # 检查是否有分析结果
-        analysis_result = state.get("analysis_result")
-        
-        if not analysis_result:
-            # 📝 自动获取当前会话的历史聊天记录
-            thread_id = config.get("configurable", {}).get("thread_id")
-            logger.info(f"[DEBUG] 提取到的 thread_id: {thread_id}")
-            
-            if not thread_id:
-                return {"error_message": "缺少会话线程ID，无法获取历史聊天记录"}
-            
-            # 直接从state中获取完整历史消息（LangGraph状态机制）
-            # 直接使用long_term_messages获取完整历史对话
-            messages = state.get("long_term_messages", [])
-            if messages:
-                logger.info(f"profile_label_node从long_term_messages获取到{len(messages)}条历史消息")
-            
-            if not messages:
-                return {"error_message": "当前会话暂无历史聊天记录，无法生成标签"}
-            
-            # 🔍 第一步：分析历史对话记录（会自动过滤只保留人类和AI对话）
-            analysis_result = await generator.analyze_conversation(config, state)
-        
-        # 第二步：基于分析结果生成标签
         profile = await generator.generate_labels_from_analysis(analysis_result)
         
         return {
             "user_profile_label": profile,
-            "analysis_result": analysis_result,  # 同时返回分析结果
             "error_message": None
         }
     
@@ -562,9 +572,12 @@ def create_profile_label_graph():
         """用户画像标签生成输入"""
         pass  # 空输入，所有数据通过LangGraph的messages自动注入
     
-    graph = StateGraph(input=ProfileLabelInput, state_schema=AgentState, output=ProfileLabelOutput)
+    graph = StateGraph(input=ProfileLabelInput, state_schema=ProfileState, output=ProfileLabelOutput)
+    # 分析节点是标签节点的显式前驱，标签节点只消费其写入的 analysis_result
+    graph.add_node("analysis_generator", profile_analysis_node)
     graph.add_node("profile_generator", profile_label_node)
-    graph.add_edge(START, "profile_generator")
+    graph.add_edge(START, "analysis_generator")
+    graph.add_edge("analysis_generator", "profile_generator")
     
     compiled_graph = graph.compile()
     return compiled_graph
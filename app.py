@@ -1,4 +1,10 @@
+import functools
+import hashlib
+import threading
 from typing import Dict, Any
+
+import orjson
+from cachetools import LRUCache
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph
 from langgraph.graph.state import CompiledStateGraph
@@ -13,12 +19,38 @@ from nodes import create_context_update_workflow
 from agents.persona_config.config_manager import config_manager
 from agents.persona_config.multi_assistant_config_manager import multi_assistant_config_manager
 
+def _config_key(hot_config: Dict[str, Any]) -> bytes:
+    """热更新配置的规范化序列化（键排序）摘要，内容相同的配置得到相同的缓存键；只用于查找，不用于还原配置"""
+    payload = orjson.dumps(hot_config, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+# 按配置摘要缓存已编译的图
+_GRAPH_CACHE: LRUCache = LRUCache(maxsize=64)
+_GRAPH_CACHE_LOCK = threading.Lock()
+
+
+def _compile_parallel_tools_graph(hot_config: Dict[str, Any]) -> CompiledStateGraph:
+    # 配置未变化时复用已编译的图；配置变更后键随之变化，自然触发重新编译。编译时传入原始配置
+    key = _config_key(hot_config)
+    with _GRAPH_CACHE_LOCK:
+        graph = _GRAPH_CACHE.get(key)
+        if graph is None:
+            graph = _GRAPH_CACHE[key] = create_parallel_tools_graph(hot_config)
+    return graph
+
+
+@functools.cache
+def _compile_context_update_graph() -> CompiledStateGraph:
+    return create_context_update_workflow()
+
+
 def get_graph(config: RunnableConfig) -> CompiledStateGraph:
     """
     LangGraph Cloud 热更新入口函数。
     
-    这个函数会在每次请求时被调用，根据 assistant_id 加载对应配置
-    动态地构建和编译一个新的图实例，实现真正的热更新。
+    这个函数会在每次请求时被调用，根据 assistant_id 加载对应配置；
+    配置内容不变时复用已编译的图，配置变更后重新编译，实现热更新。
     
     Args:
         config: RunnableConfig 对象，包含运行时配置信息
@@ -51,19 +83,15 @@ def get_graph(config: RunnableConfig) -> CompiledStateGraph:
         hot_config = config_manager.get_config() or {}
         print(f"[DEBUG] 使用全局配置: {len(hot_config)} 个字段")
     
-    # 构建并编译图，传入热更新配置
-    workflow = create_parallel_tools_graph(hot_config)
-    
-    # 编译并返回图实例
-    # 注意：每次调用都会创建新的图实例，确保使用最新配置
-    return workflow
+    # 按配置内容取已编译的图，配置变化时才重新构建
+    return _compile_parallel_tools_graph(hot_config or {})
 
 def get_context_update_graph(config: RunnableConfig) -> CompiledStateGraph:
     """
     上下文更新工作流的入口函数。
 
     这个函数专门用于处理向现有thread注入上下文信息的请求。
-    每次请求时动态构建上下文更新工作流实例。
+    该工作流不依赖热更新配置，进程内只编译一次。
 
     Args:
         config: RunnableConfig 对象，包含运行时配置信息
@@ -80,9 +108,5 @@ def get_context_update_graph(config: RunnableConfig) -> CompiledStateGraph:
 
     print(f"[DEBUG] 上下文更新 - 提取到的 assistant_id: {assistant_id}")
 
-    # 构建上下文更新工作流
-    # 注意：这个工作流相对简单，不需要复杂的配置管理
-    workflow = create_context_update_workflow()
-
-    # 编译并返回图实例
-    return workflow
\ No newline at end of file
+    # 上下文更新工作流不需要配置管理，复用同一个编译实例
+    return _compile_context_update_graph()
\ No newline at end of file
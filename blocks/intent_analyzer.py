@@ -13,8 +13,66 @@ import json
 import re
 from langchain_core.tools import tool
 from json_parser_utils import robust_json_parse, create_fallback_dict
+from llm import cached_text_block, llm_semaphore
+
+# 意图识别的静态指令：所有会话逐字节一致，作为可缓存前缀
+INTENT_ANALYSIS_PROMPT = """
+你是一个客户行为意图识别专家。分析提示末尾给出的客户最新消息，识别其具体的行为意图。
+
+**意图类型定义:**
+1. "appointment_request" - 客户明确表达预约意图（如确认时间、询问预约等）
+2. "time_confirmation" - 客户确认或询问具体时间
+3. "price_inquiry" - 询问价格、费用相关
+4. "concern_raised" - 表达顾虑、担心、疑问（如担心效果、风险等）
+5. "general_chat" - 一般聊天、寒暄
+6. "ready_to_book" - 准备下单、预约
+7. "info_providing" - 提供个人信息（姓名、电话等）
+8. "info_seeking" - 寻求信息，如询问可用项目、服务细节等
+
+**分析任务:**
+1. 识别客户的主要意图类型
+2. 评估意图的置信度（0.0-1.0）
+3. 提取关键信息（时间、价格、服务类型等）
+4. 确定需要的后续动作
+
+**输出格式:**
+```json
+{
+    "intent_type": "具体的意图类型",
+    "confidence": 0.9,
+    "extracted_info": {
+        "time": "3点",
+        "service": "光子嫩肤",
+        "price_range": "1000-2000"
+    },
+    "requires_action": ["confirm_time", "collect_contact", "provide_address"]
+}
+```
+"""
+
+# 与上下文无关的寒暄/空消息，本地直接判定为 general_chat，不调用模型。
+# “好的”“嗯”“多少钱”这类短消息可能是确认时间或询价，仍交给模型判断。
+_TRIVIAL_MESSAGE_PATTERN = re.compile(
+    r'^(你好|您好|hi|hello|哈喽|在吗|在么|谢谢|谢啦|多谢)?[\s!?,.~。！？，、～]*$',
+    re.IGNORECASE,
+)
+
+
+def _message_text(content: Any) -> str:
+    """消息文本：字符串原样返回，多模态 list 只取其中的 text 部分，避免把整个 list 格式化进提示"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            str(part.get("text", ""))
+            for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    return "" if content is None else str(content)
+
+
 @tool
-def analyze_customer_intent(state_dict: dict = None):
+async def analyze_customer_intent(state_dict: dict = None):
     """
     分析客户的行为意图，识别具体的行为信号
     """
@@ -36,14 +94,24 @@ def analyze_customer_intent(state_dict: dict = None):
     if not last_customer_msg:
         return {}
     
-
+    # 寒暄/纯标点消息走本地快速路径，省掉一次模型往返
+    if isinstance(last_customer_msg, str) and _TRIVIAL_MESSAGE_PATTERN.match(last_customer_msg.strip()):
+        return {
+            "customer_intent": CustomerIntent(
+                intent_type="general_chat",
+                confidence=0.95,
+                extracted_info={},
+                requires_action=[]
+            )
+        }
     
     from agents.persona_config.config_manager import config_manager
     cfg = config_manager.get_config() or {}
+    model_provider = cfg.get("model_provider", "openrouter")
     try:
-        from llm import create_llm
-        llm = create_llm(
-            model_provider=cfg.get("model_provider", "openrouter"),
+        from llm import get_llm
+        llm = get_llm(
+            model_provider=model_provider,
             model_name=cfg.get("intent_model", cfg.get("model_name", "x-ai/grok-code-fast-1")),
             temperature=0.5
         )
@@ -51,54 +119,27 @@ def analyze_customer_intent(state_dict: dict = None):
         print(f"错误：无法创建意图分析模型: {e}")
         return {}
     
-    # 构建对话历史
-    dialog_history = "\n".join([f"{msg.type}: {msg.content}" for msg in messages[-5:]])  # 只取最近5轮
+    # 构建对话历史（只取最近5轮）
+    tail = messages[-5:] if len(messages) > 5 else messages
+    dialog_history = "\n".join(f"{msg.type}: {_message_text(msg.content)}" for msg in tail)
     
-    prompt = f"""
-你是一个客户行为意图识别专家。分析客户的最新消息，识别其具体的行为意图。
-
-**对话历史（最近5轮）:**
+    # 对话历史与最新消息放在提示末尾，前面的静态指令才能命中提供商的前缀缓存
+    dynamic_suffix = f"""**对话历史（最近5轮）:**
 {dialog_history}
 
 **客户最新消息:** "{last_customer_msg}"
-
-**意图类型定义:**
-1. "appointment_request" - 客户明确表达预约意图（如确认时间、询问预约等）
-2. "time_confirmation" - 客户确认或询问具体时间
-3. "price_inquiry" - 询问价格、费用相关
-4. "concern_raised" - 表达顾虑、担心、疑问（如担心效果、风险等）
-5. "general_chat" - 一般聊天、寒暄
-6. "ready_to_book" - 准备下单、预约
-7. "info_providing" - 提供个人信息（姓名、电话等）
-8. "info_seeking" - 寻求信息，如询问可用项目、服务细节等
-
-**分析任务:**
-1. 识别客户的主要意图类型
-2. 评估意图的置信度（0.0-1.0）
-3. 提取关键信息（时间、价格、服务类型等）
-4. 确定需要的后续动作
-
-**输出格式:**
-```json
-{{
-    "intent_type": "具体的意图类型",
-    "confidence": 0.9,
-    "extracted_info": {{
-        "time": "3点",
-        "service": "光子嫩肤",
-        "price_range": "1000-2000"
-    }},
-    "requires_action": ["confirm_time", "collect_contact", "provide_address"]
-}}
-```
 """
 
     try:
-        message = HumanMessage(content=prompt)
-        response_result = llm.invoke(
-            [message],
-            response_format={'type': 'json_object'}
-        )
+        message = HumanMessage(content=[
+            cached_text_block(INTENT_ANALYSIS_PROMPT),
+            {"type": "text", "text": dynamic_suffix},
+        ])
+        async with llm_semaphore(model_provider):
+            response_result = await llm.ainvoke(
+                [message],
+                response_format={'type': 'json_object'}
+            )
         response_text = response_result.content if hasattr(response_result, 'content') else str(response_result)
         
         print(f"[DEBUG-意图分析] 原始模型响应: {response_text}")
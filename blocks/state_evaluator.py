@@ -1,15 +1,30 @@
+from collections import ChainMap
 from typing import Dict, List, Any
 from states import AgentState, EmotionalState, DebugInfo
-from prompts.loader import load_prompt
-from langchain_core.messages import HumanMessage
+from prompts.loader import compile_prompt, render_prompt
+from langchain_core.messages import BaseMessage, HumanMessage
 import json
+import logging
 import re
 from langchain_core.tools import tool
 from Configurations import Configuration
 from dataclasses import asdict
-from json_parser_utils import robust_json_parse, create_fallback_dict
+from json_parser_utils import robust_json_parse, create_fallback_dict, JsonObjectTracker
+from llm import llm_semaphore
+import llm_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _format_message(msg: Any) -> str:
+    # BaseMessage 一定有 type/content，直接取属性；其他对象才走带默认值的 getattr
+    if isinstance(msg, BaseMessage):
+        return f"{msg.type}: {msg.content}"
+    return f"{getattr(msg, 'type', 'unknown')}: {getattr(msg, 'content', '')}"
+
+
 @tool
-def evaluate_state(state_dict: dict = None):
+async def evaluate_state(state_dict: dict = None):
     """
     评估当前对话状态，包括情感和客户意图。
     现在直接使用 SamplerFactory 获取所需采样器。
@@ -29,13 +44,11 @@ def evaluate_state(state_dict: dict = None):
     if messages is None:
         messages = []
 
-    history = "\n".join(
-        [f"{getattr(msg, 'type', 'unknown')}: {getattr(msg, 'content', '')}" for msg in messages]
-    )
+    history = "\n".join(_format_message(msg) for msg in messages)
 
-    # 加载 Prompt - 使用正确的 load_prompt 函数
+    # 加载 Prompt - 模板读取与占位符解析在进程内只做一次
     try:
-        prompt_template = load_prompt("state_evaluator", include_base_context=False)
+        prompt_template = compile_prompt("state_evaluator", include_base_context=False)
     except FileNotFoundError:
         print("错误: 找不到 state_evaluator.txt，无法进行状态评估。")
         return {} # 评估失败
@@ -61,19 +74,21 @@ def evaluate_state(state_dict: dict = None):
     # 获取debug_info，如果不存在则使用默认值
     debug_info = state_dict.get("debug_info")
     
-    prompt = prompt_template.format(
-        message_history=history,
-        current_stage=debug_info.current_stage if debug_info else "initial_contact",
-        user_profile={},
-        **cfg
-    )
+    # 模板已预解析，只替换实际出现的占位符；每轮变化的值优先，其余从 cfg 查找，不复制 cfg
+    prompt = render_prompt(prompt_template, ChainMap({
+        "message_history": history,
+        "current_stage": debug_info.current_stage if debug_info else "initial_contact",
+        "user_profile": {},
+    }, cfg))
     
     # 使用配置创建LLM
+    model_provider = cfg.get("model_provider", "openrouter")
+    model_name = cfg.get("evaluation_model", cfg.get("model_name", "x-ai/grok-code-fast-1"))
     try:
         from llm import create_llm
         llm = create_llm(
-            model_provider=cfg.get("model_provider", "openrouter"),
-            model_name=cfg.get("evaluation_model", cfg.get("model_name", "x-ai/grok-code-fast-1")),
+            model_provider=model_provider,
+            model_name=model_name,
             temperature=0.5
         )
     except Exception as e:
@@ -85,15 +100,35 @@ def evaluate_state(state_dict: dict = None):
         # 创建消息对象
         message = HumanMessage(content=prompt)
         
-        # 调用 LLM，要求返回 JSON 格式
-        response = llm.invoke(
-            [message],
-            response_format={"type": "json_object"}
-        )
-        response_text = response.content
+        response_format = {"type": "json_object"}
+
+        # 流式调用 LLM，要求返回 JSON 格式；与其他会话共享提供商的并发上限。
+        # 顶层 JSON 对象一闭合就停止读取并关闭连接，不等待模型的多余输出
+        async def _call_llm() -> str:
+            parts = []
+            tracker = JsonObjectTracker()
+            async with llm_semaphore(model_provider):
+                stream = llm.astream(
+                    [message],
+                    response_format=response_format
+                )
+                try:
+                    async for chunk in stream:
+                        text = chunk.content if isinstance(chunk.content, str) else ""
+                        parts.append(text)
+                        if tracker.feed(text):
+                            break
+                finally:
+                    await stream.aclose()
+            response_text = "".join(parts)
+            return response_text[:tracker.end] if tracker.end is not None else response_text
+
+        # 相同的评估请求在缓存有效期内复用上次的模型响应；集成测试可在 llm_cache.bypass() 中调用以强制请求模型
+        cache_key = llm_cache.make_key(model_provider, model_name, 0.5, response_format, prompt)
+        response_text = await llm_cache.get_or_call(cache_key, _call_llm)
         
         # 使用鲁棒的JSON解析工具
-        print(f"[DEBUG-状态评估] 原始模型响应: {response_text}")
+        logger.debug("[状态评估] 原始模型响应: %s", response_text)
         
         fallback_dict = create_fallback_dict("状态评估")
         llm_output = robust_json_parse(
@@ -103,12 +138,12 @@ def evaluate_state(state_dict: dict = None):
             debug=True
         )
         
-        print(f"[DEBUG-状态评估] 解析结果: {llm_output}")
+        logger.debug("[状态评估] 解析结果: %s", llm_output)
             
     except Exception as e:
-        print(f"[ERROR-状态评估] 模型调用或解析失败: {e}")
+        logger.error("[状态评估] 模型调用或解析失败: %s", e)
         if 'response_text' in locals() and response_text is not None:
-            print(f"[ERROR-状态评估] 原始响应: {response_text[:300]}...")
+            logger.error("[状态评估] 原始响应: %s...", response_text[:300])
         # 使用兜底字典
         llm_output = create_fallback_dict("状态评估")
 
@@ -3,15 +3,111 @@
 专门处理国内模型（如GLM）的JSON输出不稳定问题，提供多层兜底机制
 """
 
+import copy
+import functools
+import importlib.util
 import json
 import re
-from typing import Dict, Any, Optional, Union
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Union
 import logging
 
+import orjson
+
+if TYPE_CHECKING:
+    from states import EmotionalState
+
 logger = logging.getLogger(__name__)
 
+# 合法 JSON 文档（对象/数组）的首字符，str 与 bytes 两种形式
+_JSON_START_CHARS = frozenset(('{', '[', b'{', b'['))
+
+# 预编译的正则：解析失败的兜底路径会反复用到，避免每次调用都查找/编译
+_RE_MD_JSON = re.compile(r'^```json\s*', re.MULTILINE)
+_RE_MD_BARE = re.compile(r'^```\s*', re.MULTILINE)
+_RE_MD_TAIL = re.compile(r'\s*```$', re.MULTILINE)
+_RE_PREFIX = re.compile(r'^.*?(?=\{)', re.DOTALL)
+_RE_AFTER_BRACE = re.compile(r'\}\s*[^\s]')
+_RE_BRACES = re.compile(r'[{}]')
+_RE_JSON_TOKENS = re.compile(r'[{}"\\]')
+# _scan_and_repair 关心的记号：双/单引号字符串（允许未闭合）、括号、逗号、Python 字面量、未加引号的键
+_RE_SCAN_TOKEN = re.compile(
+    r'"(?:[^"\\]|\\.)*"?'
+    r"|'(?:[^'\\]|\\.)*'?"
+    r'|[{}\[\],]'
+    r'|\b(?:True|False|None)\b'
+    r'|[^\W\d]\w*(?=\s*:)',
+    re.DOTALL,
+)
+_JSON_LITERAL_FIXES = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+_JSON_OBJECT_PATTERNS = (
+    re.compile(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', re.DOTALL),  # 简单嵌套
+    re.compile(r'\{.*?\}', re.DOTALL),  # 最简单的匹配
+)
+
+_JSON_FIXES = tuple((re.compile(pattern), replacement) for pattern, replacement in (
+    # 修复单引号
+    (r"'([^']*)':", r'"\1":'),
+    # 修复尾随逗号
+    (r',\s*}', '}'),
+    (r',\s*]', ']'),
+    # 修复未引用的键
+    (r'(\w+):', r'"\1":'),
+    # 修复True/False/None
+    (r'\bTrue\b', 'true'),
+    (r'\bFalse\b', 'false'),
+    (r'\bNone\b', 'null'),
+))
+
+# 状态评估兜底：(情感字段, 候选正则)
+_EMOTION_FIELD_PATTERNS = tuple((field, tuple(re.compile(p, re.IGNORECASE) for p in patterns)) for field, patterns in (
+    ("trust_level", (r'信任.*?(\d+\.?\d*)', r'trust.*?(\d+\.?\d*)', r'"trust_level".*?(\d+\.?\d*)')),
+    ("comfort_level", (r'舒适.*?(\d+\.?\d*)', r'comfort.*?(\d+\.?\d*)', r'"comfort_level".*?(\d+\.?\d*)')),
+    ("familiarity_level", (r'熟悉.*?(\d+\.?\d*)', r'familiar.*?(\d+\.?\d*)', r'"familiarity_level".*?(\d+\.?\d*)')),
+))
+_CUSTOMER_INTENT_LEVEL_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'意向.*?(high|medium|low|fake_high)',
+    r'intent.*?(high|medium|low|fake_high)',
+    r'"customer_intent_level".*?"(high|medium|low|fake_high)"',
+))
+
+# 意图分析兜底：按顺序匹配的意图类型
+_INTENT_TYPE_PATTERNS = tuple((intent, re.compile(intent, re.IGNORECASE)) for intent in (
+    'appointment_request', 'time_confirmation', 'price_inquiry',
+    'concern_raised', 'general_chat', 'ready_to_book',
+    'info_providing', 'info_seeking',
+))
+
+# EmotionalState 的字段顺序（与 states.EmotionalState 定义一致）
+_EMOTIONAL_STATE_FIELDS = ('security_level', 'familiarity_level', 'comfort_level',
+                           'intimacy_level', 'gain_level', 'recognition_level', 'trust_level')
+
+# 各场景的兜底字典模板（只读），由 create_fallback_dict 复制后返回
+_FALLBACK_TEMPLATES = {
+    # 返回字典格式的EmotionalState数据，而不是实例
+    "state": MappingProxyType({
+        "emotional_state": MappingProxyType(dict.fromkeys(_EMOTIONAL_STATE_FIELDS, 0.0)),
+        "customer_intent_level": "low",
+        "customer_info": MappingProxyType({}),
+    }),
+    "intent": MappingProxyType({
+        "customer_intent": None,
+    }),
+    "invitation": MappingProxyType({
+        "invitation_status": 0,
+        "invitation_time": None,
+        "invitation_project": None,
+    }),
+}
+
+# 邀约兜底：同意 / 拒绝 / 推迟
+_RE_INVITATION_ACCEPT = re.compile(r'同意|确认|好的|可以')
+_RE_INVITATION_REJECT = re.compile(r'拒绝|不行|不可以|取消')
+_RE_INVITATION_DELAY = re.compile(r'推迟|延期|改时间')
+
 def robust_json_parse(
-    response_text: str, 
+    response_text: Union[str, bytes], 
     context: str = "未知", 
     fallback_dict: Optional[Dict[str, Any]] = None,
     debug: bool = True,
@@ -21,7 +117,7 @@ def robust_json_parse(
    JSON解析函数，专门处理国内模型的输出格式问题
     
     Args:
-        response_text: 模型的原始响应文本
+        response_text: 模型的原始响应文本（str，或 HTTP 层直接拿到的 bytes）
         context: 上下文描述，用于调试
         fallback_dict: 解析失败时的兜底字典
         debug: 是否输出调试信息
@@ -31,38 +127,69 @@ def robust_json_parse(
     """
     if fallback_dict is None:
         fallback_dict = {}
+    # 调试日志只在 DEBUG 级别启用时输出，格式化参数惰性求值
+    debug = debug and logger.isEnabledFor(logging.DEBUG)
         
-    if not response_text or response_text.strip() == "":
+    # 只做一次 strip，后续各步骤复用
+    stripped = response_text.strip() if response_text else response_text
+    if not stripped:
         if debug:
-            print(f"[JSON解析-{context}] 空响应，使用兜底字典")
+            logger.debug("[JSON解析-%s] 空响应，使用兜底字典", context)
         return fallback_dict
     
-    original_text = response_text
+    result = _parse_stages(response_text, stripped, context, debug)
+    if result is None:
+        result = fallback_dict
     
-    # 第一步：直接尝试解析
-    try:
-        result = json.loads(response_text.strip())
-        if debug:
-            print(f"[JSON解析-{context}] 直接解析成功")
-        
-        # 应用验证
-        if validate and result:
+    # 各解析步骤统一在出口处验证一次
+    if validate and result:
+        validator = _get_validator()
+        if validator is None:
+            if debug:
+                logger.debug("[JSON解析-%s] 响应验证模块未找到，跳过验证", context)
+        else:
             try:
-                from response_validator import validate_and_fix_response
-                result = validate_and_fix_response(result, context)
-                if debug:
-                    print(f"[JSON解析-{context}] 响应验证完成")
-            except ImportError:
+                result = validator(result, context)
                 if debug:
-                    print(f"[JSON解析-{context}] 响应验证模块未找到，跳过验证")
+                    logger.debug("[JSON解析-%s] 响应验证完成", context)
             except Exception as e:
                 if debug:
-                    print(f"[JSON解析-{context}] 响应验证失败: {e}")
-        
-        return result
-    except json.JSONDecodeError as e:
-        if debug:
-            print(f"[JSON解析-{context}] 直接解析失败: {e}")
+                    logger.debug("[JSON解析-%s] 响应验证失败: %s", context, e)
+    
+    return result
+
+def _parse_stages(response_text: Union[str, bytes], stripped: Union[str, bytes], context: str, debug: bool) -> Optional[Dict[str, Any]]:
+    """依次尝试各解析步骤，返回第一个成功的结果；全部失败返回 None"""
+    # 第一步：直接尝试解析（orjson 直接接受 str/bytes；orjson.JSONDecodeError 是 json.JSONDecodeError 的子类）
+    # 首字符不是 { 或 [ 时必然失败，跳过以免构造和捕获异常
+    if stripped[:1] in _JSON_START_CHARS:
+        try:
+            result = orjson.loads(stripped)
+            if debug:
+                logger.debug("[JSON解析-%s] 直接解析成功", context)
+            return result
+        except json.JSONDecodeError as e:
+            if debug:
+                logger.debug("[JSON解析-%s] 直接解析失败: %s", context, e)
+    elif debug:
+        logger.debug("[JSON解析-%s] 响应不以 { 或 [ 开头，跳过直接解析", context)
+    
+    # 以下正则兜底步骤只处理 str
+    if isinstance(response_text, (bytes, bytearray)):
+        response_text = bytes(response_text).decode("utf-8", errors="replace")
+    original_text = response_text
+    
+    # 单遍扫描：跳过对象前的说明/markdown，定位完整对象并顺带修复常见语法错误
+    repaired = _scan_and_repair(response_text)
+    if repaired:
+        try:
+            result = orjson.loads(repaired)
+            if debug:
+                logger.debug("[JSON解析-%s] 单遍扫描修复后解析成功", context)
+            return result
+        except json.JSONDecodeError as e:
+            if debug:
+                logger.debug("[JSON解析-%s] 单遍扫描修复后解析失败: %s", context, e)
     
     # 第二步：清理常见的格式问题
     cleaned_text = clean_response_text(response_text)
@@ -70,11 +197,11 @@ def robust_json_parse(
         try:
             result = json.loads(cleaned_text)
             if debug:
-                print(f"[JSON解析-{context}] 清理后解析成功")
+                logger.debug("[JSON解析-%s] 清理后解析成功", context)
             return result
         except json.JSONDecodeError as e:
             if debug:
-                print(f"[JSON解析-{context}] 清理后解析失败: {e}")
+                logger.debug("[JSON解析-%s] 清理后解析失败: %s", context, e)
     
     # 第三步：正则提取JSON部分
     json_extracted = extract_json_from_text(cleaned_text)
@@ -82,11 +209,11 @@ def robust_json_parse(
         try:
             result = json.loads(json_extracted)
             if debug:
-                print(f"[JSON解析-{context}] 正则提取后解析成功")
+                logger.debug("[JSON解析-%s] 正则提取后解析成功", context)
             return result
         except json.JSONDecodeError as e:
             if debug:
-                print(f"[JSON解析-{context}] 正则提取后解析失败: {e}")
+                logger.debug("[JSON解析-%s] 正则提取后解析失败: %s", context, e)
     
     # 第四步：尝试修复常见的JSON语法错误
     fixed_json = fix_common_json_errors(json_extracted or cleaned_text)
@@ -94,56 +221,159 @@ def robust_json_parse(
         try:
             result = json.loads(fixed_json)
             if debug:
-                print(f"[JSON解析-{context}] 语法修复后解析成功")
+                logger.debug("[JSON解析-%s] 语法修复后解析成功", context)
             return result
         except json.JSONDecodeError as e:
             if debug:
-                print(f"[JSON解析-{context}] 语法修复后解析失败: {e}")
+                logger.debug("[JSON解析-%s] 语法修复后解析失败: %s", context, e)
     
     # 第五步：尝试从文本中提取关键信息（针对特定场景）
     extracted_info = extract_info_from_text(original_text, context)
     if extracted_info:
         if debug:
-            print(f"[JSON解析-{context}] 文本信息提取成功: {extracted_info}")
+            logger.debug("[JSON解析-%s] 文本信息提取成功: %s", context, extracted_info)
         return extracted_info
     
-    # 最终兜底
-    if debug:
-        print(f"[JSON解析-{context}] 所有解析方法失败，使用兜底字典")
-        print(f"[JSON解析-{context}] 原始响应: {original_text[:200]}...")
-    
-    result = fallback_dict
-    
-    # 如果启用验证，对结果进行验证和修复
-    if validate and result:
-        try:
-            from response_validator import validate_and_fix_response
-            result = validate_and_fix_response(result, context)
-            if debug:
-                print(f"[JSON解析-{context}] 响应验证完成")
-        except ImportError:
-            if debug:
-                print(f"[JSON解析-{context}] 响应验证模块未找到，跳过验证")
-        except Exception as e:
-            if debug:
-                print(f"[JSON解析-{context}] 响应验证失败: {e}")
-        
-    return result
+    # 最终兜底：属于异常情况，不受 debug 开关控制
+    logger.warning("[JSON解析-%s] 所有解析方法失败，使用兜底字典，原始响应: %s...", context, original_text[:200])
+    return None
+
+_VALIDATOR: Optional[Callable[[Dict[str, Any], str], Dict[str, Any]]] = None
+_VALIDATOR_RESOLVED = False
+
+def _get_validator() -> Optional[Callable[[Dict[str, Any], str], Dict[str, Any]]]:
+    """按需导入 response_validator.validate_and_fix_response，查找结果（包括不存在）在进程内只做一次"""
+    global _VALIDATOR, _VALIDATOR_RESOLVED
+    if not _VALIDATOR_RESOLVED:
+        if importlib.util.find_spec("response_validator") is not None:
+            try:
+                from response_validator import validate_and_fix_response
+                _VALIDATOR = validate_and_fix_response
+            except ImportError as e:
+                logger.warning(f"响应验证模块导入失败，跳过验证: {e}")
+        _VALIDATOR_RESOLVED = True
+    return _VALIDATOR
+
+def _scan_and_repair(text: str) -> Optional[str]:
+    """
+    从第一个 { 开始单遍扫描到与之匹配的 }，边扫描边修复：
+    单引号字符串改为双引号、去掉 } / ] 前的尾随逗号、给未加引号的键补引号、
+    True/False/None 改为 true/false/null。双引号字符串原样保留。
+
+    Returns:
+        修复后的 JSON 文本；文本中没有 { 时返回 None。对象未闭合时返回已扫描的部分。
+    """
+    start_idx = text.find('{')
+    if start_idx == -1:
+        return None
+
+    parts: List[str] = []
+    depth = 0
+    pending_comma = False
+    pos = start_idx
+    for match in _RE_SCAN_TOKEN.finditer(text, start_idx):
+        gap = text[pos:match.start()]
+        token = match.group()
+        pos = match.end()
+        first = token[0]
+
+        if first == ',':
+            if pending_comma:
+                parts.append(',')
+            parts.append(gap)
+            pending_comma = True
+            continue
+        if pending_comma:
+            # 逗号后只有空白就遇到闭合括号：尾随逗号，丢弃
+            if not (first in '}]' and not gap.strip()):
+                parts.append(',')
+            pending_comma = False
+        parts.append(gap)
+
+        if first == '"':
+            parts.append(token)
+        elif first == "'":
+            inner = token[1:-1] if len(token) > 1 and token.endswith("'") else token[1:]
+            parts.append('"' + inner.replace("\\'", "'").replace('"', '\\"') + '"')
+        elif first in '{[':
+            depth += 1
+            parts.append(token)
+        elif first in '}]':
+            depth -= 1
+            parts.append(token)
+            if depth == 0:
+                break
+        elif token in _JSON_LITERAL_FIXES:
+            parts.append(_JSON_LITERAL_FIXES[token])
+        else:
+            # 未加引号的键
+            parts.append(f'"{token}"')
+    return "".join(parts)
+
+class JsonObjectTracker:
+    """
+    增量跟踪流式文本中第一个顶层 JSON 对象是否已经闭合（忽略字符串内的括号与转义）。
+
+    用于流式调用模型时，在对象完整后立即停止读取，不必等待其后的多余输出。
+    """
+    __slots__ = ("depth", "in_string", "escape_pending", "consumed", "end")
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.in_string = False
+        self.escape_pending = False
+        self.consumed = 0
+        self.end: Optional[int] = None  # 对象结束位置（在已输入全文中的下标，不含）
+
+    def feed(self, chunk: str) -> bool:
+        """输入下一段文本，返回对象是否已经闭合"""
+        if self.end is not None:
+            return True
+        skip_until = 0
+        if self.escape_pending and chunk:
+            # 上一段以反斜杠结尾，本段首字符被转义
+            self.escape_pending = False
+            skip_until = 1
+        for match in _RE_JSON_TOKENS.finditer(chunk):
+            i = match.start()
+            if i < skip_until:
+                continue
+            char = match.group()
+            if self.in_string:
+                if char == '\\':
+                    if i + 1 < len(chunk):
+                        skip_until = i + 2
+                    else:
+                        self.escape_pending = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '{':
+                self.depth += 1
+            elif self.depth:
+                if char == '"':
+                    self.in_string = True
+                elif char == '}':
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self.end = self.consumed + i + 1
+                        return True
+        self.consumed += len(chunk)
+        return False
 
 def clean_response_text(text: str) -> str:
     """清理响应文本中的常见格式问题"""
     # 移除markdown代码块标记
-    text = re.sub(r'^```json\s*', '', text, flags=re.MULTILINE)
-    text = re.sub(r'^```\s*', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\s*```$', '', text, flags=re.MULTILINE)
+    text = _RE_MD_JSON.sub('', text)
+    text = _RE_MD_BARE.sub('', text)
+    text = _RE_MD_TAIL.sub('', text)
     
     # 移除可能的前缀说明文字 - 只有当文本不是以{开头时才处理
     if not text.lstrip().startswith('{'):
-        text = re.sub(r'^.*?(?=\{)', '', text, flags=re.DOTALL)
+        text = _RE_PREFIX.sub('', text)
     
     # 移除可能的后缀说明文字（但要保持JSON的完整性）
     # 只有当最后一个}后面还有非空白字符时才进行清理
-    if re.search(r'\}\s*[^\s]', text):
+    if _RE_AFTER_BRACE.search(text):
         # 使用更安全的方式：找到最后一个}的位置
         last_brace_pos = text.rfind('}')
         if last_brace_pos != -1:
@@ -165,14 +395,9 @@ def extract_json_from_text(text: str) -> Optional[str]:
         return bracket_result
     
     # 如果手动解析失败，尝试正则表达式
-    patterns = [
-        r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}',  # 简单嵌套
-        r'\{.*?\}',  # 最简单的匹配
-    ]
-    
-    for pattern in patterns:
+    for pattern in _JSON_OBJECT_PATTERNS:
         try:
-            matches = re.findall(pattern, text, re.DOTALL)
+            matches = pattern.findall(text)
             if matches:
                 # 返回最长的匹配
                 return max(matches, key=len)
@@ -187,14 +412,15 @@ def extract_json_by_brackets(text: str) -> Optional[str]:
     if start_idx == -1:
         return None
     
+    # 只在括号位置之间跳转，由正则引擎在 C 层扫描其余字符
     bracket_count = 0
-    for i, char in enumerate(text[start_idx:], start_idx):
-        if char == '{':
+    for match in _RE_BRACES.finditer(text, start_idx):
+        if match.group() == '{':
             bracket_count += 1
-        elif char == '}':
+        else:
             bracket_count -= 1
             if bracket_count == 0:
-                return text[start_idx:i+1]
+                return text[start_idx:match.end()]
     
     return None
 
@@ -203,38 +429,42 @@ def fix_common_json_errors(text: str) -> Optional[str]:
     if not text:
         return None
     
-    # 修复常见问题
-    fixes = [
-        # 修复单引号
-        (r"'([^']*)':", r'"\1":'),
-        # 修复尾随逗号
-        (r',\s*}', '}'),
-        (r',\s*]', ']'),
-        # 修复未引用的键
-        (r'(\w+):', r'"\1":'),
-        # 修复True/False/None
-        (r'\bTrue\b', 'true'),
-        (r'\bFalse\b', 'false'),
-        (r'\bNone\b', 'null'),
-    ]
-    
     fixed_text = text
-    for pattern, replacement in fixes:
+    for pattern, replacement in _JSON_FIXES:
         try:
-            fixed_text = re.sub(pattern, replacement, fixed_text)
+            fixed_text = pattern.sub(replacement, fixed_text)
         except Exception:
             continue
     
     return fixed_text if fixed_text != text else None
 
 def extract_info_from_text(text: str, context: str) -> Optional[Dict[str, Any]]:
-    """从文本中提取关键信息（针对特定场景的兜底策略）"""
-    result = {}
+    """从文本中提取关键信息（针对特定场景的兜底策略）
+
+    同一段异常响应常被反复重试，提取结果按 (文本, 场景) 缓存；返回副本，调用方可随意修改。
+    """
+    result = _extract_info_cached(text, _context_bucket(context))
+    return copy.deepcopy(result) if result else None
+
+def _context_bucket(context: str) -> str:
+    """把上下文描述归到兜底提取的场景：state / intent / invitation / other"""
+    lowered = context.lower()
+    if "状态评估" in context or "emotion" in lowered:
+        return "state"
+    if "意图分析" in context or "intent" in lowered:
+        return "intent"
+    if "邀约" in context or "invitation" in lowered:
+        return "invitation"
+    return "other"
+
+@functools.lru_cache(maxsize=256)
+def _extract_info_cached(text: str, bucket: str) -> Optional[Dict[str, Any]]:
+    result: Dict[str, Any] = {}
     
-    # 根据不同上下文提取不同信息
-    if "状态评估" in context or "emotion" in context.lower():
+    # 根据不同场景提取不同信息
+    if bucket == "state":
         # 尝试从文本中提取各种情感指标
-        emotional_state = {
+        emotional_state: Dict[str, float] = {
             "security_level": 0.0,
             "familiarity_level": 0.0,
             "comfort_level": 0.0,
@@ -244,61 +474,22 @@ def extract_info_from_text(text: str, context: str) -> Optional[Dict[str, Any]]:
             "trust_level": 0.0
         }
         
-        # 提取信任度
-        trust_patterns = [
-            r'信任.*?(\d+\.?\d*)',
-            r'trust.*?(\d+\.?\d*)',
-            r'"trust_level".*?(\d+\.?\d*)'
-        ]
-        for pattern in trust_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                trust_value = float(match.group(1))
-                if trust_value > 1:
-                    trust_value = trust_value / 100
-                emotional_state["trust_level"] = min(max(trust_value, 0.0), 1.0)
-                break
-        
-        # 提取舒适度
-        comfort_patterns = [
-            r'舒适.*?(\d+\.?\d*)',
-            r'comfort.*?(\d+\.?\d*)',
-            r'"comfort_level".*?(\d+\.?\d*)'
-        ]
-        for pattern in comfort_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                comfort_value = float(match.group(1))
-                if comfort_value > 1:
-                    comfort_value = comfort_value / 100
-                emotional_state["comfort_level"] = min(max(comfort_value, 0.0), 1.0)
-                break
-        
-        # 提取熟悉度
-        familiarity_patterns = [
-            r'熟悉.*?(\d+\.?\d*)',
-            r'familiar.*?(\d+\.?\d*)',
-            r'"familiarity_level".*?(\d+\.?\d*)'
-        ]
-        for pattern in familiarity_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                familiarity_value = float(match.group(1))
-                if familiarity_value > 1:
-                    familiarity_value = familiarity_value / 100
-                emotional_state["familiarity_level"] = min(max(familiarity_value, 0.0), 1.0)
-                break
+        # 依次提取信任度、舒适度、熟悉度
+        for field, patterns in _EMOTION_FIELD_PATTERNS:
+            for pattern in patterns:
+                match = pattern.search(text)
+                if match:
+                    value = float(match.group(1))
+                    if value > 1:
+                        value = value / 100
+                    emotional_state[field] = min(max(value, 0.0), 1.0)
+                    break
         
         result["emotional_state"] = emotional_state
         
         # 提取客户意向等级
-        intent_patterns = [
-            r'意向.*?(high|medium|low|fake_high)',
-            r'intent.*?(high|medium|low|fake_high)',
-            r'"customer_intent_level".*?"(high|medium|low|fake_high)"'
-        ]
-        for pattern in intent_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _CUSTOMER_INTENT_LEVEL_PATTERNS:
+            match = pattern.search(text)
             if match:
                 result["customer_intent_level"] = match.group(1).lower()
                 break
@@ -309,26 +500,21 @@ def extract_info_from_text(text: str, context: str) -> Optional[Dict[str, Any]]:
         # 提取客户信息
         result["customer_info"] = {}
     
-    elif "意图分析" in context or "intent" in context.lower():
+    elif bucket == "intent":
         # 意图分析相关信息提取
-        intent_patterns = [
-            r'appointment_request', r'time_confirmation', r'price_inquiry',
-            r'concern_raised', r'general_chat', r'ready_to_book',
-            r'info_providing', r'info_seeking'
-        ]
-        for pattern in intent_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                result["intent_type"] = pattern
+        for intent_type, pattern in _INTENT_TYPE_PATTERNS:
+            if pattern.search(text):
+                result["intent_type"] = intent_type
                 result["confidence"] = 0.7  # 默认置信度
                 break
     
-    elif "邀约" in context or "invitation" in context.lower():
+    elif bucket == "invitation":
         # 邀约状态相关信息提取
-        if re.search(r'同意|确认|好的|可以', text):
+        if _RE_INVITATION_ACCEPT.search(text):
             result["invitation_status"] = 1
-        elif re.search(r'拒绝|不行|不可以|取消', text):
+        elif _RE_INVITATION_REJECT.search(text):
             result["invitation_status"] = 0
-        elif re.search(r'推迟|延期|改时间', text):
+        elif _RE_INVITATION_DELAY.search(text):
             result["invitation_status"] = 2
         else:
             result["invitation_status"] = 0
@@ -339,40 +525,20 @@ def extract_info_from_text(text: str, context: str) -> Optional[Dict[str, Any]]:
     return result if result else None
 
 def create_fallback_dict(context: str) -> Dict[str, Any]:
-    """根据上下文创建合适的兜底字典"""
-    if "状态评估" in context or "emotion" in context.lower():
-        # 返回字典格式的EmotionalState数据，而不是实例
-        return {
-            "emotional_state": {
-                "security_level": 0.0,
-                "familiarity_level": 0.0,
-                "comfort_level": 0.0,
-                "intimacy_level": 0.0,
-                "gain_level": 0.0,
-                "recognition_level": 0.0,
-                "trust_level": 0.0
-            },
-            "customer_intent_level": "low",
-            "customer_info": {}
-        }
-    elif "意图分析" in context or "intent" in context.lower():
-        return {
-            "customer_intent": None
-        }
-    elif "邀约" in context or "invitation" in context.lower():
-        return {
-            "invitation_status": 0,
-            "invitation_time": None,
-            "invitation_project": None
-        }
-    else:
+    """根据上下文创建合适的兜底字典
+
+    模板在模块加载时构建为只读映射；这里返回可修改的新副本，因为结果会写入图状态并被调用方修改。
+    """
+    template = _FALLBACK_TEMPLATES.get(_context_bucket(context))
+    if template is None:
         return {}
+    return {key: dict(value) if isinstance(value, MappingProxyType) else value for key, value in template.items()}
 
 # 装饰器函数，用于包装需要JSON解析的函数
-def json_parse_wrapper(context: str, debug: bool = True):
+def json_parse_wrapper(context: str, debug: bool = True) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
     """装饰器，为函数添加鲁棒的JSON解析功能"""
-    def decorator(func):
-        def wrapper(*args, **kwargs):
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
             try:
                 return func(*args, **kwargs)
             except (json.JSONDecodeError, ValueError) as e:
@@ -386,7 +552,14 @@ def json_parse_wrapper(context: str, debug: bool = True):
         return wrapper
     return decorator
 
-def safe_create_emotional_state(data: Any):
+def _to_unit_float(value: Any) -> float:
+    """转为 [0, 1] 内的浮点数；缺失或无法转换时为 0.0（正常路径不做类型判断）"""
+    try:
+        return min(max(float(value), 0.0), 1.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def safe_create_emotional_state(data: Any) -> "EmotionalState":
     """安全地创建EmotionalState实例"""
     from states import EmotionalState
     
@@ -394,22 +567,11 @@ def safe_create_emotional_state(data: Any):
         return data
     elif isinstance(data, dict):
         try:
-            # 确保所有必需的字段都存在，并且是正确的类型
-            safe_data = {}
-            fields = ['security_level', 'familiarity_level', 'comfort_level', 
-                     'intimacy_level', 'gain_level', 'recognition_level', 'trust_level']
-            
-            for field in fields:
-                value = data.get(field, 0.0)
-                if isinstance(value, (int, float)):
-                    safe_data[field] = float(value)
-                else:
-                    safe_data[field] = 0.0
-            
-            return EmotionalState(**safe_data)
+            # 确保所有必需的字段都存在，并且是 [0, 1] 内的浮点数；按字段顺序直接位置构造
+            return EmotionalState(*map(_to_unit_float, map(data.get, _EMOTIONAL_STATE_FIELDS)))
         except Exception as e:
             print(f"[安全创建情感状态] 使用字典创建失败: {e}")
             return EmotionalState()
     else:
         print(f"[安全创建情感状态] 不支持的数据类型: {type(data)}")
-        return EmotionalState()
\ No newline at end of file
+        return EmotionalState()
@@ -1,9 +1,47 @@
+import asyncio
 import os
+import threading
+import weakref
 from typing import Dict, Any, Optional
 from langchain_openai import ChatOpenAI
 from pydantic import SecretStr, Field
 from langchain_core.utils.utils import secret_from_env
 
+# 每个提供商一个并发闸门：同一进程内对同一网关的在途请求数受限，超出的请求排队而不是触发 429。
+# asyncio 信号量只能在创建它的事件循环中使用，因此按事件循环各建一份
+_LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+_LLM_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+# 模型实例池：同样参数的 create_llm 调用复用同一实例及其 HTTP 连接池（keep-alive、TLS 会话）
+_LLM_POOL: Dict[tuple, ChatOpenAI] = {}
+_LLM_POOL_LOCK = threading.Lock()
+
+
+def llm_semaphore(model_provider: str) -> asyncio.Semaphore:
+    """
+    获取指定提供商共享的并发信号量。
+
+    用法：``async with llm_semaphore(provider): await llm.ainvoke(...)``
+    """
+    semaphores = _LLM_SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    semaphore = semaphores.get(model_provider)
+    if semaphore is None:
+        semaphore = semaphores[model_provider] = asyncio.Semaphore(_LLM_MAX_CONCURRENCY)
+    return semaphore
+
+
+def cached_text_block(text: str) -> Dict[str, Any]:
+    """
+    构造带 cache_control 断点的文本内容块。
+
+    OpenRouter 会把该标记透传给支持显式提示缓存的模型（Anthropic、Gemini 等），
+    断点之前的内容在后续请求中按缓存价计费；OpenAI 系列则依赖相同前缀自动缓存。
+    只应用于逐字节不变的静态前缀。
+    """
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
 class ChatOpenRouter(ChatOpenAI):
     """
     一个专门用于连接 OpenRouter 的 LangChain ChatOpenAI 子类。
@@ -83,6 +121,23 @@ def create_llm(model_provider: str, model_name: str, **kwargs: Any) -> ChatOpenA
     except Exception:
         preferred_provider = model_provider
 
+    # 相同 (提供商, 模型, 构造参数) 直接复用池中的实例；参数不可哈希时退化为每次新建
+    try:
+        pool_key = (preferred_provider, model_name, tuple(sorted(kwargs.items())))
+        hash(pool_key)
+    except TypeError:
+        return _build_llm(preferred_provider, model_provider, model_name, **kwargs)
+
+    llm = _LLM_POOL.get(pool_key)
+    if llm is None:
+        with _LLM_POOL_LOCK:
+            llm = _LLM_POOL.get(pool_key)
+            if llm is None:
+                llm = _LLM_POOL[pool_key] = _build_llm(preferred_provider, model_provider, model_name, **kwargs)
+    return llm
+
+
+def _build_llm(preferred_provider: str, model_provider: str, model_name: str, **kwargs: Any) -> ChatOpenAI:
     # 统一路由到 OpenRouter：即使传入 "openai"，也走 OpenRouter 网关
     if preferred_provider in ("openrouter", "openai"):
         # 规范化模型名：对于 OpenAI 家族模型在 OpenRouter 需加 "openai/" 前缀
@@ -115,4 +170,13 @@ def create_llm(model_provider: str, model_name: str, **kwargs: Any) -> ChatOpenA
             pass
         return ChatAiHubMix(model=model_name, **kwargs)
     else:
-        raise ValueError(f"不支持的模型提供商: '{model_provider}'. 请选择 'openai'、'openrouter' 或 'aihubmix'。")
\ No newline at end of file
+        raise ValueError(f"不支持的模型提供商: '{model_provider}'. 请选择 'openai'、'openrouter' 或 'aihubmix'。")
+
+
+def get_llm(model_provider: str, model_name: str, temperature: float) -> ChatOpenAI:
+    """
+    按 (provider, model, temperature) 获取共享的模型实例。
+
+    温度统一转为 float，使 1 与 1.0、"0.5" 与 0.5 这类不同写法命中同一个池化实例。
+    """
+    return create_llm(model_provider=model_provider, model_name=model_name, temperature=float(temperature))
@@ -0,0 +1,166 @@
+"""
+LLM 响应缓存
+
+按请求内容（提供商、模型、温度、响应格式、提示词）的 blake2b 摘要缓存模型返回的文本，
+相同请求在有效期内直接复用结果（回放、调试、重试场景），不再调用提供商。
+后端为本地 SQLite（WAL 模式），进程重启后仍然有效；缓存不可用时自动退化为直接调用。
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Awaitable, Callable, Dict, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# 缓存文件位置与有效期（秒），可通过环境变量覆盖
+_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_cache.sqlite3"))
+_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", "3600"))
+# 每写入这么多条清理一次过期记录（打开连接时也清理一次），避免缓存文件无限增长
+_PURGE_EVERY = int(os.environ.get("LLM_CACHE_PURGE_EVERY", "256"))
+
+_conn: Optional[sqlite3.Connection] = None
+_conn_lock = threading.Lock()
+_disabled = False
+_writes_since_purge = 0
+
+# 正在进行中的请求：多个会话同时发出相同请求时共用同一次提供商调用。
+# 任务只能在所属事件循环中等待，因此按事件循环各建一张表
+_INFLIGHT: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[bytes, asyncio.Task[str]]]" = weakref.WeakKeyDictionary()
+
+# 当前上下文是否绕过缓存（见 bypass）；不作为工具参数暴露，避免出现在工具 schema 中
+_BYPASS: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+def make_key(model_provider: str, model_name: str, temperature: float, response_format: Optional[dict], prompt: str) -> bytes:
+    """由请求内容计算缓存键"""
+    payload = orjson.dumps([model_provider, model_name, temperature, response_format, prompt], option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def _get_conn() -> Optional[sqlite3.Connection]:
+    global _conn, _disabled
+    if _conn is not None or _disabled:
+        return _conn
+    with _conn_lock:
+        if _conn is None and not _disabled:
+            try:
+                os.makedirs(os.path.dirname(_CACHE_PATH), exist_ok=True)
+                conn = sqlite3.connect(_CACHE_PATH, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache (key BLOB PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                _purge_expired(conn)
+                _conn = conn
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("[LLM缓存] 无法打开缓存文件 %s，已禁用缓存: %s", _CACHE_PATH, e)
+                _disabled = True
+    return _conn
+
+
+def _purge_expired(conn: sqlite3.Connection) -> None:
+    # 调用方需持有 _conn_lock（或连接尚未发布）
+    conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - _CACHE_TTL,))
+
+
+def get(key: bytes) -> Optional[str]:
+    """读取未过期的缓存内容，未命中返回 None"""
+    conn = _get_conn()
+    if conn is None:
+        return None
+    try:
+        with _conn_lock:
+            row = conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND created_at >= ?",
+                (key, time.time() - _CACHE_TTL),
+            ).fetchone()
+    except sqlite3.Error as e:
+        logger.warning("[LLM缓存] 读取失败: %s", e)
+        return None
+    return row[0] if row else None
+
+
+def put(key: bytes, value: str) -> None:
+    """写入缓存内容，失败时只记录不抛出；每写入 _PURGE_EVERY 条顺带清理过期记录"""
+    global _writes_since_purge
+    conn = _get_conn()
+    if conn is None:
+        return
+    try:
+        with _conn_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            _writes_since_purge += 1
+            if _writes_since_purge >= _PURGE_EVERY:
+                _writes_since_purge = 0
+                _purge_expired(conn)
+    except sqlite3.Error as e:
+        logger.warning("[LLM缓存] 写入失败: %s", e)
+
+
+async def aget(key: bytes) -> Optional[str]:
+    """get 的异步版本：SQLite 读取在线程池中执行，不阻塞事件循环"""
+    return await asyncio.to_thread(get, key)
+
+
+async def aput(key: bytes, value: str) -> None:
+    """put 的异步版本：SQLite 写入在线程池中执行，不阻塞事件循环"""
+    await asyncio.to_thread(put, key, value)
+
+
+@contextlib.contextmanager
+def bypass():
+    """
+    在该上下文内（含其中创建的任务）跳过缓存读取与在途请求合并，强制调用模型，结果仍会写入。
+
+    用于集成测试：with llm_cache.bypass(): await evaluate_state.ainvoke(...)
+    """
+    token = _BYPASS.set(True)
+    try:
+        yield
+    finally:
+        _BYPASS.reset(token)
+
+
+async def get_or_call(key: bytes, call: Callable[[], Awaitable[str]], bypass_cache: bool = False) -> str:
+    """
+    命中缓存则直接返回，否则执行 call 并缓存其结果。
+    相同 key 的请求正在进行时直接等待其结果，不重复调用提供商。
+
+    Args:
+        key: make_key 计算的缓存键
+        call: 实际调用模型并返回响应文本的协程函数
+        bypass_cache: 为 True 时（或处于 bypass() 上下文中）跳过读取缓存并直接调用（结果仍会写入）
+    """
+    if bypass_cache or _BYPASS.get():
+        return await _call_and_put(key, call)
+    cached = await aget(key)
+    if cached is not None:
+        return cached
+    inflight = _INFLIGHT.setdefault(asyncio.get_running_loop(), {})
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_call_and_put(key, call))
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _call_and_put(key: bytes, call: Callable[[], Awaitable[str]]) -> str:
+    value = await call()
+    if isinstance(value, str) and value:
+        await aput(key, value)
+    return value
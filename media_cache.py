@@ -0,0 +1,85 @@
+"""
+多媒体描述缓存
+
+按 (类型, 规范化 URL) 缓存图片/语音/视频/网页的识别结果，同一素材在后续轮次或其他会话中再次出现时
+直接复用，不再调用视觉/语音/网页模型。存储复用 llm_cache 的本地 SQLite（WAL），有效期一致。
+"""
+
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import orjson
+
+import llm_cache
+
+T = TypeVar("T")
+
+
+class DegradedResult(str):
+    """
+    识别函数返回的降级结果：部分步骤失败（如个别关键帧分析失败、音频无法提取）或只有基本信息。
+
+    调用方照常当作字符串使用，但不会写入缓存，下次出现同一素材时重新识别。
+    """
+
+
+def canonical_url(url: str) -> str:
+    """规范化 URL：协议与主机名小写、去掉片段、查询参数按键排序（签名等参数保留）"""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+
+def make_key(kind: str, url: str) -> bytes:
+    """由素材类型与规范化 URL 计算缓存键"""
+    payload = orjson.dumps(["media", kind, canonical_url(url)])
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def _is_failure(result: Any) -> bool:
+    # 各识别函数的失败结果都以 "[" 开头（如 "[图片描述失败: ...]"）；降级结果显式标记为 DegradedResult
+    # （字典结果为 degraded=True）。两者都不写入缓存，下次重新识别
+    if isinstance(result, dict):
+        if result.get("degraded"):
+            return True
+        text = result.get("text", "")
+    else:
+        text = result
+    return not isinstance(text, str) or not text or isinstance(text, DegradedResult) or text.startswith("[")
+
+
+async def describe_cached(kind: str, urls: List[str], describe: Callable[[List[str]], Awaitable[List[T]]]) -> List[T]:
+    """
+    带缓存地识别一组 URL，返回结果与 urls 一一对应。
+
+    Args:
+        kind: 素材类型（image/audio/video/webpage），区分同一 URL 的不同识别方式
+        urls: 待识别的 URL 列表
+        describe: 实际识别函数，如 describe_image_urls
+    """
+    if not urls:
+        return []
+    keys = [make_key(kind, url) for url in urls]
+    # 同一 URL 在本次调用中出现多次（转发的图片、重复的语音）只查询/识别一次
+    resolved: Dict[bytes, Any] = {}
+    misses: Dict[bytes, str] = {}
+    for key, url in zip(keys, urls):
+        if key in resolved or key in misses:
+            continue
+        cached = await llm_cache.aget(key)
+        if cached is None:
+            misses[key] = url
+        else:
+            resolved[key] = orjson.loads(cached)
+
+    if misses:
+        fresh = await describe(list(misses.values()))
+        for key, value in zip(misses, fresh):
+            resolved[key] = value
+            if not _is_failure(value):
+                await llm_cache.aput(key, orjson.dumps(value).decode())
+    return [resolved.get(key) for key in keys]
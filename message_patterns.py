@@ -0,0 +1,89 @@
+"""
+消息文本的预编译正则与纯文本判断
+
+只依赖标准库，节点模块与测试都可以直接导入。
+"""
+
+import re
+
+# 用户回复场景的快速预判：只看用户自己输入的文字（不含语音转写、图片描述等识别结果），
+# 出现明确的语音请求句式且没有否定词时直接判定需要语音；否定、拒绝及其余情况都交给大模型判断。
+# 单独的"语音"一词不作为请求（转写后的语音消息都带有"[该消息是语音…]"标注），销售场景的附加词过于宽泛，也不用于直接判定
+_MEDIA_ANNOTATION_RE = re.compile(r"\[该消息是[^\]]*内容为\]: ")
+_AUDIO_REQUEST_RE = re.compile(
+    r"(?:发|回|来|用|录)(?:个|条|段|一个|一条|一段)?语音"
+    r"|语音(?:回复|回答|回我|说|讲|聊)"
+    r"|说出来|读一下|念一下|读给我听|念给我听|唱首歌|唱个歌|唱一首"
+    r"|\bvoice\s+(?:message|reply|note)\b",
+    re.IGNORECASE,
+)
+_AUDIO_NEGATION_RE = re.compile(r"不|别|没|勿|甭|莫|讨厌|\b(?:no|not|don'?t|stop)\b", re.IGNORECASE)
+
+
+def user_typed_text(content: str) -> str:
+    """消息中用户自己输入的文字：去掉 nodes._process_incoming_messages 追加的多媒体识别结果"""
+    match = _MEDIA_ANNOTATION_RE.search(content)
+    return (content[:match.start()] if match else content).strip()
+
+
+def is_explicit_audio_request(content: str) -> bool:
+    """用户输入的文字是否明确要求语音回复；含否定词或只提到"语音"时返回 False，由大模型判断"""
+    text = user_typed_text(content)
+    return bool(text) and _AUDIO_REQUEST_RE.search(text) is not None and _AUDIO_NEGATION_RE.search(text) is None
+
+
+# 多媒体 URL 识别正则：模块加载时编译一次，update_state_memory_node 每次调用直接复用
+_IMAGE_URL_PATTERN = r'https?://\S+(?:\.(?:png|jpg|jpeg|gif|webp)|/wechat/image/[^?\s]*|/image/[^?\s]*)'
+_AUDIO_URL_PATTERN = r'https?://\S+\.mp3'
+_GENERIC_URL_PATTERN = r'https?://[^\s]+'
+
+# 视频格式模式 - 支持zhuanhuan.py中的所有格式
+VIDEO_FORMATS = (
+    'wmv', 'asf', 'asx', 'rm', 'rmvb', 'mp4', 'mpeg', 'mpg', '3gp',
+    'mov', 'm4v', 'avi', 'dat', 'mkv', 'flv', 'vob', 'ogv', 'webm',
+    'ts', 'mts', 'm2ts', 'divx', 'xvid', 'swf', 'f4v', 'f4p', 'f4a', 'f4b'
+)
+# 匹配包含视频格式的完整URL，不要求格式在末尾
+_VIDEO_URL_PATTERN = r'https?://[^\s]+\.(?:' + '|'.join(VIDEO_FORMATS) + r')(?:\?[^\s]*)?'
+
+# 四类 URL 合并为一个正则，一次扫描完成识别与去除；同一位置按 图片 > 语音 > 视频 > 网页 的顺序归类。
+# 同时符合多类的 URL（如 /image/xxx.mp4）只归入优先级最高的一类，不再同时进入多个列表
+_MEDIA_URL_RE = re.compile(
+    f'(?P<image>{_IMAGE_URL_PATTERN})|(?P<audio>{_AUDIO_URL_PATTERN})'
+    f'|(?P<video>{_VIDEO_URL_PATTERN})|(?P<webpage>{_GENERIC_URL_PATTERN})',
+    re.IGNORECASE,
+)
+
+# 回复文本中的链接：图片 > 文件（URL 或以 / 开头的路径）> 普通网址，一次扫描完成归类
+_FILE_LINK_PATTERN = r'https?://\S+\.(?:pdf|docx?|xlsx?|pptx?)|/[^\s]+\.(?:pdf|docx?|xlsx?|pptx?)'
+_REPLY_LINK_RE = re.compile(
+    f'(?P<image>{_IMAGE_URL_PATTERN})|(?P<file>{_FILE_LINK_PATTERN})|(?P<url>{_GENERIC_URL_PATTERN})',
+    re.IGNORECASE,
+)
+
+
+def scan_media_urls(content: str) -> tuple[list, str]:
+    """单次扫描消息文本，返回 ([(素材类型, URL)], 去除URL后的纯文本)；素材类型为 image / audio / video / webpage"""
+    matches = []
+    text_parts = []
+    last_end = 0
+    for match in _MEDIA_URL_RE.finditer(content):
+        matches.append((match.lastgroup, match.group()))
+        text_parts.append(content[last_end:match.start()])
+        last_end = match.end()
+    text_parts.append(content[last_end:])
+    return matches, "".join(text_parts).strip()
+
+
+def extract_reply_links(text: str) -> list:
+    """提取回复文本中的图片、文件和网址，按 图片、文件、网址 的顺序返回输出条目"""
+    images, files, urls = [], [], []
+    for match in _REPLY_LINK_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "image":
+            images.append({"type": "image", "content": match.group(), "title": None})
+        elif kind == "file":
+            files.append({"type": "file", "content": match.group()})
+        else:
+            urls.append({"type": "url", "content": match.group()})
+    return images + files + urls
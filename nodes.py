@@ -1,21 +1,26 @@
 import asyncio
-import json
+import hashlib
 import logging
 import os
 import re
-import threading
 import traceback
 import uuid
+from collections import ChainMap
+from functools import lru_cache
 from datetime import datetime, timezone, timedelta
 from typing import Any, Dict, List, Optional
 
+import aiohttp
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_core.tools import tool
 from langgraph.graph import START, END, StateGraph
 from typing_extensions import TypedDict
 
 from AgentTools import generate_and_evaluate_node, self_verification_node
+from message_patterns import extract_reply_links, is_explicit_audio_request, scan_media_urls
 
 # 语音关键词配置 - 统一管理，减少重复
 AUDIO_KEYWORDS_BASE = [
@@ -28,6 +33,69 @@ AUDIO_KEYWORDS_SALES_EXTRA = [
     "宝贝", "想你了", "好的", "讲话", "语气", "嗯嗯", "下次吧",
     "呃", "额", "讲讲", "声音"
 ]
+
+# 所有语音关键词编译成一个交替正则，一次扫描文本即可判断，不再逐个关键词做子串查找
+_AUDIO_KEYWORD_RE = re.compile("|".join(map(re.escape, AUDIO_KEYWORDS_BASE + AUDIO_KEYWORDS_SALES_EXTRA)))
+
+
+def contains_audio_keyword(text: Any) -> bool:
+    """文本中是否包含任一语音关键词（基础 + 销售场景）"""
+    return isinstance(text, str) and _AUDIO_KEYWORD_RE.search(text) is not None
+
+
+# 语音回复判断的提示词模板：每轮只填入 context_messages 与 latest
+_AUDIO_JUDGE_PROMPT = """
+你是一个智能语音回复判断助手。请基于用户的多轮对话上下文，智能判断是否需要生成语音回复。
+
+分析维度：
+1. 直接语音请求：用户明确要求语音回复（如："语音"、"说出来"、"读一下"、"念一下"、"播报"、"播放语音"、"配音"等）
+2. 音频内容需求：用户要求唱歌、朗诵、配音等音频形式内容
+3. 语音技术询问：用户提到语音相关词汇（如："voice"、"tts"、"audio"、"声音"、"语气"等）
+4. 交互体验评价：用户询问或评价AI的声音、语气、说话方式
+5. 情感亲密表达：用户使用亲昵称呼或情感表达，暗示希望更亲密的语音交流
+6. 对话连续性：结合前几轮对话，判断用户是否在延续语音相关的话题
+7. 情境适配性：根据对话情境判断语音回复是否更合适（如讲故事、解释复杂概念等）
+
+用户近期对话上下文：
+{context_messages}
+
+用户的最新输入："{latest}"
+
+请综合分析多轮对话的上下文信息，判断是否需要语音回复。严格按照以下JSON格式输出，只输出JSON：
+{{
+  "need_audio_reply": true/false,
+  "reason": "基于多轮对话分析的判断理由",
+  "context_analysis": "对话上下文分析"
+}}
+"""
+
+
+# 归一化语音意图上下文时去掉的字符：标点、符号与空白（中文字符属于 \w，会保留）
+_AUDIO_INTENT_NOISE_RE = re.compile(r"[\W_]+")
+
+
+def _audio_intent_cache_key(model_provider: str, model_name: str, recent_messages: List[str]) -> bytes:
+    """
+    语音回复判断的缓存键：由模型与归一化后的近几轮用户消息计算。
+
+    "语音说一下！" 与 "语音 说一下" 这类只差标点、空白、大小写的上下文命中同一条缓存，跨会话共享。
+    """
+    normalized = [_AUDIO_INTENT_NOISE_RE.sub("", msg).lower() for msg in recent_messages]
+    payload = orjson.dumps(["audio_intent", model_provider, model_name, normalized])
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+# 语音回复判断使用的模型配置，导入时读取一次环境变量
+_MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "openai")
+_EVALUATION_MODEL = os.getenv("EVALUATION_MODEL", "gpt-4o-mini")
+
+
+@lru_cache(maxsize=4)
+def _get_audio_judge_llm(model_provider: str, model_name: str):
+    """语音回复判断使用的模型实例，按 (提供商, 模型) 缓存"""
+    from llm import create_llm
+    return create_llm(model_provider=model_provider, model_name=model_name, temperature=0.3)
+
 from Configurations import Configuration
 from outside_info_aegnt import create_outside_info_workflow
 from prompts.prompts_event import (
@@ -52,9 +120,208 @@ from utils import describe_image_urls, parse_event_decision, transcribe_audio_ur
 from utils import synthesize_tts_stepfun
 from utils import transcribe_audio_urls_with_emotion
 from utils import get_audio_duration_ms
+from utils import probe_media_urls
+from utils import get_http_session
+from utils import run_io
+from utils import submit_io
+from media_cache import describe_cached
+import llm_cache
 
 logger = logging.getLogger(__name__)
 BEIJING_TZ = timezone(timedelta(hours=8))
+
+# 上下文注入/校验工具调用 LangGraph API 的超时；请求复用 utils 中共享的 aiohttp 会话
+_CONTEXT_API_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+# 同步通知（后端回调、阿里云事件通知）共用的连接池：连接保持 keep-alive，避免每次请求重新握手
+_SYNC_HTTP = requests.Session()
+_SYNC_HTTP_ADAPTER = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0)
+_SYNC_HTTP.mount("http://", _SYNC_HTTP_ADAPTER)
+_SYNC_HTTP.mount("https://", _SYNC_HTTP_ADAPTER)
+
+# HEAD 探测返回这些状态码的视频链接视为失效，不再提交视频识别
+_DEAD_URL_STATUSES = frozenset({404, 410})
+
+# 字典消息的角色名 -> 统一的消息类型
+_DICT_ROLE_TYPES = {"human": "human", "user": "human", "ai": "ai", "assistant": "ai"}
+
+# long_term_messages 中结构化用户资料字段 -> 中文字段名（包含 report_update_time 修正）
+_PROFILE_FIELD_NAMES = {
+    "name": "姓名",
+    "sex": "性别",
+    "age": "年龄",
+    "phone": "电话",
+    "birthday": "生日",
+    "address": "住址",
+    "job": "职业",
+    "doctor": "面诊咨询师",
+    "project": "项目",
+    "is_deal": "已成交",
+    "is_deal_price": "项目价格",
+    "not_deal": "未成交",
+    "not_deal_reason": "未成交原因",
+    "intent_project": "感兴趣项目",
+    "extra_info": "补充说明信息",
+    "report_update_time": "上次到店面诊日期"
+}
+
+
+def _from_dict(msg: dict):
+    role = str(msg.get("type", "unknown")).lower()
+    return _DICT_ROLE_TYPES.get(role, "unknown"), msg.get("content", ""), msg.get("additional_kwargs") or {}, msg.get("id")
+
+
+def _from_human(msg: HumanMessage):
+    return "human", msg.content, msg.additional_kwargs, msg.id
+
+
+def _from_ai(msg: AIMessage):
+    return "ai", msg.content, msg.additional_kwargs, msg.id
+
+
+# 按消息的具体类型分派，常见的三种类型一次字典查找即可
+_MSG_EXTRACTORS = {dict: _from_dict, HumanMessage: _from_human, AIMessage: _from_ai}
+
+
+def _extract_message(msg: Any) -> tuple[str, Any, dict, Optional[str]]:
+    """
+    提取消息的 (msg_type, content, additional_kwargs, msg_id)。
+
+    msg_type 统一为 "human" / "ai" / "unknown"，兼容字典消息与各类消息对象（含子类）。
+    """
+    extractor = _MSG_EXTRACTORS.get(type(msg))
+    if extractor is not None:
+        return extractor(msg)
+    if isinstance(msg, HumanMessage):
+        return _from_human(msg)
+    if isinstance(msg, AIMessage):
+        return _from_ai(msg)
+    if isinstance(msg, dict):
+        return _from_dict(msg)
+    if hasattr(msg, "content"):
+        return "unknown", msg.content, getattr(msg, "additional_kwargs", None) or {}, getattr(msg, "id", None)
+    return "unknown", str(msg), {}, None
+
+
+@lru_cache(maxsize=4096)
+def _parse_event_time(event_time_str: str) -> datetime:
+    """解析事件/预约时间（ISO 格式，兼容末尾 Z）并转为北京时间；同一时间字符串在多次轮询中只解析一次"""
+    return datetime.fromisoformat(event_time_str.replace('Z', '+00:00')).astimezone(BEIJING_TZ)
+
+
+def _coerce_event_instance(event_instance: Any) -> EventInstance:
+    """状态中的事件实例可能是字典（检查点反序列化后）或 EventInstance；已是实例时直接返回"""
+    if isinstance(event_instance, EventInstance):
+        return event_instance
+    return EventInstance(**event_instance)
+
+
+def _usable_audio_text(text: str) -> str:
+    """语音识别文本可用时返回去除首尾空白的文本，空结果或 SenseVoice 子任务失败时返回空字符串"""
+    if text and not text.startswith("[SenseVoice子任务失败"):
+        return text.strip()
+    return ""
+
+
+# 超过该长度的消息（多为网页/HTML 转储）在线程中扫描 URL，避免长时间占用事件循环
+_THREAD_SCAN_THRESHOLD = 8000
+
+
+def _recent_human_texts(msgs: list, limit: int) -> list:
+    """从后往前取最近 limit 条非空的用户文本消息，按时间顺序返回；不遍历整个历史"""
+    recent = []
+    for m in reversed(msgs):
+        if isinstance(m, HumanMessage) and isinstance(m.content, str) and m.content.strip():
+            recent.append(m.content)
+            if len(recent) == limit:
+                break
+    recent.reverse()
+    return recent
+
+
+async def _synthesize_reply_audio(text: str, tag: str = "") -> tuple[Optional[str], Optional[int]]:
+    """合成回复语音并紧接着探测时长，返回 (音频URL, 时长毫秒)；合成失败时返回 (None, None)"""
+    try:
+        audio_url = await synthesize_tts_stepfun(text)  # 使用默认voice/format
+    except Exception:
+        logger.warning("[TTS] %s合成异常，保持文字回复", tag)
+        return None, None
+    if not audio_url:
+        logger.warning("[TTS] %s合成失败或未返回URL，保持文字回复", tag)
+        return None, None
+    logger.debug("[TTS] %s合成成功，生成音频URL: %s", tag, audio_url)
+    return audio_url, await get_audio_duration_ms(audio_url)
+
+
+@lru_cache(maxsize=256)
+def _parse_invitation_time(value: str) -> Optional[int]:
+    # 同一会话的邀请时间在多轮之间通常不变，按字符串缓存解析结果
+    try:
+        return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def _invitation_time_ms(value: Any) -> Optional[int]:
+    """邀请时间转毫秒时间戳：整数视为已是毫秒时间戳，字符串按ISO格式解析，其余情况返回None"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value:
+        return _parse_invitation_time(value)
+    return None
+
+
+def _build_custom_status_payload(state: AgentState) -> dict:
+    """输出中的自定义状态区"""
+    return {
+        "invitation_status": state.get("invitation_status", 0),
+        "invitation_time": _invitation_time_ms(state.get("invitation_time")),
+        "invitation_project": state.get("invitation_project"),
+    }
+
+
+def _build_messages_payload(state: AgentState, text_content: str, audio_url: Optional[str], duration_ms: Optional[int], tag: str = "") -> list:
+    """
+    组装输出的消息条目：文本及其中的图片/文件/网址、选中的素材、语音。
+
+    选中的素材发送后会清除 state 中的 selected_image，确保只发送一次。tag 为日志前缀，用于区分用户回复与销售主动消息。
+    """
+    items = []
+    # 文本
+    if isinstance(text_content, str) and text_content.strip():
+        items.append({"type": "text", "content": text_content})
+        # 提取内含URL/图片/文件（预编译正则，单次扫描）
+        items.extend(extract_reply_links(text_content))
+
+    # 检查是否有选中的素材需要发送
+    selected_image = state.get("selected_image")
+    if selected_image and isinstance(selected_image, dict):
+        material_id = selected_image.get("id")
+        material_name = selected_image.get("name", "")
+        material_type = selected_image.get("materialType", 2)  # 使用materialType字段
+
+        if material_id:
+            logger.debug("[MATERIAL] %s添加选中的素材到输出: %s (ID: %s, 类型: %s)", tag, material_name, material_id, material_type)
+
+            # 统一的素材格式，包含materialType字段
+            items.append({
+                "type": "material",
+                "content": material_id,
+                "title": material_name,
+                "materialType": material_type
+            })
+
+            # 素材发送后立即清除状态，确保只发送一次
+            logger.debug("[MATERIAL] %s清除selected_image状态，防止重复发送", tag)
+            state["selected_image"] = None
+            state["image_request_detected"] = False
+
+    # 音频（时长已在合成后探测）
+    if audio_url:
+        items.append({"type": "audio", "content": audio_url, "duration": duration_ms})
+    return items
+
+
 DISABLE_EVENT_SYSTEM = True  # 临时禁用事件系统开关（最小改动断开事件相关逻辑）
 def state_memory_node(state: AgentState):#示例，如何传递获取传递的参数，可以给到提示词等等
     # 仅使用运行时配置
@@ -63,151 +330,33 @@ def state_memory_node(state: AgentState):#示例，如何传递获取传递的
     agent_name = cfg.get("agent_name", "")
 
 
-async def update_state_memory_node(state: AgentState, config=None):
+async def _process_incoming_messages(msgs: list) -> tuple[list, list]:
     """
-    更新状态记忆节点 - 核心状态管理函数
-    
-    该函数负责更新代理的状态和长期对话历史，处理各种场景下的消息同步：
-    - 人工接管转AI托管的场景
-    - 用户发送新消息的场景  
-    - 主动聊天事件触发的场景
-    - 多媒体内容（图片、音频、视频）的识别和处理
-    
-    主要功能包括：
-    1. 注入assistant_id和assistant_config到状态中
-    2. 检测并处理消息中的多媒体URL（图片、音频、视频）
-    3. 异步处理多媒体内容（描述图片、转录音频、描述视频）
-    4. 更新长期记忆和当前处理的消息
-    5. 为所有消息添加时间戳信息
-    
-    Args:
-        state (AgentState): 代理状态对象，包含当前对话状态和历史消息
-        config (dict, optional): 配置信息，包含assistant_id等元数据
-        
+    处理本轮新消息：识别其中的多媒体URL并转为文字描述，补全时间戳，生成统一的消息对象。
+
     Returns:
-        AgentState: 更新后的状态对象，包含处理后的消息和多媒体内容
-        
-    Note:
-        - 该函数会异步处理多媒体内容，提高性能
-        - 支持多种消息格式（dict、HumanMessage、AIMessage等）
-        - 自动处理时区转换，使用北京时间
-        - 多媒体处理失败时会记录日志但不影响主流程
+        (processed_messages, custom_audio_text)：处理后的消息列表，以及与用户消息一一对应的语音识别文字
     """
-    print(f"[DEBUG] === update_state_memory_node 开始执行 ===")
-    print(f"[DEBUG] 输入消息数量: {len(state.get('messages', []))}")
-    print(f"[DEBUG] 长期消息数量: {len(state.get('long_term_messages', []))}")
-    
-    # 1) 注入 assistant_id 与 assistant_config 到状态，供后续节点使用
-    try:
-        assistant_id = None
-        if isinstance(config, dict):
-            # 优先从 configurable 读取（调用方可显式传入）
-            assistant_id = (
-                config.get("configurable", {}) or {}
-            ).get("assistant_id")
-            # 其次从元数据读取（LangGraph Cloud 会在 metadata 放平台 assistant_id）
-            if not assistant_id:
-                assistant_id = (
-                    config.get("metadata", {}) or {}
-                ).get("assistant_id")
-        if assistant_id:
-            state["assistant_id"] = assistant_id
-            try:
-                from agents.persona_config.multi_assistant_config_manager import (
-                    multi_assistant_config_manager,
-                )
-                assistant_cfg = (
-                    multi_assistant_config_manager.get_assistant_config(assistant_id)
-                    or {}
-                )
-                if assistant_cfg:
-                    state["assistant_config"] = assistant_cfg
-            except Exception:
-                # 忽略个别环境下的导入/读取失败，保持回退逻辑
-                pass
-    except Exception:
-        pass
-    msgs = state.get("messages") or []
-    long_term_messages = state.get("long_term_messages") or []
-
-    # 调试：打印当前状态中的long_term_messages
-    print(f"[DEBUG] 输入的long_term_messages数量: {len(long_term_messages)}")
-    for i, msg in enumerate(long_term_messages):
-        if isinstance(msg, dict):
-            msg_type = msg.get("type", "unknown")
-            raw_content = msg.get("content", "")
-            # 确保content是字符串类型再进行切片
-            if isinstance(raw_content, str):
-                content = raw_content[:100]
-            else:
-                content = str(raw_content)[:100]
-            additional_kwargs = msg.get("additional_kwargs", {})
-        elif isinstance(msg, HumanMessage) or isinstance(msg, AIMessage):
-            msg_type = "Human" if isinstance(msg, HumanMessage) else "AI"
-            # 确保content是字符串类型再进行切片
-            raw_content = msg.content
-            if isinstance(raw_content, str):
-                content = raw_content[:100]
-            else:
-                content = str(raw_content)[:100]
-            additional_kwargs = getattr(msg, 'additional_kwargs', {})
-        else:
-            msg_type = "Unknown"
-            content = str(msg)[:100]
-            additional_kwargs = {}
-
-        print(f"[DEBUG]  long_term_messages[{i}] ({msg_type}): {content}...")
-        if additional_kwargs:
-            print(f"[DEBUG]    additional_kwargs: {additional_kwargs}")
-
-    image_url_pattern = re.compile(r'https?://\S+(?:\.(?:png|jpg|jpeg|gif|webp)|/wechat/image/[^?\s]*|/image/[^?\s]*)', re.IGNORECASE)
-    audio_url_pattern = re.compile(r'https?://\S+\.mp3', re.IGNORECASE)
-    generic_url_pattern = re.compile(r'https?://[^\s]+', re.IGNORECASE)
-    
-    # 视频格式模式 - 支持zhuanhuan.py中的所有格式
-    video_formats = [
-        'wmv', 'asf', 'asx', 'rm', 'rmvb', 'mp4', 'mpeg', 'mpg', '3gp', 
-        'mov', 'm4v', 'avi', 'dat', 'mkv', 'flv', 'vob', 'ogv', 'webm', 
-        'ts', 'mts', 'm2ts', 'divx', 'xvid', 'swf', 'f4v', 'f4p', 'f4a', 'f4b'
-    ]
-    # 修复正则表达式：匹配包含视频格式的完整URL，不要求格式在末尾
-    video_pattern = re.compile(r'https?://[^\s]+\.(' + '|'.join(video_formats) + ')(?:\?[^\s]*)?', re.IGNORECASE)
-
     # 收集图片、语音、视频、网页URL及其对应位置
     image_entries = []  # (msg_idx, url)
     audio_entries = []  # (msg_idx, url)
     video_entries = []  # (msg_idx, url)
     webpage_entries = []  # (msg_idx, url)
     clean_texts = []    # 原消息的文字内容（去除URL）
+    human_indices = []  # 用户消息（type为human）的绝对索引，供语音识别结果对齐
+    unreachable_entries = []  # (msg_idx, 失效说明)，HEAD 探测确认已失效的视频链接
+    entries_by_kind = {
+        "image": image_entries, "audio": audio_entries, "video": video_entries,
+        "webpage": webpage_entries, "unreachable": unreachable_entries,
+    }
+    # 每条消息只解析一次 (类型, 内容, 附加参数, ID)，后面重建消息时直接复用
+    extracted = [_extract_message(msg) for msg in msgs]
+
+    for i, (msg_type, content, _, _) in enumerate(extracted):
+
+        if msg_type == "human":
+            human_indices.append(i)
 
-    for i, msg in enumerate(msgs):
-        # 获取消息内容和类型
-        content = ""
-        msg_type = "unknown"
-        
-        if isinstance(msg, dict):
-            content = msg.get("content", "")
-            raw_type = msg.get("type", "unknown").lower()
-            # 支持多种角色类型映射
-            if raw_type in ["human", "user"]:
-                msg_type = "human"
-            elif raw_type in ["ai", "assistant"]:
-                msg_type = "ai"
-            else:
-                msg_type = "unknown"
-        elif isinstance(msg, HumanMessage):
-            content = msg.content
-            msg_type = "human"
-        elif isinstance(msg, AIMessage):
-            content = msg.content
-            msg_type = "ai"
-        elif hasattr(msg, 'content'):
-            content = msg.content
-            msg_type = "unknown"
-        else:
-            content = str(msg)
-            msg_type = "unknown"
-        
         # 检查是否为有效消息且内容为字符串
         is_valid_message = (
             isinstance(content, str) and 
@@ -218,38 +367,31 @@ async def update_state_memory_node(state: AgentState, config=None):
             clean_texts.append(content)
             continue
 
-        # 检测图片、语音和视频URL（无论Human还是AI消息）
-        images = image_url_pattern.findall(content)
-        audios = audio_url_pattern.findall(content)
-        # 对于视频，我们需要完整的URL，而不是只匹配的格式
-        video_matches = video_pattern.finditer(content)
-        videos = [match.group(0) for match in video_matches]
-        # 通用网页链接
-        generic_urls = generic_url_pattern.findall(content)
-        # 过滤掉图片/音频/视频URL，保留纯网页URL（如公众号链接等）
-        filtered_web_urls = []
-        for u in generic_urls:
-            if image_url_pattern.search(u) or audio_url_pattern.search(u) or video_pattern.search(u):
-                continue
-            filtered_web_urls.append(u)
-        
-        # 添加详细的调试信息
-
-        for url in images:
-            image_entries.append((i, url))
-        for url in audios:
-            audio_entries.append((i, url))
-        for url in videos:
-            video_entries.append((i, url))
-        for url in filtered_web_urls:
-            webpage_entries.append((i, url))
-
-        # 移除URL，保留纯文本
-        text_without_urls = image_url_pattern.sub('', content)
-        text_without_urls = audio_url_pattern.sub('', text_without_urls)
-        text_without_urls = video_pattern.sub('', text_without_urls)
-        text_without_urls = generic_url_pattern.sub('', text_without_urls).strip()
+        # 单次扫描：检测图片、语音、视频和网页URL（无论Human还是AI消息），同时拼出去除URL后的纯文本
+        if len(content) > _THREAD_SCAN_THRESHOLD:
+            matches, text_without_urls = await asyncio.to_thread(scan_media_urls, content)
+        else:
+            matches, text_without_urls = scan_media_urls(content)
+        for kind, url in matches:
+            entries_by_kind[kind].append((i, url))
         clean_texts.append(text_without_urls)
+
+    # 视频识别代价最高：先并发 HEAD 探测，失效链接不再提交识别，
+    # 实际是图片/网页的链接（如带签名参数的跟踪链接）改按真实类型识别
+    if video_entries:
+        probes = await probe_media_urls([url for _, url in video_entries])
+        checked_videos = []
+        for msg_idx, url in video_entries:
+            status, content_type = probes.get(url, (0, ""))
+            if status in _DEAD_URL_STATUSES:
+                unreachable_entries.append((msg_idx, f"[视频链接已失效: HTTP {status}]"))
+            elif content_type.startswith("image/"):
+                image_entries.append((msg_idx, url))
+            elif content_type == "text/html":
+                webpage_entries.append((msg_idx, url))
+            else:
+                checked_videos.append((msg_idx, url))
+        video_entries[:] = checked_videos
     
     # 统一异步处理
     image_urls = [e[1] for e in image_entries]
@@ -258,94 +400,57 @@ async def update_state_memory_node(state: AgentState, config=None):
     webpage_urls = [e[1] for e in webpage_entries]
     
 
-    # 异步处理多媒体内容
+    # 异步处理多媒体内容（按 URL 缓存识别结果，历史中重复出现的素材不再重复调用模型）
+    # 四类素材互不依赖，并发识别，总耗时取决于最慢的一类
+    # 没有任何URL时不进入并发识别
+    image_task = audio_task = video_task = webpage_task = None
+    if image_urls or audio_urls or video_urls or webpage_urls:
+        async with asyncio.TaskGroup() as tg:
+            image_task = tg.create_task(describe_cached("image", image_urls, describe_image_urls)) if image_urls else None
+            audio_task = tg.create_task(describe_cached("audio", audio_urls, transcribe_audio_urls_with_emotion)) if audio_urls else None
+            video_task = tg.create_task(describe_cached("video", video_urls, describe_video_urls)) if video_urls else None
+            webpage_task = tg.create_task(describe_cached("webpage", webpage_urls, describe_webpage_urls)) if webpage_urls else None
+
+    image_descs = image_task.result() if image_task else []
     if image_urls:
-        image_descs = await describe_image_urls(image_urls)
-        print(f"[DEBUG] 图片处理完成: {len(image_descs)} 个描述")
-    else:
-        image_descs = []
-        
+        logger.debug("图片处理完成: %d 个描述", len(image_descs))
+
+    # 使用带情感的转写
+    audio_results = audio_task.result() if audio_task else []
+    # 兼容旧变量名
+    audio_texts = [r.get("text", "") for r in audio_results]
     if audio_urls:
-        # 使用带情感的转写
-        audio_results = await transcribe_audio_urls_with_emotion(audio_urls)
-        # 兼容旧变量名
-        audio_texts = [r.get("text", "") for r in audio_results]
-        print(f"[DEBUG] 音频处理完成: {len(audio_texts)} 个转录")
-    else:
-        audio_results = []
-        audio_texts = []
-
-    # 构建与用户消息数量对应的语音识别文字数组
-    custom_audio_text = []
-    human_message_count = 0
-
-    # 统计用户消息数量（type为human的消息）
-    for msg in msgs:
-        msg_type = "unknown"
-        if isinstance(msg, dict):
-            raw_type = msg.get("type", "unknown").lower()
-            if raw_type in ["human", "user"]:
-                msg_type = "human"
-        elif isinstance(msg, HumanMessage):
-            msg_type = "human"
+        logger.debug("音频处理完成: %d 个转录", len(audio_texts))
 
-        if msg_type == "human":
-            human_message_count += 1
+    video_descs = video_task.result() if video_task else []
+    if video_urls:
+        logger.debug("视频处理完成: %d 个描述", len(video_descs))
 
-    print(f"[DEBUG] 用户消息数量: {human_message_count}")
+    webpage_descs = webpage_task.result() if webpage_task else []
+    if webpage_urls:
+        logger.debug("网页处理完成: %d 个摘要", len(webpage_descs))
+
+    # 构建与用户消息数量对应的语音识别文字数组（用户消息索引已在提取URL时记录，不再重新遍历消息）
+    logger.debug("用户消息数量: %d", len(human_indices))
 
     # 为每个用户消息构建对应的语音识别结果
     # audio_entries是(msg_idx, url)的列表，包含所有检测到的音频URL及其在消息中的绝对位置
     audio_map = {msg_idx: text for (msg_idx, _), text in zip(audio_entries, audio_texts)}
 
-    print(f"[DEBUG] audio_map构建完成: {audio_map}")
+    logger.debug("audio_map构建完成: %s", audio_map)
 
-    for i, msg in enumerate(msgs):
-        msg_type = "unknown"
-        if isinstance(msg, dict):
-            raw_type = msg.get("type", "unknown").lower()
-            if raw_type in ["human", "user"]:
-                msg_type = "human"
-        elif isinstance(msg, HumanMessage):
-            msg_type = "human"
+    # 按用户消息的绝对索引一次查表：识别成功且有内容时取识别文本，识别失败或非语音消息为空字符串
+    custom_audio_text = [_usable_audio_text(audio_map.get(i, "")) for i in human_indices]
 
-        if msg_type == "human":
-            # 使用消息的绝对索引来查找语音识别结果
-            if i in audio_map:
-                audio_text = audio_map[i]
-                # 如果语音识别成功且有内容，返回识别结果；否则返回空字符串
-                if audio_text and audio_text.strip() and not audio_text.startswith("[SenseVoice子任务失败"):
-                    custom_audio_text.append(audio_text.strip())
-                    print(f"[DEBUG] 消息索引 {i} 语音识别成功: {audio_text.strip()}")
-                else:
-                    custom_audio_text.append("")
-                    print(f"[DEBUG] 消息索引 {i} 语音识别失败或无内容，返回空字符串")
-            else:
-                # 非语音消息，返回空字符串
-                custom_audio_text.append("")
-                print(f"[DEBUG] 消息索引 {i} 非语音消息，返回空字符串")
-
-    # 存储到状态中
-    state["custom_audio_text"] = custom_audio_text
-    print(f"[DEBUG] 语音识别文字数组已存储: {state['custom_audio_text']}")
-        
-    if video_urls:
-        video_descs = await describe_video_urls(video_urls)
-        print(f"[DEBUG] 视频处理完成: {len(video_descs)} 个描述")
-    else:
-        video_descs = []
-    
-    if webpage_urls:
-        webpage_descs = await describe_webpage_urls(webpage_urls)
-        print(f"[DEBUG] 网页处理完成: {len(webpage_descs)} 个摘要")
-    else:
-        webpage_descs = []
 
     # 将处理结果插回到原消息
+    # 只有检测到URL的消息需要重写内容；其余消息在下面尽量原样复用，不重新构造
     msg_map = {}  # msg_idx -> list of parts
-
-    for idx, text in enumerate(clean_texts):
-        msg_map[idx] = [text] if text else []
+    for entries in entries_by_kind.values():
+        for msg_idx, _ in entries:
+            if msg_idx not in msg_map:
+                text = clean_texts[msg_idx]
+                msg_map[msg_idx] = [text] if text else []
 
     for (msg_idx, _), desc in zip(image_entries, image_descs):
         msg_map[msg_idx].append(f"[该消息是图片，图片内容为]: {desc}")
@@ -365,106 +470,57 @@ async def update_state_memory_node(state: AgentState, config=None):
 
     for (msg_idx, _), desc in zip(video_entries, video_descs):
         msg_map[msg_idx].append(f"[该消息是视频，视频内容为]: {desc}")
+
+    for msg_idx, note in unreachable_entries:
+        msg_map[msg_idx].append(f"[该消息是视频，视频内容为]: {note}")
     
     for (msg_idx, _), desc in zip(webpage_entries, webpage_descs):
         msg_map[msg_idx].append(f"[该消息是网页链接，网页主要内容为]: {desc}")
 
     # 生成最终处理后的新消息
     processed_messages = []
-    for i, msg in enumerate(msgs):
-        # 获取消息类型
-        msg_type = "unknown"
-        if isinstance(msg, dict):
-            raw_type = msg.get("type", "unknown").lower()
-            # 支持多种角色类型映射
-            if raw_type in ["human", "user"]:
-                msg_type = "human"
-            elif raw_type in ["ai", "assistant"]:
-                msg_type = "ai"
-            else:
-                msg_type = "unknown"
-        elif isinstance(msg, HumanMessage):
-            msg_type = "human"
-        elif isinstance(msg, AIMessage):
-            msg_type = "ai"
+    # 缺少时间戳的消息统一使用本轮处理时间（北京时间），只取一次
+    now_iso = datetime.now(BEIJING_TZ).isoformat()
+    for i, (msg, (msg_type, _, existing_kwargs, msg_id)) in enumerate(zip(msgs, extracted)):
         
-        # 提取时间戳信息
-        timestamp = None
-        if isinstance(msg, dict):
-            # 从字典格式的消息中提取时间戳
-            additional_kwargs = msg.get("additional_kwargs", {})
-            timestamp = additional_kwargs.get("timestamp")
-        elif hasattr(msg, 'additional_kwargs'):
-            # 从消息对象中提取时间戳
-            timestamp = getattr(msg, 'additional_kwargs', {}).get("timestamp")
-        
-        # 如果没有时间戳，使用当前时间
-        if not timestamp:
-            from datetime import datetime, timezone, timedelta
-            timestamp = datetime.now(timezone(timedelta(hours=8))).isoformat()
+        # 提取时间戳信息，如果没有时间戳，使用当前时间
+        timestamp = existing_kwargs.get("timestamp") or now_iso
         
         if i not in msg_map:
             # 处理没有URL的消息
             if isinstance(msg, dict):
                 content = msg.get("content", "")
                 # 从消息的additional_kwargs中获取原始send_style
-                existing_kwargs = msg.get("additional_kwargs", {})
                 original_send_style = existing_kwargs.get("send_style", "text")  # 提供默认值避免KeyError
                 
                 if msg_type == "human":
                     processed_messages.append(HumanMessage(
                         content=content, 
+                        id=msg_id,
                         additional_kwargs={"timestamp": timestamp, "send_style": original_send_style}
                     ))
                 elif msg_type == "ai":
                     processed_messages.append(AIMessage(
                         content=content, 
+                        id=msg_id,
                         additional_kwargs={"timestamp": timestamp, "send_style": original_send_style}
                     ))
                 else:
                     processed_messages.append(HumanMessage(
                         content=content, 
+                        id=msg_id,
                         additional_kwargs={"timestamp": timestamp, "send_style": original_send_style}
                     ))
             else:
-                # 对于已经是消息对象的情况，保留原有时间戳或添加新时间戳
-                if hasattr(msg, 'additional_kwargs') and msg.additional_kwargs.get("timestamp"):
-                    processed_messages.append(msg)
-                else:
-                    # 创建新的消息对象，添加时间戳
-                    # 从消息的additional_kwargs中获取原始send_style
-                    existing_kwargs = getattr(msg, 'additional_kwargs', {}) or {}
-                    original_send_style = existing_kwargs.get("send_style", "text")  # 提供默认值避免KeyError
-                    
-                    if isinstance(msg, HumanMessage):
-                        processed_messages.append(HumanMessage(
-                            content=msg.content,
-                            id=getattr(msg, 'id', None),
-                            additional_kwargs={"timestamp": timestamp, "send_style": original_send_style}
-                        ))
-                    elif isinstance(msg, AIMessage):
-                        processed_messages.append(AIMessage(
-                            content=msg.content,
-                            id=getattr(msg, 'id', None),
-                            additional_kwargs={"timestamp": timestamp, "send_style": original_send_style}
-                        ))
-                    else:
-                        processed_messages.append(msg)
+                # 对于已经是消息对象的情况，保留原有时间戳或原地补上时间戳，直接复用原对象
+                if not existing_kwargs.get("timestamp") and isinstance(msg, (HumanMessage, AIMessage)):
+                    msg.additional_kwargs["timestamp"] = timestamp
+                    msg.additional_kwargs.setdefault("send_style", "text")  # 提供默认值避免KeyError
+                processed_messages.append(msg)
         else:
             # 处理有URL的消息
             full_text = "\n".join(msg_map[i])
-            # 安全地获取消息ID
-            msg_id = None
-            if hasattr(msg, "id"):
-                msg_id = msg.id
-            elif isinstance(msg, dict):
-                msg_id = msg.get("id")
-            
             # 获取原始send_style
-            if isinstance(msg, dict):
-                existing_kwargs = msg.get("additional_kwargs", {})
-            else:
-                existing_kwargs = getattr(msg, 'additional_kwargs', {}) or {}
             original_send_style = existing_kwargs.get("send_style", "text")  # 提供默认值避免KeyError
             
             # 动态设置send_style：如果消息包含音频内容，则设置为"audio"
@@ -493,97 +549,151 @@ async def update_state_memory_node(state: AgentState, config=None):
                     additional_kwargs={"timestamp": timestamp, "send_style": final_send_style}
                 ))
 
+    return processed_messages, custom_audio_text
+
+
+async def update_state_memory_node(state: AgentState, config=None):
+    """
+    更新状态记忆节点 - 核心状态管理函数
+    
+    该函数负责更新代理的状态和长期对话历史，处理各种场景下的消息同步：
+    - 人工接管转AI托管的场景
+    - 用户发送新消息的场景  
+    - 主动聊天事件触发的场景
+    - 多媒体内容（图片、音频、视频）的识别和处理
+    
+    主要功能包括：
+    1. 注入assistant_id和assistant_config到状态中
+    2. 检测并处理消息中的多媒体URL（图片、音频、视频）
+    3. 异步处理多媒体内容（描述图片、转录音频、描述视频）
+    4. 更新长期记忆和当前处理的消息
+    5. 为所有消息添加时间戳信息
+    
+    Args:
+        state (AgentState): 代理状态对象，包含当前对话状态和历史消息
+        config (dict, optional): 配置信息，包含assistant_id等元数据
+        
+    Returns:
+        AgentState: 更新后的状态对象，包含处理后的消息和多媒体内容
+        
+    Note:
+        - 该函数会异步处理多媒体内容，提高性能
+        - 支持多种消息格式（dict、HumanMessage、AIMessage等）
+        - 自动处理时区转换，使用北京时间
+        - 多媒体处理失败时会记录日志但不影响主流程
+    """
+    logger.debug("=== update_state_memory_node 开始执行 ===")
+    logger.debug("输入消息数量: %d", len(state.get('messages', [])))
+    logger.debug("长期消息数量: %d", len(state.get('long_term_messages', [])))
+    
+    # 1) 注入 assistant_id 与 assistant_config 到状态，供后续节点使用
+    try:
+        assistant_id = None
+        if isinstance(config, dict):
+            # 优先从 configurable 读取（调用方可显式传入）
+            assistant_id = (
+                config.get("configurable", {}) or {}
+            ).get("assistant_id")
+            # 其次从元数据读取（LangGraph Cloud 会在 metadata 放平台 assistant_id）
+            if not assistant_id:
+                assistant_id = (
+                    config.get("metadata", {}) or {}
+                ).get("assistant_id")
+        if assistant_id:
+            state["assistant_id"] = assistant_id
+            try:
+                from agents.persona_config.multi_assistant_config_manager import (
+                    multi_assistant_config_manager,
+                )
+                assistant_cfg = (
+                    multi_assistant_config_manager.get_assistant_config(assistant_id)
+                    or {}
+                )
+                if assistant_cfg:
+                    state["assistant_config"] = assistant_cfg
+            except Exception:
+                # 忽略个别环境下的导入/读取失败，保持回退逻辑
+                pass
+    except Exception:
+        pass
+    msgs = state.get("messages") or []
+    long_term_messages = state.get("long_term_messages") or []
+
+    # 调试：打印当前状态中的long_term_messages
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("输入的long_term_messages数量: %d", len(long_term_messages))
+        for i, msg in enumerate(long_term_messages):
+            msg_type, content, additional_kwargs, _ = _extract_message(msg)
+            # %.100s 由 logging 在输出时截断，不预先切片或转换
+            logger.debug(" long_term_messages[%d] (%s): %.100s...", i, msg_type, content)
+            if additional_kwargs:
+                logger.debug("   additional_kwargs: %s", additional_kwargs)
+
+    if msgs:
+        processed_messages, custom_audio_text = await _process_incoming_messages(msgs)
+    else:
+        # 没有新消息（如仅由轮询事件唤醒）：跳过URL识别、多媒体处理与消息重建
+        processed_messages, custom_audio_text = [], []
+
+    # 存储到状态中
+    state["custom_audio_text"] = custom_audio_text
+    logger.debug("语音识别文字数组已存储: %s", custom_audio_text)
+
     # 更新历史
-    print("[DEBUG] processed_messages内容是：",processed_messages)
+    logger.debug("processed_messages内容是：%s", processed_messages)
 
     # 确保long_term_messages中的字典格式消息被正确转换为Message对象
     converted_long_term_messages = []
+    append = converted_long_term_messages.append
     structured_context_found = False
 
     for msg in long_term_messages:
-        if isinstance(msg, dict):
-            # 特殊处理结构化上下文数据
-            msg_type = msg.get("type", "").lower()
-            content = msg.get("content", "")
-
-            # 支持的结构化字段（包含 report_update_time 修正）
-            if msg_type in [
-                "name", "sex", "age", "phone", "address", "birthday",
-                "job", "doctor", "project", "is_deal", "is_deal_price",
-                "not_deal", "not_deal_reason", "intent_project", "extra_info",
-                "report_update_time"
-            ]:
-                structured_context_found = True
-
-                field_name_map = {
-                    "name": "姓名",
-                    "sex": "性别",
-                    "age": "年龄",
-                    "phone": "电话",
-                    "birthday": "生日",
-                    "address": "住址",
-                    "job": "职业",
-                    "doctor": "面诊咨询师",
-                    "project": "项目",
-                    "is_deal": "已成交",
-                    "is_deal_price": "项目价格",
-                    "not_deal": "未成交",
-                    "not_deal_reason": "未成交原因",
-                    "intent_project": "感兴趣项目",
-                    "extra_info": "补充说明信息",
-                    "report_update_time": "上次到店面诊日期"
+        if not isinstance(msg, dict):
+            append(msg)
+            continue
+
+        # 特殊处理结构化上下文数据
+        msg_type = msg.get("type", "").lower()
+        content = msg.get("content", "")
+
+        # 支持的结构化字段（包含 report_update_time 修正）：一次查表同时完成判断与字段名映射
+        field_name = _PROFILE_FIELD_NAMES.get(msg_type)
+        if field_name is not None:
+            structured_context_found = True
+            append(HumanMessage(
+                content=f"{field_name}：{content}",
+                additional_kwargs={
+                    "context_update": True,
+                    "update_type": "user_profile",
+                    "field_type": msg_type,
+                    "send_style": "text"
                 }
+            ))
 
-                field_name = field_name_map.get(msg_type, msg_type)
-                human_content = f"{field_name}：{content}"
+        elif msg_type == "additional_kwargs" and isinstance(content, dict):
+            # 这是一个上下文标记，不需要转换为消息
+            # 标记信息已经包含在之前的消息中
+            structured_context_found = True
 
-                converted_msg = HumanMessage(
-                    content=human_content,
-                    additional_kwargs={
+        else:
+            # 处理普通消息格式 + 兜底：未知字典也转成HumanMessage，避免后续 .type 访问报错
+            additional_kwargs = msg.get("additional_kwargs", {})
+            role = _DICT_ROLE_TYPES.get(msg_type)
+
+            if role is not None:
+                additional_kwargs.setdefault("send_style", "text")
+                message_cls = HumanMessage if role == "human" else AIMessage
+                append(message_cls(content=str(content), additional_kwargs=additional_kwargs))
+            else:
+                append(HumanMessage(
+                    content=str(content),
+                    additional_kwargs=(additional_kwargs if isinstance(additional_kwargs, dict) else {}) | {
                         "context_update": True,
                         "update_type": "user_profile",
-                        "field_type": msg_type,
+                        "field_type": msg_type or "unknown",
                         "send_style": "text"
                     }
-                )
-                converted_long_term_messages.append(converted_msg)
-
-            elif msg_type == "additional_kwargs" and isinstance(content, dict):
-                # 这是一个上下文标记，不需要转换为消息
-                # 标记信息已经包含在之前的消息中
-                structured_context_found = True
-                continue
-
-            else:
-                # 处理普通消息格式 + 兜底：未知字典也转成HumanMessage，避免后续 .type 访问报错
-                additional_kwargs = msg.get("additional_kwargs", {})
-
-                if msg_type in ["human", "user"]:
-                    additional_kwargs["send_style"] = additional_kwargs.get("send_style", "text")
-                    converted_msg = HumanMessage(
-                        content=str(content),
-                        additional_kwargs=additional_kwargs
-                    )
-                elif msg_type in ["ai", "assistant"]:
-                    additional_kwargs["send_style"] = additional_kwargs.get("send_style", "text")
-                    converted_msg = AIMessage(
-                        content=str(content),
-                        additional_kwargs=additional_kwargs
-                    )
-                else:
-                    converted_msg = HumanMessage(
-                        content=str(content),
-                        additional_kwargs={
-                            **({} if not isinstance(additional_kwargs, dict) else additional_kwargs),
-                            "context_update": True,
-                            "update_type": "user_profile",
-                            "field_type": msg_type or "unknown",
-                            "send_style": "text"
-                        }
-                    )
-                converted_long_term_messages.append(converted_msg)
-        else:
-            converted_long_term_messages.append(msg)
+                ))
 
     # 如果检测到结构化上下文，添加一个统一的上下文标记
     if structured_context_found:
@@ -599,27 +709,33 @@ async def update_state_memory_node(state: AgentState, config=None):
 
     # 更新长期记忆，确保包含上下文消息
     state["long_term_messages"] = converted_long_term_messages + processed_messages
-    print(f"[DEBUG] long_term_messages 更新后总数量: {len(state['long_term_messages'])}")
+    logger.debug("long_term_messages 更新后总数量: %d", len(state['long_term_messages']))
 
     # 调试输出更新后的long_term_messages
-    print("[DEBUG] 更新后的long_term_messages内容:")
-    for i, msg in enumerate(state["long_term_messages"]):
-        if isinstance(msg, HumanMessage):
-            msg_type = "Human"
-            content = msg.content
-        elif isinstance(msg, AIMessage):
-            msg_type = "AI"
-            content = msg.content
-        else:
-            msg_type = "Unknown"
-            content = str(msg)
-        print(f"  消息 {i} ({msg_type}): {content[:100]}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("更新后的long_term_messages内容:")
+        for i, msg in enumerate(state["long_term_messages"]):
+            msg_type, content, _, _ = _extract_message(msg)
+            logger.debug("  消息 %d (%s): %.100s...", i, msg_type, content)
 
     state["processed_messages"] = processed_messages#更新新传输的消息为文本格式
     state["last_message"]=""#初始化ai生成的消息为空
     return state
 
 
+def _collect_subgraph_results(outcomes: list) -> list:
+    """从 gather(return_exceptions=True) 的结果中取出成功的子图输出，失败的记录日志后跳过"""
+    result = []
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            if not isinstance(outcome, Exception):
+                raise outcome  # 取消等非业务异常照常向上传播
+            logger.error("子图执行失败，保留其余子图的结果: %r", outcome, exc_info=outcome)
+        elif isinstance(outcome, dict):
+            result.append(outcome)
+    return result
+
+
 async def multi_subgraph_parallel_node(state: AgentState, config=None):
     """
     多子图并行执行节点 - 核心业务逻辑处理函数
@@ -632,7 +748,7 @@ async def multi_subgraph_parallel_node(state: AgentState, config=None):
     执行逻辑：
     1. 判断是否需要给用户发送消息（用户主动发消息 vs 主动事件触发）
     2. 根据判断结果选择性地执行相应的子图
-    3. 使用asyncio.gather实现真正的异步并行执行
+    3. 使用asyncio.gather实现真正的异步并行执行，单个子图失败时保留其余子图的结果
     4. 合并所有子图的输出结果到主状态中
     
     Args:
@@ -661,6 +777,8 @@ async def multi_subgraph_parallel_node(state: AgentState, config=None):
     
     # 初始化result变量
     result = []
+    # 素材检测写入的字段，等子图输出合并后再写回状态
+    material_updates = {}
     
     # 检查processed_messages是否为空或None
     processed_messages = state.get("processed_messages", [])
@@ -670,23 +788,32 @@ async def multi_subgraph_parallel_node(state: AgentState, config=None):
             print("[DEBUG] 后端上传了最新消息到记忆，其中包含人类消息，需要回复")
             state.update({"send_response_yes_or_no": True,"user_requires_message": True})
 
-            # 检测图片请求
-            await detect_and_select_image(state)
-
             try:
                 print(f"🚀 开始异步并行执行子图...")
+                # 检测图片请求与子图并发执行：读取落到 state，写入收集到 material_updates，
+                # 避免被子图返回的（检测前的）状态快照覆盖
                 tasks = [
+                    detect_and_select_image(ChainMap(material_updates, state)),
                     outside_info_subgraph.ainvoke(state),
                     user_emotion_analysis_subgraph.ainvoke(state),
                 ]
                 if not DISABLE_EVENT_SYSTEM:
                     tasks.append(event_generation_and_scheduling_subgraph.ainvoke(state))
-                result = await asyncio.gather(*tasks)
+                # 单个子图失败不取消其他子图，已完成子图的输出照常合并
+                detection_outcome, *outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+                if isinstance(detection_outcome, BaseException):
+                    if not isinstance(detection_outcome, Exception):
+                        raise detection_outcome  # 取消等非业务异常照常向上传播
+                    logger.error("素材检测失败，继续合并子图结果: %r", detection_outcome, exc_info=detection_outcome)
+                result = _collect_subgraph_results(outcomes)
+                if not result:
+                    raise RuntimeError("所有子图均执行失败")
             except Exception as e:
                 print(f"❌ 异步并行执行出错: {e}")
                 import traceback
                 print(f"🔍 错误详情:\n{traceback.format_exc()}")
-                # 返回原始状态
+                # 返回原始状态（保留已完成的素材检测结果）
+                state.update(material_updates)
                 return state
         else:
             print("[DEBUG] 可能是人工接管状态转换成了ai托管状态，后端上传了最新消息到记忆，其中不包含人类回复，消息已同步到记忆中，无需回复")
@@ -701,8 +828,7 @@ async def multi_subgraph_parallel_node(state: AgentState, config=None):
             if not event_instance:
                 return state
             # 检查事件时间是否到达
-            from datetime import datetime, timezone, timedelta
-            current_time = datetime.now(timezone(timedelta(hours=8)))
+            current_time = datetime.now(BEIJING_TZ)
             # 兼容 dict、对象、None
             if isinstance(event_instance, dict):
                 event_time_str = event_instance.get("event_time")
@@ -719,8 +845,7 @@ async def multi_subgraph_parallel_node(state: AgentState, config=None):
             if not state.get("assistant_id"):
                 print(f"[DEBUG] 没有获取到助手号，不产生主动回复")
                 return state
-            event_time = datetime.fromisoformat(event_time_str.replace('Z', '+00:00')).astimezone(
-                timezone(timedelta(hours=8)))
+            event_time = _parse_event_time(event_time_str)
             if current_time >= event_time:
                 # 检查是否为有效的主动事件类型
                 if event_type in [e.value for e in EventType]:
@@ -756,6 +881,7 @@ async def multi_subgraph_parallel_node(state: AgentState, config=None):
     for item in result:#result=[{子图1的output字典},{子图2的output字典},{子图3的output字典}]
         merged_state.update(item)
     state.update(merged_state)
+    state.update(material_updates)
     return state
 
 
@@ -789,244 +915,126 @@ async def send_or_response_node(state: AgentState, config=None):
         - 空消息会被过滤，不加入长期记忆
     """
     if not state["send_response_yes_or_no"]:
-        # 正确处理邀请时间，支持整数和字符串格式
-        invitation_time_value = state.get("invitation_time")
-        invitation_time_ms = None
-        if invitation_time_value is not None:
-            try:
-                if isinstance(invitation_time_value, int):
-                    invitation_time_ms = invitation_time_value
-                elif isinstance(invitation_time_value, str) and invitation_time_value:
-                    dt = datetime.fromisoformat(invitation_time_value.replace('Z', '+00:00'))
-                    invitation_time_ms = int(dt.timestamp() * 1000)
-            except Exception:
-                invitation_time_ms = None
-        return {"last_message": "", "messages": [], "custom_status": {"invitation_status": state.get("invitation_status", 0), "invitation_time": invitation_time_ms, "invitation_project": state.get("invitation_project")}, "token_usage": {"current_used": 0, "total_used": state.get("token_total_used", 0)}, "custom_audio_text": state.get("custom_audio_text", []), "selected_image": state.get("selected_image")}
+        return {"last_message": "", "messages": [], "custom_status": _build_custom_status_payload(state), "token_usage": {"current_used": 0, "total_used": state.get("token_total_used", 0)}, "custom_audio_text": state.get("custom_audio_text", []), "selected_image": state.get("selected_image")}
     elif state["user_requires_message"]:
-        state_data=dict(state)
+        # 生成节点需要完整上下文，浅拷贝一份供其读写，避免候选过程中的中间字段直接写回 state
+        state_data = state.copy()
 
         # 在调用生成节点之前，先判断是否需要语音回复，并设置相关状态
         async def _should_audio_reply() -> bool:
             # 使用大模型智能判断是否需要语音回复（基于近3轮用户消息）
             try:
-                from langchain_core.tools import tool
-                from langchain_core.messages import HumanMessage
-                import json
-                from llm import create_llm
-                
                 # 获取最近3轮用户消息进行上下文分析
                 msgs = state.get("processed_messages") or []
-                human_texts = [m.content for m in msgs if isinstance(m, HumanMessage) and isinstance(m.content, str) and m.content.strip()]
-                
                 # 获取最近3轮用户消息，如果不足3轮则取全部
-                recent_messages = human_texts[-3:] if len(human_texts) >= 3 else human_texts
+                recent_messages = _recent_human_texts(msgs, 3)
                 latest = recent_messages[-1] if recent_messages else ""
                 
                 if not latest:
                     raise Exception("没有找到用户消息，无法进行语音判断")
-                
+
+                # 用户输入里明确要求语音时直接判定，省去一次远程模型调用
+                if is_explicit_audio_request(latest):
+                    logger.debug("[TTS] 关键词预判 - 最新消息='%.50s', 决策=True（明确要求语音）", latest)
+                    return True
+
                 # 构建多轮对话上下文
                 context_messages = "\n".join([f"第{i+1}轮: {msg}" for i, msg in enumerate(recent_messages)])
                 
-                # 构建基于多轮对话上下文的判断提示词
-                prompt = f"""
-你是一个智能语音回复判断助手。请基于用户的多轮对话上下文，智能判断是否需要生成语音回复。
-
-分析维度：
-1. 直接语音请求：用户明确要求语音回复（如："语音"、"说出来"、"读一下"、"念一下"、"播报"、"播放语音"、"配音"等）
-2. 音频内容需求：用户要求唱歌、朗诵、配音等音频形式内容
-3. 语音技术询问：用户提到语音相关词汇（如："voice"、"tts"、"audio"、"声音"、"语气"等）
-4. 交互体验评价：用户询问或评价AI的声音、语气、说话方式
-5. 情感亲密表达：用户使用亲昵称呼或情感表达，暗示希望更亲密的语音交流
-6. 对话连续性：结合前几轮对话，判断用户是否在延续语音相关的话题
-7. 情境适配性：根据对话情境判断语音回复是否更合适（如讲故事、解释复杂概念等）
-
-用户近期对话上下文：
-{context_messages}
-
-用户的最新输入："{latest}"
-
-请综合分析多轮对话的上下文信息，判断是否需要语音回复。严格按照以下JSON格式输出，只输出JSON：
-{{
-  "need_audio_reply": true/false,
-  "reason": "基于多轮对话分析的判断理由",
-  "context_analysis": "对话上下文分析"
-}}
-"""
+                # 构建基于多轮对话上下文的判断提示词（模板在模块加载时定义，这里只填入变化部分）
+                prompt = _AUDIO_JUDGE_PROMPT.format(context_messages=context_messages, latest=latest)
                 
-                # 创建LLM - 直接从环境变量获取配置
-                import os
-                model_provider = os.getenv("MODEL_PROVIDER", "openai")
-                model_name = os.getenv("EVALUATION_MODEL", "gpt-4o-mini")
-                llm = create_llm(
-                    model_provider=model_provider,
-                    model_name=model_name,
-                    temperature=0.3
-                )
+                # 获取LLM - 配置在模块加载时读取，同一 (提供商, 模型) 复用同一实例
+                model_provider = _MODEL_PROVIDER
+                model_name = _EVALUATION_MODEL
+                llm = _get_audio_judge_llm(model_provider, model_name)
                 
-                # 调用大模型判断
+                # 调用大模型判断；近几轮用户消息归一化后相同（仅标点、空白、大小写不同）时，在缓存有效期内复用上次的判断结果
                 message = HumanMessage(content=prompt)
-                response = await llm.ainvoke(
-                    [message],
-                    response_format={"type": "json_object"}
-                )
-                
-                response_text = response.content
+                response_format = {"type": "json_object"}
+
+                async def _call_llm() -> str:
+                    response = await llm.ainvoke(
+                        [message],
+                        response_format=response_format
+                    )
+                    return response.content
+
+                cache_key = _audio_intent_cache_key(model_provider, model_name, recent_messages)
+                response_text = await llm_cache.get_or_call(cache_key, _call_llm)
                 if response_text:
-                    data = json.loads(response_text)
+                    data = orjson.loads(response_text)
                     decision = data.get("need_audio_reply", False)
                     reason = data.get("reason", "")
                     context_analysis = data.get("context_analysis", "")
-                    print(f"[TTS] 多轮对话分析 - 消息数量={len(recent_messages)}, 最新消息='{latest[:50]}', 决策={decision}")
-                    print(f"[TTS] 判断理由: {reason}")
-                    print(f"[TTS] 上下文分析: {context_analysis}")
+                    logger.debug("[TTS] 多轮对话分析 - 消息数量=%d, 最新消息='%.50s', 决策=%s", len(recent_messages), latest, decision)
+                    logger.debug("[TTS] 判断理由: %s", reason)
+                    logger.debug("[TTS] 上下文分析: %s", context_analysis)
                     return decision
                 else:
                     raise Exception("大模型返回为空，无法进行语音判断")
                     
             except Exception as e:
-                print(f"[TTS] 大模型判断失败: {e}")
+                logger.error("[TTS] 大模型判断失败: %s", e)
                 raise e
 
         # 设置语音回复状态，让生成模型知道是否要生成语音回复
         should_audio = await _should_audio_reply()
         state_data["audio_reply"] = should_audio
-        print(f"[AUDIO_PROMPT] 设置audio_reply状态为: {should_audio}")
+        logger.debug("[AUDIO_PROMPT] 设置audio_reply状态为: %s", should_audio)
 
-        result=await asyncio.to_thread(generate_and_evaluate_node.invoke, {
+        result=await generate_and_evaluate_node.ainvoke({
             "state_data": state_data
         })
         if result:
             state_data.update(result)
             state.update(result)
-        result=await asyncio.to_thread(self_verification_node.invoke, {"state_data": state_data})
+        # 自我校验只在候选回复中按得分挑选，不调用模型，直接在事件循环上执行
+        result=self_verification_node.invoke({"state_data": state_data})
         if result:
             state.update(result)
         last_message = state.get("last_message", "")
-        if last_message.strip():
-            # 使用前面已经设置的audio_reply状态
-            use_audio = should_audio
-            # 每轮先清理上一轮的音频URL，避免残留到本轮
-            try:
-                state.pop("last_message_audio_url", None)
-            except Exception:
-                pass
-            # 若需要语音，合成音频并仅记录URL，不再覆盖last_message文本
-            if use_audio:
-                try:
-                    audio_url = await synthesize_tts_stepfun(state["last_message"])  # 使用默认voice/format
-                    if audio_url:
-                        state["last_message_audio_url"] = audio_url
-                        print(f"[TTS] 合成成功，生成音频URL: {audio_url}")
-                    else:
-                        print(f"[TTS] 合成失败或未返回URL，保持文字回复")
-                except Exception:
-                    print(f"[TTS] 合成异常，保持文字回复")
-
-            # 为AI回复添加时间戳（此时last_message可能已被音频URL替换）
-            from datetime import datetime, timezone, timedelta
-            current_timestamp = datetime.now(timezone(timedelta(hours=8))).isoformat()
-            # 根据是否有音频URL来设置send_style
-            send_style = "audio" if state.get("last_message_audio_url") else "text"
-            ai_respond_message = AIMessage(
-                content=state["last_message"],
-                additional_kwargs={"timestamp": current_timestamp, "send_style": send_style}
-            )
-            state["long_term_messages"].append(ai_respond_message)
-
-            # 组装输出payload
-            async def _build_messages_payload(text_content: str, audio_url: Optional[str]) -> list:
-                items = []
-                # 文本
-                if isinstance(text_content, str) and text_content.strip():
-                    items.append({"type": "text", "content": text_content})
-                    # 提取内含URL/图片/文件
-                    url_pattern = re.compile(r"https?://[^\s]+", re.IGNORECASE)
-                    image_pattern = re.compile(r"https?://\S+(?:\.(?:png|jpg|jpeg|gif|webp)|/wechat/image/[^?\s]*|/image/[^?\s]*)", re.IGNORECASE)
-                    file_pattern = re.compile(r"(?:https?://\S+\.(?:pdf|docx?|xlsx?|pptx?)|/(?:[^\s]+\.(?:pdf|docx?|xlsx?|pptx?)))", re.IGNORECASE)
-                    # 图片
-                    for u in image_pattern.findall(text_content):
-                        items.append({"type": "image", "content": u, "title": None})
-                    # 文件
-                    for u in file_pattern.findall(text_content):
-                        items.append({"type": "file", "content": u})
-                    # 纯URL（去掉已作为图片/文件的）
-                    for u in url_pattern.findall(text_content):
-                        if image_pattern.search(u) or file_pattern.search(u):
-                            continue
-                        items.append({"type": "url", "content": u})
-
-                # 检查是否有选中的素材需要发送
-                selected_image = state.get("selected_image")
-                if selected_image and isinstance(selected_image, dict):
-                    material_id = selected_image.get("id")
-                    material_name = selected_image.get("name", "")
-                    material_type = selected_image.get("materialType", 2)  # 使用materialType字段
-
-                    if material_id:
-                        print(f"[MATERIAL] 添加选中的素材到输出: {material_name} (ID: {material_id}, 类型: {material_type})")
-
-                        # 统一的素材格式，包含materialType字段
-                        items.append({
-                            "type": "material",
-                            "content": material_id,
-                            "title": material_name,
-                            "materialType": material_type
-                        })
-
-                        # 素材发送后立即清除状态，确保只发送一次
-                        print(f"[MATERIAL] 清除selected_image状态，防止重复发送")
-                        state["selected_image"] = None
-                        state["image_request_detected"] = False
-
-                # 音频
-                if audio_url:
-                    # 获取音频时长
-                    duration_ms = await get_audio_duration_ms(audio_url)
-                    items.append({"type": "audio", "content": audio_url, "duration": duration_ms})
-                return items
-
-            # 自定义状态区
-            def _build_custom_status_payload(s: AgentState) -> dict:
-                invitation_status = s.get("invitation_status", 0)
-                invitation_time_value = s.get("invitation_time")
-                invitation_project = s.get("invitation_project")
-                # 转毫秒时间戳或None，支持字符串和整数两种格式
-                invitation_time_ms = None
-                if invitation_time_value is not None:
-                    try:
-                        if isinstance(invitation_time_value, int):
-                            # 如果已经是整数毫秒时间戳，直接使用
-                            invitation_time_ms = invitation_time_value
-                        elif isinstance(invitation_time_value, str) and invitation_time_value:
-                            # 如果是字符串，尝试解析ISO格式
-                            dt = datetime.fromisoformat(invitation_time_value.replace('Z', '+00:00'))
-                            invitation_time_ms = int(dt.timestamp() * 1000)
-                        else:
-                            # 其他情况保持None
-                            invitation_time_ms = None
-                    except Exception:
-                        invitation_time_ms = None
-                return {
-                    "invitation_status": invitation_status,
-                    "invitation_time": invitation_time_ms,
-                    "invitation_project": invitation_project,
-                }
+        if not last_message.strip():
+            # 没有可发送的回复：不清理音频URL、不合成语音、不构造消息载荷
+            return state
+        audio_duration_ms = None
+        # 使用前面已经设置的audio_reply状态
+        use_audio = should_audio
+        # 每轮先清理上一轮的音频URL，避免残留到本轮
+        try:
+            state.pop("last_message_audio_url", None)
+        except Exception:
+            pass
+        # 若需要语音，合成音频并仅记录URL，不再覆盖last_message文本
+        if use_audio:
+            audio_url, audio_duration_ms = await _synthesize_reply_audio(state["last_message"])
+            if audio_url:
+                state["last_message_audio_url"] = audio_url
+
+        # 为AI回复添加时间戳（此时last_message可能已被音频URL替换）
+        current_timestamp = datetime.now(BEIJING_TZ).isoformat()
+        # 根据是否有音频URL来设置send_style
+        send_style = "audio" if state.get("last_message_audio_url") else "text"
+        ai_respond_message = AIMessage(
+            content=state["last_message"],
+            additional_kwargs={"timestamp": current_timestamp, "send_style": send_style}
+        )
+        state["long_term_messages"].append(ai_respond_message)
 
-            state["messages"] = await _build_messages_payload(state.get("last_message", ""), state.get("last_message_audio_url"))
-            state["custom_status"] = _build_custom_status_payload(state)
-            # 统计并输出 token 用量
-            try:
-                current_used = int(state.get("round_token_used") or 0)
-            except Exception:
-                current_used = 0
-            try:
-                total_prev = int(state.get("token_total_used") or 0)
-            except Exception:
-                total_prev = 0
-            total_used = total_prev + current_used
-            state["token_total_used"] = total_used
-            state["token_usage"] = {"current_used": current_used, "total_used": total_used}
+        state["messages"] = _build_messages_payload(state, state.get("last_message", ""), state.get("last_message_audio_url"), audio_duration_ms)
+        state["custom_status"] = _build_custom_status_payload(state)
+        # 统计并输出 token 用量
+        try:
+            current_used = int(state.get("round_token_used") or 0)
+        except Exception:
+            current_used = 0
+        try:
+            total_prev = int(state.get("token_total_used") or 0)
+        except Exception:
+            total_prev = 0
+        total_used = total_prev + current_used
+        state["token_total_used"] = total_used
+        state["token_usage"] = {"current_used": current_used, "total_used": total_used}
         return state
 
     elif state["sales_requires_message"]:
@@ -1038,12 +1046,10 @@ async def send_or_response_node(state: AgentState, config=None):
                     return bool(state.get("audio_reply"))
                 try:
                     msgs = state.get("processed_messages") or []
-                    human_texts = [m.content for m in msgs if isinstance(m, HumanMessage)]
-                    latest = human_texts[-1] if human_texts else ""
+                    latest = next((m.content for m in reversed(msgs) if isinstance(m, HumanMessage)), "")
                     # 使用统一的语音关键词配置（销售场景 + 基础关键词）
-                    audio_kw = AUDIO_KEYWORDS_BASE + AUDIO_KEYWORDS_SALES_EXTRA
-                    decision = any(k in latest for k in audio_kw)
-                    print(f"[TTS] (主动事件) latest_human='{str(latest)[:50]}', decision={decision}, audio_reply_flag={state.get('audio_reply')}")
+                    decision = contains_audio_keyword(latest)
+                    logger.debug("[TTS] (主动事件) latest_human='%.50s', decision=%s, audio_reply_flag=%s", latest, decision, state.get('audio_reply'))
                     return decision
                 except Exception:
                     return False
@@ -1053,19 +1059,13 @@ async def send_or_response_node(state: AgentState, config=None):
                 state.pop("last_message_audio_url", None)
             except Exception:
                 pass
+            audio_duration_ms = None
             if _should_audio_reply_sales():
-                try:
-                    audio_url = await synthesize_tts_stepfun(state["last_message"])  # 使用默认voice/format
-                    if audio_url:
-                        state["last_message_audio_url"] = audio_url
-                        print(f"[TTS] (主动事件) 合成成功，生成音频URL: {audio_url}")
-                    else:
-                        print(f"[TTS] (主动事件) 合成失败或未返回URL，保持文字回复")
-                except Exception:
-                    print(f"[TTS] (主动事件) 合成异常，保持文字回复")
+                audio_url, audio_duration_ms = await _synthesize_reply_audio(state["last_message"], "(主动事件) ")
+                if audio_url:
+                    state["last_message_audio_url"] = audio_url
 
-            from datetime import datetime, timezone, timedelta
-            current_timestamp = datetime.now(timezone(timedelta(hours=8))).isoformat()
+            current_timestamp = datetime.now(BEIJING_TZ).isoformat()
             # 根据是否有音频URL来设置send_style
             send_style = "audio" if state.get("last_message_audio_url") else "text"
             ai_send_message = AIMessage(
@@ -1076,79 +1076,7 @@ async def send_or_response_node(state: AgentState, config=None):
                 }
             )
             state["long_term_messages"].append(ai_send_message)
-            # 同步组装输出结构
-            async def _build_messages_payload(text_content: str, audio_url: Optional[str]) -> list:
-                items = []
-                if isinstance(text_content, str) and text_content.strip():
-                    items.append({"type": "text", "content": text_content})
-                    url_pattern = re.compile(r"https?://[^\s]+", re.IGNORECASE)
-                    image_pattern = re.compile(r"https?://\S+(?:\.(?:png|jpg|jpeg|gif|webp)|/wechat/image/[^?\s]*|/image/[^?\s]*)", re.IGNORECASE)
-                    file_pattern = re.compile(r"(?:https?://\S+\.(?:pdf|docx?|xlsx?|pptx?)|/(?:[^\s]+\.(?:pdf|docx?|xlsx?|pptx?)))", re.IGNORECASE)
-                    for u in image_pattern.findall(text_content):
-                        items.append({"type": "image", "content": u, "title": None})
-                    for u in file_pattern.findall(text_content):
-                        items.append({"type": "file", "content": u})
-                    for u in url_pattern.findall(text_content):
-                        if image_pattern.search(u) or file_pattern.search(u):
-                            continue
-                        items.append({"type": "url", "content": u})
-
-                # 检查是否有选中的素材需要发送
-                selected_image = state.get("selected_image")
-                if selected_image and isinstance(selected_image, dict):
-                    material_id = selected_image.get("id")
-                    material_name = selected_image.get("name", "")
-                    material_type = selected_image.get("materialType", 2)  # 使用materialType字段
-
-                    if material_id:
-                        print(f"[MATERIAL] (销售消息) 添加选中的素材到输出: {material_name} (ID: {material_id}, 类型: {material_type})")
-
-                        # 统一的素材格式，包含materialType字段
-                        items.append({
-                            "type": "material",
-                            "content": material_id,
-                            "title": material_name,
-                            "materialType": material_type
-                        })
-
-                        # 素材发送后立即清除状态，确保只发送一次
-                        print(f"[MATERIAL] (销售消息) 清除selected_image状态，防止重复发送")
-                        state["selected_image"] = None
-                        state["image_request_detected"] = False
-
-                if audio_url:
-                    # 获取音频时长
-                    duration_ms = await get_audio_duration_ms(audio_url)
-                    items.append({"type": "audio", "content": audio_url, "duration": duration_ms})
-                return items
-
-            def _build_custom_status_payload(s: AgentState) -> dict:
-                invitation_status = s.get("invitation_status", 0)
-                invitation_time_value = s.get("invitation_time")
-                invitation_project = s.get("invitation_project")
-                # 转毫秒时间戳或None，支持字符串和整数两种格式
-                invitation_time_ms = None
-                if invitation_time_value is not None:
-                    try:
-                        if isinstance(invitation_time_value, int):
-                            # 如果已经是整数毫秒时间戳，直接使用
-                            invitation_time_ms = invitation_time_value
-                        elif isinstance(invitation_time_value, str) and invitation_time_value:
-                            # 如果是字符串，尝试解析ISO格式
-                            dt = datetime.fromisoformat(invitation_time_value.replace('Z', '+00:00'))
-                            invitation_time_ms = int(dt.timestamp() * 1000)
-                        else:
-                            # 其他情况保持None
-                            invitation_time_ms = None
-                    except Exception:
-                        invitation_time_ms = None
-                return {
-                    "invitation_status": invitation_status,
-                    "invitation_time": invitation_time_ms,
-                    "invitation_project": invitation_project,
-                }
-
-            state["messages"] = await _build_messages_payload(state.get("last_message", ""), state.get("last_message_audio_url"))
+            state["messages"] = _build_messages_payload(state, state.get("last_message", ""), state.get("last_message_audio_url"), audio_duration_ms, "(销售消息) ")
             state["custom_status"] = _build_custom_status_payload(state)
             # 统计并输出 token 用量（主动事件通道同样累计）
             try:
@@ -1164,33 +1092,9 @@ async def send_or_response_node(state: AgentState, config=None):
             state["token_usage"] = {"current_used": current_used, "total_used": total_used}
             return state #因为在multi_subgraph_parallel_node中子图3的event_generation_and_scheduling_graph已经给出了回复
         else:
-            # 正确处理邀请时间，支持整数和字符串格式
-            invitation_time_value = state.get("invitation_time")
-            invitation_time_ms = None
-            if invitation_time_value is not None:
-                try:
-                    if isinstance(invitation_time_value, int):
-                        invitation_time_ms = invitation_time_value
-                    elif isinstance(invitation_time_value, str) and invitation_time_value:
-                        dt = datetime.fromisoformat(invitation_time_value.replace('Z', '+00:00'))
-                        invitation_time_ms = int(dt.timestamp() * 1000)
-                except Exception:
-                    invitation_time_ms = None
-            return {"last_message": "", "messages": [], "custom_status": {"invitation_status": state.get("invitation_status", 0), "invitation_time": invitation_time_ms, "invitation_project": state.get("invitation_project")}, "token_usage": {"current_used": 0, "total_used": state.get("token_total_used", 0)}, "custom_audio_text": state.get("custom_audio_text", []), "selected_image": state.get("selected_image")}
+            return {"last_message": "", "messages": [], "custom_status": _build_custom_status_payload(state), "token_usage": {"current_used": 0, "total_used": state.get("token_total_used", 0)}, "custom_audio_text": state.get("custom_audio_text", []), "selected_image": state.get("selected_image")}
     else:
-        # 正确处理邀请时间，支持整数和字符串格式
-        invitation_time_value = state.get("invitation_time")
-        invitation_time_ms = None
-        if invitation_time_value is not None:
-            try:
-                if isinstance(invitation_time_value, int):
-                    invitation_time_ms = invitation_time_value
-                elif isinstance(invitation_time_value, str) and invitation_time_value:
-                    dt = datetime.fromisoformat(invitation_time_value.replace('Z', '+00:00'))
-                    invitation_time_ms = int(dt.timestamp() * 1000)
-            except Exception:
-                invitation_time_ms = None
-        return {"last_message": "", "messages": [], "custom_status": {"invitation_status": state.get("invitation_status", 0), "invitation_time": invitation_time_ms, "invitation_project": state.get("invitation_project")}, "token_usage": {"current_used": 0, "total_used": state.get("token_total_used", 0)}, "custom_audio_text": state.get("custom_audio_text", []), "selected_image": state.get("selected_image")}
+        return {"last_message": "", "messages": [], "custom_status": _build_custom_status_payload(state), "token_usage": {"current_used": 0, "total_used": state.get("token_total_used", 0)}, "custom_audio_text": state.get("custom_audio_text", []), "selected_image": state.get("selected_image")}
 
 class Output(TypedDict):
     """子图的输出状态 - 只包含最终回复"""
@@ -1238,12 +1142,12 @@ async def context_update_node(state: AgentState, context_request: ContextUpdateR
         - 上下文更新不会触发AI回复，只更新状态
     """
     if not context_request:
-        print("[DEBUG] 没有上下文更新请求，直接返回原状态")
+        logger.debug("没有上下文更新请求，直接返回原状态")
         return state
 
-    print("[DEBUG] === 开始处理上下文更新请求 ===")
-    print(f"[DEBUG] 更新类型: {context_request.get('update_type', 'unknown')}")
-    print(f"[DEBUG] 上下文消息数量: {len(context_request.get('context_messages', []))}")
+    logger.debug("=== 开始处理上下文更新请求 ===")
+    logger.debug("更新类型: %s", context_request.get('update_type', 'unknown'))
+    logger.debug("上下文消息数量: %d", len(context_request.get('context_messages', [])))
 
     # 获取现有的长期记忆
     long_term_messages = state.get("long_term_messages", [])
@@ -1294,20 +1198,21 @@ async def context_update_node(state: AgentState, context_request: ContextUpdateR
                 )
 
             new_context_messages.append(new_msg)
-            print(f"[DEBUG] 创建上下文消息 {i+1}: {enhanced_content[:50]}...")
+            logger.debug("创建上下文消息 %d: %.50s...", i + 1, enhanced_content)
 
         except Exception as e:
-            print(f"[ERROR] 处理上下文消息 {i+1} 时出错: {e}")
+            logger.error("处理上下文消息 %d 时出错: %s", i + 1, e)
             continue
 
     # 将新的上下文消息添加到长期记忆的开头（作为背景信息）
     if new_context_messages:
-        # 在现有消息前插入上下文信息
-        updated_long_term_messages = new_context_messages + long_term_messages
+        # 在现有消息前原地插入上下文信息（切片赋值，不再拼接出一份完整的新列表）
+        updated_long_term_messages = long_term_messages if isinstance(long_term_messages, list) else list(long_term_messages)
+        updated_long_term_messages[:0] = new_context_messages
         state["long_term_messages"] = updated_long_term_messages
 
-        print(f"[DEBUG] 上下文更新完成，共添加 {len(new_context_messages)} 条消息")
-        print(f"[DEBUG] 更新后的长期记忆总数量: {len(updated_long_term_messages)}")
+        logger.debug("上下文更新完成，共添加 %d 条消息", len(new_context_messages))
+        logger.debug("更新后的长期记忆总数量: %d", len(updated_long_term_messages))
 
         # 添加更新标记到状态中
         state["context_updated"] = True
@@ -1318,12 +1223,12 @@ async def context_update_node(state: AgentState, context_request: ContextUpdateR
         if context_request.get("metadata"):
             state["context_metadata"] = context_request["metadata"]
     else:
-        print("[DEBUG] 没有有效的上下文消息需要添加")
+        logger.debug("没有有效的上下文消息需要添加")
 
     return state
 
 @tool
-def inject_structured_context_to_thread(thread_id: str, user_profile: Dict[str, Any],
+async def inject_structured_context_to_thread(thread_id: str, user_profile: Dict[str, Any],
                                        base_url: str = None):
     """
     向指定thread注入结构化的用户信息
@@ -1348,21 +1253,18 @@ def inject_structured_context_to_thread(thread_id: str, user_profile: Dict[str,
 
     Example:
         # 注入结构化用户信息
-        result = inject_structured_context_to_thread(
-            thread_id="thread_123",
-            user_profile={
+        result = await inject_structured_context_to_thread.ainvoke({
+            "thread_id": "thread_123",
+            "user_profile": {
                 "name": "张雨晴",
                 "sex": "女",
                 "age": "25",
                 "phone": "13800138000",
                 "address": "北京市海淀区"
             }
-        )
+        })
     """
     try:
-        import requests
-        import os
-
         # 获取基础URL
         if not base_url:
             base_url = os.getenv("LANGGRAPH_BASE_URL", "http://127.0.0.1:2024")
@@ -1404,20 +1306,23 @@ def inject_structured_context_to_thread(thread_id: str, user_profile: Dict[str,
 
         # 发送请求
         state_url = f"{base_url}/threads/{thread_id}/state"
-        response = requests.post(state_url, json=payload, timeout=30)
+        session = await get_http_session()
+        async with session.post(state_url, json=payload, timeout=_CONTEXT_API_TIMEOUT) as response:
+            status = response.status
+            response_text = await response.text()
 
-        if response.status_code == 200:
+        if status == 200:
             return {
                 "success": True,
                 "thread_id": thread_id,
                 "profile_fields": list(user_profile.keys()),
                 "total_fields": len([v for v in user_profile.values() if v and str(v).strip()]),
-                "timestamp": requests.utils.formatdate(timeval=None, localtime=True)
+                "timestamp": datetime.now(BEIJING_TZ).isoformat()
             }
         else:
             return {
                 "success": False,
-                "error": f"API请求失败: {response.status_code} - {response.text}"
+                "error": f"API请求失败: {status} - {response_text}"
             }
 
     except Exception as e:
@@ -1427,7 +1332,7 @@ def inject_structured_context_to_thread(thread_id: str, user_profile: Dict[str,
         }
 
 @tool
-def inject_context_to_thread(thread_id: str, context_messages: List[Dict[str, Any]],
+async def inject_context_to_thread(thread_id: str, context_messages: List[Dict[str, Any]],
                            update_type: str = "background_info", metadata: Dict[str, Any] = None):
     """
     向指定thread注入上下文信息的工具函数
@@ -1450,19 +1355,15 @@ def inject_context_to_thread(thread_id: str, context_messages: List[Dict[str, An
 
     Example:
         # 注入用户背景信息
-        result = inject_context_to_thread(
-            thread_id="thread_123",
-            context_messages=[
+        result = await inject_context_to_thread.ainvoke({
+            "thread_id": "thread_123",
+            "context_messages": [
                 {"type": "human", "content": "{{}}是一位大学生"}
             ],
-            update_type="background_info"
-        )
+            "update_type": "background_info"
+        })
     """
     try:
-        import requests
-        import os
-        from datetime import datetime
-
         # 构建上下文更新请求
         context_request = {
             "thread_id": thread_id,
@@ -1490,9 +1391,12 @@ def inject_context_to_thread(thread_id: str, context_messages: List[Dict[str, An
         }
 
         # 发送请求
-        response = requests.post(api_url, json=payload, timeout=30)
+        session = await get_http_session()
+        async with session.post(api_url, json=payload, timeout=_CONTEXT_API_TIMEOUT) as response:
+            status = response.status
+            response_text = await response.text()
 
-        if response.status_code == 200:
+        if status == 200:
             return {
                 "success": True,
                 "thread_id": thread_id,
@@ -1503,7 +1407,7 @@ def inject_context_to_thread(thread_id: str, context_messages: List[Dict[str, An
         else:
             return {
                 "success": False,
-                "error": f"API请求失败: {response.status_code} - {response.text}"
+                "error": f"API请求失败: {status} - {response_text}"
             }
 
     except Exception as e:
@@ -1513,7 +1417,7 @@ def inject_context_to_thread(thread_id: str, context_messages: List[Dict[str, An
         }
 
 @tool
-def verify_context_injection(thread_id: str, base_url: str = None):
+async def verify_context_injection(thread_id: str, base_url: str = None):
     """
     验证指定thread中的上下文信息是否正确注入
 
@@ -1528,9 +1432,6 @@ def verify_context_injection(thread_id: str, base_url: str = None):
         dict: 验证结果，包含状态信息和上下文消息详情
     """
     try:
-        import requests
-        import os
-
         # 获取基础URL
         if not base_url:
             base_url = os.getenv("LANGGRAPH_BASE_URL", "http://127.0.0.1:2024")
@@ -1539,15 +1440,14 @@ def verify_context_injection(thread_id: str, base_url: str = None):
         state_url = f"{base_url}/threads/{thread_id}/state"
 
         # 发送请求获取当前状态
-        response = requests.get(state_url, timeout=30)
-
-        if response.status_code != 200:
-            return {
-                "success": False,
-                "error": f"获取thread状态失败: {response.status_code} - {response.text}"
-            }
-
-        state_data = response.json()
+        session = await get_http_session()
+        async with session.get(state_url, timeout=_CONTEXT_API_TIMEOUT) as response:
+            if response.status != 200:
+                return {
+                    "success": False,
+                    "error": f"获取thread状态失败: {response.status} - {await response.text()}"
+                }
+            state_data = await response.json(content_type=None, loads=orjson.loads)
         values = state_data.get("values", {})
 
         # 分析long_term_messages
@@ -1555,18 +1455,22 @@ def verify_context_injection(thread_id: str, base_url: str = None):
         context_messages = []
         regular_messages = []
 
+        # 接口返回的消息都是字典；单次遍历，每条消息只构造一个结果字典
+        append_context = context_messages.append
+        append_regular = regular_messages.append
         for i, msg in enumerate(long_term_messages):
             if isinstance(msg, dict):
-                additional_kwargs = msg.get("additional_kwargs", {})
+                # additional_kwargs 可能为 null，统一按空字典处理
+                additional_kwargs = msg.get("additional_kwargs") or {}
                 content = msg.get("content", "")
                 msg_type = msg.get("type", "unknown")
             else:
-                additional_kwargs = getattr(msg, 'additional_kwargs', {})
+                additional_kwargs = getattr(msg, 'additional_kwargs', None) or {}
                 content = getattr(msg, 'content', str(msg))
                 msg_type = "Human" if isinstance(msg, HumanMessage) else "AI"
 
             if additional_kwargs.get("context_update"):
-                context_messages.append({
+                append_context({
                     "index": i,
                     "type": msg_type,
                     "content": content,
@@ -1574,11 +1478,7 @@ def verify_context_injection(thread_id: str, base_url: str = None):
                     "context_update": True
                 })
             else:
-                regular_messages.append({
-                    "index": i,
-                    "type": msg_type,
-                    "content": content
-                })
+                append_regular({"index": i, "type": msg_type, "content": content})
 
         return {
             "success": True,
@@ -1596,6 +1496,42 @@ def verify_context_injection(thread_id: str, base_url: str = None):
             "error": f"验证上下文注入时出错: {str(e)}"
         }
 
+@lru_cache(maxsize=32)
+def _build_configuration(config_json: bytes) -> Configuration:
+    """按序列化后的配置内容缓存 Configuration 实例，相同配置不再重复做 pydantic 校验"""
+    return Configuration(**orjson.loads(config_json))
+
+
+def _resolve_event_config(state_dict: Any):
+    """
+    解析事件节点使用的配置，返回 (config, runtime_config)。
+
+    config 为运行时配置叠加助手配置后构建的 Configuration（都为空时取上下文默认配置）；
+    runtime_config 为未叠加助手配置的运行时配置，供选择模型提供商与模型名使用。
+    """
+    try:
+        from agents.persona_config.config_manager import config_manager
+        runtime_config = config_manager.get_config() or {}
+    except Exception:
+        runtime_config = {}
+    merged = runtime_config
+    if isinstance(state_dict, dict):
+        assistant_cfg = state_dict.get("assistant_config") or {}
+        if assistant_cfg:
+            merged = {**runtime_config, **assistant_cfg}
+    try:
+        if not merged:
+            return Configuration.from_context(), runtime_config
+        try:
+            config_json = orjson.dumps(merged, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # 含有无法序列化的值时不走缓存
+            return Configuration(**merged), runtime_config
+        return _build_configuration(config_json), runtime_config
+    except Exception:
+        return Configuration.from_context(), runtime_config
+
+
 @tool
 def event_triggered_node(state_dict: dict):
     """
@@ -1630,46 +1566,35 @@ def event_triggered_node(state_dict: dict):
         - 事件时间会自动调整到合适的业务时间
     """
     try:
+        # 本次调用的时间快照：模型决策前的默认值共用一次取值
+        started_at = datetime.now(BEIJING_TZ)
         # 获取状态信息，提供默认值
         long_term_messages = state_dict.get("long_term_messages", [])
         appointment_time = state_dict.get("appointment_time", "")
         event_instance = state_dict.get("event_instance")
         if event_instance:
-            if isinstance(event_instance, dict):
-                event_instance = EventInstance(**event_instance)
+            event_instance = _coerce_event_instance(event_instance)
             event_type = event_instance.event_type
             event_time = event_instance.event_time
         else:
             event_type = EventType.OPENING_GREETING  # 默认开场问候
-            event_time = datetime.now(BEIJING_TZ)
+            event_time = started_at
         user_last_reply_time = state_dict.get("user_last_reply_time")
         if user_last_reply_time is None:
-            user_last_reply_time = datetime.now(BEIJING_TZ).isoformat()
+            user_last_reply_time = started_at.isoformat()
         elif isinstance(user_last_reply_time, datetime):
             user_last_reply_time = user_last_reply_time.isoformat()
 
         last_active_send_time = state_dict.get("last_active_send_time")
         if last_active_send_time is None:
-            last_active_send_time = datetime.now(BEIJING_TZ).isoformat()
+            last_active_send_time = started_at.isoformat()
         elif isinstance(last_active_send_time, datetime):
             last_active_send_time = last_active_send_time.isoformat()
 
         user_treatment_completion_info = state_dict.get("user_treatment_completion_info", "")
 
-        # 获取配置（优先运行时 persona_config，其次上下文默认配置）
-        try:
-            from agents.persona_config.config_manager import config_manager
-            runtime_config = config_manager.get_config() or {}
-            if isinstance(state_dict, dict):
-                assistant_cfg = state_dict.get("assistant_config") or {}
-                if assistant_cfg:
-                    runtime_config = {**runtime_config, **assistant_cfg}
-            if runtime_config:
-                config = Configuration(**runtime_config)
-            else:
-                config = Configuration.from_context()
-        except Exception:
-            config = Configuration.from_context()
+        # 获取配置（优先运行时 persona_config，其次上下文默认配置）；每个节点只解析一次
+        config, runtime_config = _resolve_event_config(state_dict)
 
         # 生成决策提示词（事件已触发）
         prompt = get_event_decision_prompt_triggered(
@@ -1689,8 +1614,6 @@ def event_triggered_node(state_dict: dict):
             event_decision = parse_event_decision(prompt)
         else:
             # 需要调用LLM进行决策（仅使用运行时配置）
-            from agents.persona_config.config_manager import config_manager
-            runtime_config = config_manager.get_config() or {}
             model_provider = runtime_config.get("model_provider", "openrouter")
             model_name = runtime_config.get("decision_model", runtime_config.get("model_name", "x-ai/grok-code-fast-1"))
             
@@ -1719,22 +1642,22 @@ def event_triggered_node(state_dict: dict):
         except ValueError:
             event_type = EventType.PENDING_ACTIVATION
 
-        # 解析时间
+        # 解析时间；模型决策后的默认值与发送时间共用一次取值
+        decided_at = datetime.now(BEIJING_TZ)
         event_time_str = event_decision.get("event_time")
         if event_time_str:
             try:
-                event_time = datetime.fromisoformat(event_time_str.replace('Z', '+00:00')).astimezone(BEIJING_TZ)
+                event_time = _parse_event_time(event_time_str)
             except:
-                event_time = datetime.now(BEIJING_TZ)
+                event_time = decided_at
         else:
-            event_time = datetime.now(BEIJING_TZ)
+            event_time = decided_at
 
         appointment_time_str = event_decision.get("appointment_time")
         appointment_time = None
         if appointment_time_str:
             try:
-                appointment_time = datetime.fromisoformat(appointment_time_str.replace('Z', '+00:00')).astimezone(
-                    BEIJING_TZ)
+                appointment_time = _parse_event_time(appointment_time_str)
             except:
                 pass
 
@@ -1745,7 +1668,7 @@ def event_triggered_node(state_dict: dict):
         )
 
         # 设置时间字段
-        now = datetime.now(BEIJING_TZ).replace(second=0, microsecond=0)
+        now = decided_at.replace(second=0, microsecond=0)
         last_active_send_time = now.isoformat()  # 当前发送消息时间
 
         # event_triggered_node: 事件已触发，用户没有回复，保持原来的 user_last_reply_time
@@ -1808,43 +1731,32 @@ def event_untriggered_node(state_dict: Dict):
         - 包含完整的错误处理和默认值设置
     """
     try:
+        # 本次调用的时间快照：模型决策前的默认值共用一次取值
+        started_at = datetime.now(BEIJING_TZ)
         # 获取状态信息，提供默认值
         long_term_messages = state_dict.get("long_term_messages", [])
         appointment_time = state_dict.get("appointment_time", "")
         user_last_reply_time = state_dict.get("user_last_reply_time")
         if user_last_reply_time is None:
-            user_last_reply_time = datetime.now(BEIJING_TZ).isoformat()
+            user_last_reply_time = started_at.isoformat()
         elif isinstance(user_last_reply_time, datetime):
             user_last_reply_time = user_last_reply_time.isoformat()
         last_active_send_time = state_dict.get("last_active_send_time")
         if last_active_send_time is None:
-            last_active_send_time = datetime.now(BEIJING_TZ).isoformat()
+            last_active_send_time = started_at.isoformat()
         elif isinstance(last_active_send_time, datetime):
             last_active_send_time = last_active_send_time.isoformat()
         user_treatment_completion_info = state_dict.get("user_treatment_completion_info", "")
         event_instance = state_dict.get("event_instance")
         if event_instance:
-            if isinstance(event_instance, dict):
-                event_instance = EventInstance(**event_instance)
+            event_instance = _coerce_event_instance(event_instance)
             event_type = event_instance.event_type
             event_time = event_instance.event_time
         else:
             event_type = "pending_activation"
-            event_time = datetime.now(BEIJING_TZ)
-        # 获取配置（优先运行时 persona_config，其次上下文默认配置）
-        try:
-            from agents.persona_config.config_manager import config_manager
-            runtime_config = config_manager.get_config() or {}
-            if isinstance(state_dict, dict):
-                assistant_cfg = state_dict.get("assistant_config") or {}
-                if assistant_cfg:
-                    runtime_config = {**runtime_config, **assistant_cfg}
-            if runtime_config:
-                config = Configuration(**runtime_config)
-            else:
-                config = Configuration.from_context()
-        except Exception:
-            config = Configuration.from_context()
+            event_time = started_at
+        # 获取配置（优先运行时 persona_config，其次上下文默认配置）；每个节点只解析一次
+        config, runtime_config = _resolve_event_config(state_dict)
 
         # 生成决策提示词（事件未触发）
         prompt = get_event_decision_prompt_untriggered(
@@ -1858,8 +1770,6 @@ def event_untriggered_node(state_dict: Dict):
             config=config
         )
         # 调用LLM进行决策（仅使用运行时配置）
-        from agents.persona_config.config_manager import config_manager
-        runtime_config = config_manager.get_config() or {}
         model_provider = runtime_config.get("model_provider", "openrouter")
         model_name = runtime_config.get("decision_model", runtime_config.get("model_name", "x-ai/grok-code-fast-1"))
         
@@ -1886,22 +1796,22 @@ def event_untriggered_node(state_dict: Dict):
         except ValueError:
             event_type = EventType.PENDING_ACTIVATION
 
-        # 解析时间
+        # 解析时间；模型决策后的默认值与发送时间共用一次取值
+        decided_at = datetime.now(BEIJING_TZ)
         event_time_str = event_decision.get("event_time")
         if event_time_str:
             try:
-                event_time = datetime.fromisoformat(event_time_str.replace('Z', '+00:00')).astimezone(BEIJING_TZ)
+                event_time = _parse_event_time(event_time_str)
             except:
-                event_time = datetime.now(BEIJING_TZ)
+                event_time = decided_at
         else:
-            event_time = datetime.now(BEIJING_TZ)
+            event_time = decided_at
 
         appointment_time_str = event_decision.get("appointment_time")
         appointment_time = None
         if appointment_time_str:
             try:
-                appointment_time = datetime.fromisoformat(appointment_time_str.replace('Z', '+00:00')).astimezone(
-                    BEIJING_TZ)
+                appointment_time = _parse_event_time(appointment_time_str)
             except:
                 pass
         # 创建事件实例
@@ -1911,7 +1821,7 @@ def event_untriggered_node(state_dict: Dict):
         )
 
         # 设置时间字段
-        now = datetime.now(BEIJING_TZ).replace(second=0, microsecond=0)
+        now = decided_at.replace(second=0, microsecond=0)
         last_active_send_time = now.isoformat()  # 当前发送消息时间
 
         # event_untriggered_node: 事件未触发，用户主动回复，user_last_reply_time 设为当前时间
@@ -1989,20 +1899,8 @@ def event_driven_chat_node(state_dict: dict):
             logger.warning(f"Invalid event_type: {event_type}")
             return {"last_message": ""}
 
-        # 获取配置（优先运行时 persona_config，其次上下文默认配置）
-        try:
-            from agents.persona_config.config_manager import config_manager
-            runtime_config = config_manager.get_config() or {}
-            if isinstance(state_dict, dict):
-                assistant_cfg = state_dict.get("assistant_config") or {}
-                if assistant_cfg:
-                    runtime_config = {**runtime_config, **assistant_cfg}
-            if runtime_config:
-                config = Configuration(**runtime_config)
-            else:
-                config = Configuration.from_context()
-        except Exception:
-            config = Configuration.from_context()
+        # 获取配置（优先运行时 persona_config，其次上下文默认配置）；每个节点只解析一次
+        config, runtime_config = _resolve_event_config(state_dict)
 
         # 获取配置化的事件提示词
         event_action_mapping = get_event_action_mapping(config)
@@ -2020,14 +1918,17 @@ def event_driven_chat_node(state_dict: dict):
             logger.error(f"Error formatting event prompt: {e}")
             event_prompt = event_config["prompt"]
 
-        # 格式化历史消息
+        # 格式化历史消息：只取最近50条，跳过没有文本内容的消息（空行只会增加提示词长度）
         def _format_messages(long_term_messages):
             if not long_term_messages:
                 return ""
             lines = []
             for msg in long_term_messages[-50:]:
+                content = getattr(msg, "content", None)
+                if not content:
+                    continue
                 role = "用户" if getattr(msg, "type", "") == "human" else "AI"
-                lines.append(f"{role}: {msg.content}")
+                lines.append(f"{role}: {content}")
             return "\n".join(lines)
 
         formatted_history = _format_messages(long_term_messages)
@@ -2073,8 +1974,6 @@ def event_driven_chat_node(state_dict: dict):
         # 调用AI模型（添加超时和错误处理）
         try:
             # 使用运行时配置
-            from agents.persona_config.config_manager import config_manager
-            runtime_config = config_manager.get_config() or {}
             model_provider = runtime_config.get("model_provider", "openrouter")
             model_name = runtime_config.get("generation_model", runtime_config.get("model_name", "x-ai/grok-code-fast-1"))
             
@@ -2096,19 +1995,10 @@ def event_driven_chat_node(state_dict: dict):
         try:
             print(f"[DEBUG] 已生成主动回复：{response.content}")
             print(f"[DEBUG] 即将向后端发送通知")
-            # 使用异步方式发送通知，避免阻塞
-            import threading
-            def send_notification_async():
-                try:
-                    send_notification_to_backend(state_dict, response.content)
-                except Exception as e:
-                    logger.error(f"Failed to send notification: {e}")
-
-            thread = threading.Thread(target=send_notification_async)
-            thread.daemon = True
-            thread.start()
+            # 交给 I/O 线程池发送通知，不阻塞主流程，也不为每条通知新建线程
+            submit_io(send_notification_to_backend, state_dict, response.content)
         except Exception as e:
-            logger.error(f"Error starting notification thread: {e}")
+            logger.error(f"Error submitting notification: {e}")
 
         # 返回last_message
         return {
@@ -2176,7 +2066,7 @@ def send_notification_to_backend(state_dict, response_content):
         if event_time_str:
             try:
                 # 解析时间字符串并转换为毫秒级时间戳
-                dt = datetime.fromisoformat(event_time_str.replace('Z', '+00:00'))
+                dt = _parse_event_time(event_time_str)
                 event_time_ms = int(dt.timestamp() * 1000)
             except Exception as e:
                 logger.error(f"Error parsing event_time: {e}")
@@ -2196,14 +2086,14 @@ def send_notification_to_backend(state_dict, response_content):
             "threadId": thread_id,
             "eventId": event_id,
             "eventTime": event_time_ms,
-            "eventContent": json.dumps({"active_chat_response": response_content}, ensure_ascii=False)
+            "eventContent": orjson.dumps({"active_chat_response": response_content}).decode()
         }
 
         logger.info(f"发送通知到后端: {backend_url}")
         logger.debug(f"通知数据: {notification_data}")
 
         # 发送到后端，设置更短的超时时间
-        response = requests.post(backend_url, json=notification_data, timeout=3)
+        response = _SYNC_HTTP.post(backend_url, json=notification_data, timeout=3)
         if response.status_code == 200:
             logger.info(f"✅ 通知发送成功: {req_id}")
         else:
@@ -2217,6 +2107,20 @@ def send_notification_to_backend(state_dict, response_content):
         logger.error(f"发送通知时出错: {e}")
 
 
+def _post_event_notification(aliyun_url: str, notification_payload: dict) -> None:
+    """向 {ALIYUN_URL}/event_notification 发送事件通知，结果只记录日志"""
+    try:
+        local_response = _SYNC_HTTP.post(f"{aliyun_url}/event_notification",
+                                         json=notification_payload, timeout=10)
+        if local_response.status_code == 200:
+            logger.info(f"[DEBUG] 本地事件通知发送成功: {local_response.json()}")
+        else:
+            logger.warning(
+                f"[DEBUG] 本地事件通知发送失败: status_code={local_response.status_code}")
+    except Exception as local_e:
+        logger.warning(f"[DEBUG] 本地事件通知发送异常: {local_e}")
+
+
 def schedule_event_node(state: Any, config=None):
     """
     调度事件节点 - 事件调度和通知管理
@@ -2268,7 +2172,6 @@ def schedule_event_node(state: Any, config=None):
         # 如果有事件实例且必要参数都存在，发送通知
         if event_instance and assistant_id and thread_id:
             # 检查事件时间是否在未来
-            from datetime import datetime, timezone, timedelta
             try:
                 if isinstance(event_instance, dict):
                     event_time_str = event_instance.get("event_time")
@@ -2276,7 +2179,7 @@ def schedule_event_node(state: Any, config=None):
                     event_time_str = getattr(event_instance, "event_time", None)
 
                 if event_time_str:
-                    event_time = datetime.fromisoformat(event_time_str.replace('Z', '+00:00')).astimezone(BEIJING_TZ)
+                    event_time = _parse_event_time(event_time_str)
                     current_time = datetime.now(BEIJING_TZ)
 
                     # 只有当事件时间在未来时才调度
@@ -2303,31 +2206,17 @@ def schedule_event_node(state: Any, config=None):
                                 "event_time": getattr(event_instance, "event_time", "")
                             }
 
-                        # 发送事件通知到本地端口（同步版本）
-                        import requests
-                        try:
-                            # 构建通知数据
-                            notification_payload = {
-                                "assistant_id": assistant_id,
-                                "thread_id": thread_id,
-                                "event_instance": event_instance_dict,
-                                "appointment_time": appointment_time,
-                                "user_last_reply_time": user_last_reply_time,
-                                "last_active_send_time": last_active_send_time,
-                            }
-
-                            logger.info(f"[DEBUG] 发送本地通知: {notification_payload}")
-                            # 发送事件通知到阿里云URL
-                            aliyun_url = os.getenv("ALIYUN_URL")
-                            local_response = requests.post(f"{aliyun_url}/event_notification",
-                                                           json=notification_payload, timeout=10)
-                            if local_response.status_code == 200:
-                                logger.info(f"[DEBUG] 本地事件通知发送成功: {local_response.json()}")
-                            else:
-                                logger.warning(
-                                    f"[DEBUG] 本地事件通知发送失败: status_code={local_response.status_code}")
-                        except Exception as local_e:
-                            logger.warning(f"[DEBUG] 本地事件通知发送异常: {local_e}")
+                        # 发送事件通知到阿里云URL（在 I/O 线程池中发送，不等待响应）
+                        notification_payload = {
+                            "assistant_id": assistant_id,
+                            "thread_id": thread_id,
+                            "event_instance": event_instance_dict,
+                            "appointment_time": appointment_time,
+                            "user_last_reply_time": user_last_reply_time,
+                            "last_active_send_time": last_active_send_time,
+                        }
+                        logger.info(f"[DEBUG] 发送本地通知: {notification_payload}")
+                        submit_io(_post_event_notification, os.getenv("ALIYUN_URL"), notification_payload)
 
                         # 发送了通知，返回 event_info=True 和事件参数
                         return {
@@ -2409,10 +2298,10 @@ async def event_generation_and_scheduling_active_send_node(state: Any, config=No
     if event_happens:
         # 异步调用事件触发时的事件生成工具函数和主动事件聊天工具函数
         result1, result2 = await asyncio.gather(
-            asyncio.to_thread(event_driven_chat_node.invoke, {
+            run_io(event_driven_chat_node.invoke, {
                 "state_dict": state_data
             }),
-            asyncio.to_thread(event_triggered_node.invoke, {
+            run_io(event_triggered_node.invoke, {
                 "state_dict": state_data
             })
         )
@@ -2420,7 +2309,7 @@ async def event_generation_and_scheduling_active_send_node(state: Any, config=No
         return {**result1, **result2}
     else:
         # 方法2: 调用事件未触发时的事件生成工具函数
-        result = await asyncio.to_thread(event_untriggered_node.invoke, {
+        result = await run_io(event_untriggered_node.invoke, {
             "state_dict": state_data
         })
         return result
@@ -1,5 +1,9 @@
+import functools
 import os
-from typing import Optional
+import string
+from typing import Any, Mapping, Optional, Tuple
+
+_FORMATTER = string.Formatter()
 
 def load_prompt(name: str, include_base_context: bool = True, custom_base_context: Optional[str] = None) -> str:
     """
@@ -30,28 +34,49 @@ def load_prompt(name: str, include_base_context: bool = True, custom_base_contex
     # 构造完整的提示词文件路径
     prompt_path = os.path.join(current_dir, name_with_ext)
     
-    if not os.path.exists(prompt_path):
-        # 增加更详细的错误提示
-        raise FileNotFoundError(f"Error: Prompt file not found at {prompt_path}. Please ensure '{name_with_ext}' exists in the 'prompts' directory.")
-
     try:
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            prompt_body = f.read()
+        prompt_body = _read_prompt_file(prompt_path)
     except FileNotFoundError:
-        print(f"Error: Prompt file not found at {prompt_path}")
-        raise
+        # 增加更详细的错误提示
+        raise FileNotFoundError(f"Error: Prompt file not found at {prompt_path}. Please ensure '{name_with_ext}' exists in the 'prompts' directory.")
 
     # 如果存在全局上下文且需要拼接，自动拼接
     if custom_base_context is not None:
         base_context = custom_base_context
     elif include_base_context:
-        base_path = os.path.join(current_dir, "base_context.txt")
-        if os.path.exists(base_path):
-            try:
-                with open(base_path, 'r', encoding='utf-8') as f:
-                    base_context = f.read().strip()
-            except Exception:
-                base_context = ""
+        try:
+            base_context = _read_prompt_file(os.path.join(current_dir, "base_context.txt")).strip()
+        except OSError:
+            base_context = ""
     else:
         base_context = ""
-    return f"{base_context}\n\n{prompt_body}" if base_context else prompt_body 
\ No newline at end of file
+    return f"{base_context}\n\n{prompt_body}" if base_context else prompt_body
+
+
+@functools.lru_cache(maxsize=32)
+def _read_prompt_file(prompt_path: str) -> str:
+    # prompt 文件在进程生命周期内不变，只读一次磁盘；读取失败不会被缓存
+    with open(prompt_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=32)
+def compile_prompt(name: str, include_base_context: bool = True) -> Tuple[Tuple[str, Optional[str], str, Optional[str]], ...]:
+    """
+    加载 prompt 并预先解析其中的 str.format 占位符，结果按参数缓存。
+
+    Returns:
+        (字面文本, 字段名, 格式说明, 转换符) 片段序列，交给 render_prompt 渲染。
+    """
+    return tuple(_FORMATTER.parse(load_prompt(name, include_base_context=include_base_context)))
+
+
+def render_prompt(segments: Tuple[Tuple[str, Optional[str], str, Optional[str]], ...], values: Mapping[str, Any]) -> str:
+    """用 compile_prompt 的解析结果渲染 prompt，结果与 template.format(**values) 相同，但无需每次重新解析模板"""
+    parts = []
+    for literal, field_name, format_spec, conversion in segments:
+        parts.append(literal)
+        if field_name is not None:
+            value, _ = _FORMATTER.get_field(field_name, (), values)
+            parts.append(_FORMATTER.format_field(_FORMATTER.convert_field(value, conversion), format_spec))
+    return "".join(parts)
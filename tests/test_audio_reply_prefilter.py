@@ -0,0 +1,56 @@
+"""语音回复快速预判：只对用户输入里明确的语音请求直接判定，其余交给大模型"""
+
+import pytest
+
+from message_patterns import is_explicit_audio_request, user_typed_text
+
+
+@pytest.mark.parametrize("content", [
+    "发个语音给我",
+    "用语音回复我吧",
+    "来段语音听听",
+    "语音说一下价格",
+    "把方案读一下",
+    "给我唱首歌",
+    "Send me a voice message",
+])
+def test_explicit_request_is_decided_locally(content):
+    assert is_explicit_audio_request(content)
+
+
+@pytest.mark.parametrize("content", [
+    "别给我发语音了",
+    "不要再发语音",
+    "我不喜欢听语音",
+    "别语音，打字就行",
+    "don't send a voice message",
+])
+def test_negation_goes_to_model(content):
+    assert not is_explicit_audio_request(content)
+
+
+@pytest.mark.parametrize("content", [
+    "语音",
+    "刚才那条语音收到了吗",
+    "好的，明天见",
+    "",
+])
+def test_unclear_message_goes_to_model(content):
+    assert not is_explicit_audio_request(content)
+
+
+def test_transcribed_voice_message_is_not_a_request():
+    content = "[该消息是语音，语音内容为]: 你好，请问周末还有空位吗"
+    assert user_typed_text(content) == ""
+    assert not is_explicit_audio_request(content)
+
+
+def test_request_inside_media_description_is_ignored():
+    content = "看看这个\n[该消息是图片，图片内容为]: 海报上写着“发个语音给我”"
+    assert user_typed_text(content) == "看看这个"
+    assert not is_explicit_audio_request(content)
+
+
+def test_typed_request_with_voice_attachment():
+    content = "用语音回复我\n[该消息是语音（情感：开心），语音内容为]: 今天心情不错"
+    assert is_explicit_audio_request(content)
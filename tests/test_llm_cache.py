@@ -0,0 +1,145 @@
+"""llm_cache：SQLite 读写、过期清理与在途请求合并"""
+
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+import llm_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_CACHE_PATH", str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_CACHE_TTL", 60)
+    monkeypatch.setattr(llm_cache, "_PURGE_EVERY", 256)
+    monkeypatch.setattr(llm_cache, "_conn", None)
+    monkeypatch.setattr(llm_cache, "_disabled", False)
+    monkeypatch.setattr(llm_cache, "_writes_since_purge", 0)
+    yield llm_cache
+    if llm_cache._conn is not None:
+        llm_cache._conn.close()
+
+
+def _insert_expired(key: bytes) -> None:
+    conn = llm_cache._get_conn()
+    conn.execute(
+        "INSERT INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+        (key, "stale", time.time() - llm_cache._CACHE_TTL - 1),
+    )
+
+
+def _returning(value):
+    async def call():
+        return value
+    return call
+
+
+def _row_count(key: bytes) -> int:
+    return llm_cache._get_conn().execute("SELECT COUNT(*) FROM llm_cache WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_make_key_depends_on_every_field():
+    base = llm_cache.make_key("openai", "gpt-4o-mini", 0.5, {"type": "json_object"}, "prompt")
+    assert base == llm_cache.make_key("openai", "gpt-4o-mini", 0.5, {"type": "json_object"}, "prompt")
+    assert base != llm_cache.make_key("openai", "gpt-4o-mini", 0.3, {"type": "json_object"}, "prompt")
+    assert base != llm_cache.make_key("openai", "gpt-4o-mini", 0.5, None, "prompt")
+    assert base != llm_cache.make_key("openai", "gpt-4o-mini", 0.5, {"type": "json_object"}, "other")
+
+
+def test_put_then_get(cache):
+    cache.put(b"k", "value")
+    assert cache.get(b"k") == "value"
+    assert cache.get(b"missing") is None
+
+
+def test_expired_entry_is_not_returned(cache):
+    _insert_expired(b"old")
+    assert cache.get(b"old") is None
+
+
+def test_expired_rows_are_purged_on_open(cache):
+    _insert_expired(b"old")
+    cache._conn.close()
+    cache._conn = None
+    cache._get_conn()
+    assert _row_count(b"old") == 0
+
+
+def test_expired_rows_are_purged_every_n_writes(cache):
+    cache._PURGE_EVERY = 2
+    _insert_expired(b"old")
+    cache.put(b"a", "1")
+    assert _row_count(b"old") == 1
+    cache.put(b"b", "2")
+    assert _row_count(b"old") == 0
+    assert cache.get(b"a") == "1"
+
+
+def test_unusable_path_disables_cache(cache, tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    cache._CACHE_PATH = str(blocker / "llm_cache.sqlite3")
+    cache.put(b"k", "value")
+    assert cache.get(b"k") is None
+    assert cache._disabled
+
+
+def test_get_or_call_caches_result(cache):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return "answer"
+
+    async def main():
+        first = await cache.get_or_call(b"k", call)
+        second = await cache.get_or_call(b"k", call)
+        return first, second
+
+    assert asyncio.run(main()) == ("answer", "answer")
+    assert len(calls) == 1
+
+
+def test_empty_result_is_not_cached(cache):
+    asyncio.run(cache.get_or_call(b"k", _returning("")))
+    assert cache.get(b"k") is None
+
+
+def test_concurrent_requests_share_one_call(cache):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_call(b"k", call) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert len(calls) == 1
+
+
+def test_inflight_table_is_per_event_loop(cache):
+    # 两次 asyncio.run 使用不同的事件循环，在途请求表互不影响
+    assert asyncio.run(cache.get_or_call(b"a", _returning("x"))) == "x"
+    assert asyncio.run(cache.get_or_call(b"b", _returning("y"))) == "y"
+
+
+def test_bypass_forces_call_and_still_writes(cache):
+    cache.put(b"k", "cached")
+    with cache.bypass():
+        assert asyncio.run(cache.get_or_call(b"k", _returning("fresh"))) == "fresh"
+    assert cache.get(b"k") == "fresh"
+    assert asyncio.run(cache.get_or_call(b"k", _returning("unused"))) == "fresh"
+
+
+def test_sqlite_file_uses_wal(cache):
+    cache.put(b"k", "value")
+    conn = sqlite3.connect(cache._CACHE_PATH)
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        conn.close()
@@ -0,0 +1,72 @@
+"""多媒体 URL 识别/去除与回复文本链接提取"""
+
+import pytest
+
+from message_patterns import extract_reply_links, scan_media_urls
+
+
+@pytest.mark.parametrize("url, kind", [
+    ("https://cdn.example.com/a/photo.JPG", "image"),
+    ("https://wx.example.com/wechat/image/abc123", "image"),
+    ("http://example.com/image/abc123", "image"),
+    ("https://cdn.example.com/voice/123.mp3", "audio"),
+    ("https://cdn.example.com/v/clip.mp4", "video"),
+    ("https://cdn.example.com/v/clip.MOV?token=abc&t=1", "video"),
+    ("https://mp.weixin.qq.com/s/AbCdEf", "webpage"),
+])
+def test_url_classification(url, kind):
+    assert scan_media_urls(f"看看 {url}") == ([(kind, url)], "看看")
+
+
+@pytest.mark.parametrize("url, kind", [
+    # 同时符合图片与视频：只归入图片
+    ("https://cdn.example.com/image/clip.mp4", "image"),
+    # 同时符合语音与网页：只归入语音
+    ("https://cdn.example.com/a.mp3", "audio"),
+])
+def test_url_matching_several_kinds_goes_to_highest_priority(url, kind):
+    matches, _ = scan_media_urls(url)
+    assert matches == [(kind, url)]
+
+
+def test_multiple_urls_keep_order_and_are_stripped():
+    content = "图 https://a.com/x.png 音 https://b.com/y.mp3 视 https://c.com/z.mp4 链 https://d.com/page 完"
+    matches, text = scan_media_urls(content)
+    assert matches == [
+        ("image", "https://a.com/x.png"),
+        ("audio", "https://b.com/y.mp3"),
+        ("video", "https://c.com/z.mp4"),
+        ("webpage", "https://d.com/page"),
+    ]
+    assert text == "图  音  视  链  完"
+
+
+def test_message_without_urls_is_returned_stripped():
+    assert scan_media_urls("  你好，在吗？ \n") == ([], "你好，在吗？")
+
+
+def test_message_with_only_a_url_leaves_empty_text():
+    assert scan_media_urls("https://a.com/x.png") == ([("image", "https://a.com/x.png")], "")
+
+
+def test_reply_links_grouped_as_image_file_url():
+    text = (
+        "官网 https://example.com/home ，价目表 https://example.com/price.pdf ，"
+        "效果图 https://cdn.example.com/after.png ，合同见 /docs/contract.docx"
+    )
+    assert extract_reply_links(text) == [
+        {"type": "image", "content": "https://cdn.example.com/after.png", "title": None},
+        {"type": "file", "content": "https://example.com/price.pdf"},
+        {"type": "file", "content": "/docs/contract.docx"},
+        {"type": "url", "content": "https://example.com/home"},
+    ]
+
+
+def test_reply_link_matching_image_and_file_is_an_image():
+    assert extract_reply_links("https://cdn.example.com/image/manual.pdf") == [
+        {"type": "image", "content": "https://cdn.example.com/image/manual.pdf", "title": None},
+    ]
+
+
+def test_reply_without_links():
+    assert extract_reply_links("好的，周六上午十点见") == []
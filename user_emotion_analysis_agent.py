@@ -91,8 +91,8 @@ async def _design_node(state: AgentState, config=None) -> Dict[str, Any]:
 
     # 异步并行执行两个工具调用
     evaluation_result, intent_result,judge_invitation_result = await asyncio.gather(
-                asyncio.to_thread(evaluate_state.invoke, {"state_dict": state_data}),
-        asyncio.to_thread(analyze_customer_intent.invoke, {"state_dict": state_data}),
+        evaluate_state.ainvoke({"state_dict": state_data}),
+        analyze_customer_intent.ainvoke({"state_dict": state_data}),
         asyncio.to_thread(judge_invitation_state.invoke, {"state_dict": state_data, "config": config}),
         return_exceptions=True
     )
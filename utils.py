@@ -1,16 +1,22 @@
 import asyncio
-import json
+import contextvars
+import functools
 import os
 from openai import AsyncOpenAI
 from Configurations import Configuration
 import aiohttp
 import io
 import re
-from typing import List, Any, Optional
+from typing import Callable, List, Any, Optional
 from datetime import datetime, timezone, timedelta
 import random
 import uuid
 import hashlib
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from cachetools import TTLCache
+from media_cache import DegradedResult
 BEIJING_TZ = timezone(timedelta(hours=8))
 from agents.persona_config.config_manager import config_manager
 _cfg = config_manager.get_config() or {}
@@ -18,6 +24,116 @@ _cfg = config_manager.get_config() or {}
 # 延迟初始化client，避免在模块导入时阻塞
 _client = None
 
+# 阻塞式 I/O 调用（同步工具、SDK 轮询、发后即忘的通知）使用的线程池：默认执行器只有 min(32, cpu+4) 个线程，
+# 并发会话多时会排队，这里按 I/O 密集型负载放大。只通过 run_io / submit_io 显式使用，不替换事件循环的默认执行器
+_IO_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MAX_PARALLEL_REQUESTS", str((os.cpu_count() or 1) * 5))),
+    thread_name_prefix="io",
+)
+
+
+async def run_io(fn: Callable[..., Any], *args: Any) -> Any:
+    """在 I/O 线程池中执行阻塞调用并等待结果；与 asyncio.to_thread 一样把当前上下文变量带入线程"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_IO_EXECUTOR, functools.partial(ctx.run, fn, *args))
+
+
+def submit_io(fn: Callable[..., Any], *args: Any) -> None:
+    """
+    在 I/O 线程池中执行阻塞调用，不等待结果（用于通知类的发后即忘请求）。
+
+    复用常驻线程，不再为每次调用新建线程；调用抛出的异常会记录到日志。
+    """
+    def _log_failure(future) -> None:
+        exc = future.exception()
+        if exc is not None:
+            print(f"[IO] 后台调用 {getattr(fn, '__name__', fn)} 失败: {exc}")
+
+    _IO_EXECUTOR.submit(fn, *args).add_done_callback(_log_failure)
+
+
+# 绑定到事件循环的对象（信号量、在途任务表、HTTP 会话）：asyncio 原语只能在创建它的事件循环中使用，
+# 事件循环变化时为新循环各建一份；循环被回收后随之释放
+_loop_locals: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def loop_local(name: str, factory: Callable[[], Any]) -> Any:
+    """获取当前事件循环上名为 name 的对象，不存在时用 factory 创建"""
+    slots = _loop_locals.setdefault(asyncio.get_running_loop(), {})
+    obj = slots.get(name)
+    if obj is None:
+        obj = slots[name] = factory()
+    return obj
+
+
+def _loop_semaphore(name: str, limit: int) -> asyncio.Semaphore:
+    return loop_local(name, lambda: asyncio.Semaphore(limit))
+
+
+async def _close_at_loop_shutdown(session: aiohttp.ClientSession):
+    # 事件循环结束时 asyncio.run 会通过 shutdown_asyncgens 关闭仍存活的异步生成器，借此在循环关闭前关闭会话
+    try:
+        yield
+    finally:
+        await session.close()
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """
+    获取当前事件循环共享的 aiohttp 会话：复用连接池、keep-alive 与 DNS 缓存，不再每次请求新建会话。
+
+    会话按事件循环各建一份（见 loop_local），事件循环关闭前自动关闭；超时、请求头按请求单独传入。
+    """
+    slots = _loop_locals.setdefault(asyncio.get_running_loop(), {})
+    session = slots.get("http_session")
+    if session is None or session.closed:
+        session = slots["http_session"] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300),
+            # 不在请求之间保留 Cookie，行为与原先每次新建会话一致
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        closer = slots["http_session_closer"] = _close_at_loop_shutdown(session)
+        await closer.__anext__()
+    return session
+
+
+# 各类多媒体识别的并发上限：同一类素材一次出现多个 URL 时并发处理，但限制同时在途的模型/下载请求数，避免触发限流
+_IMAGE_CONCURRENCY = int(os.getenv("IMAGE_DESCRIBE_CONCURRENCY", "8"))
+_AUDIO_CONCURRENCY = int(os.getenv("AUDIO_TRANSCRIBE_CONCURRENCY", "4"))
+_VIDEO_CONCURRENCY = int(os.getenv("VIDEO_DESCRIBE_CONCURRENCY", "2"))
+# 网页抓取并发保持较低，避免外部站点风控
+_WEBPAGE_CONCURRENCY = int(os.getenv("WEBPAGE_DESCRIBE_CONCURRENCY", "3"))
+
+# URL 探测结果缓存：url -> (状态码, Content-Type)；请求失败记为 (0, "")
+_URL_PROBE_CACHE: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+_URL_PROBE_TIMEOUT = aiohttp.ClientTimeout(total=2)
+
+
+async def probe_media_urls(urls: List[str]) -> dict:
+    """
+    并发对 URL 发起 HEAD 请求（跟随重定向），返回 {url: (状态码, Content-Type)}。
+
+    用于在调用识别模型之前剔除失效链接、按真实类型重新归类素材；结果缓存一小时。
+    """
+    async def probe_one(url: str) -> tuple:
+        cached = _URL_PROBE_CACHE.get(url)
+        if cached is not None:
+            return cached
+        try:
+            session = await get_http_session()
+            async with session.head(url, timeout=_URL_PROBE_TIMEOUT, allow_redirects=True) as resp:
+                content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                result = (resp.status, content_type)
+        except Exception:
+            result = (0, "")
+        _URL_PROBE_CACHE[url] = result
+        return result
+
+    unique_urls = list(dict.fromkeys(urls))
+    results = await asyncio.gather(*(probe_one(url) for url in unique_urls))
+    return dict(zip(unique_urls, results))
+
 # 延迟加载 dashscope，避免在未安装或未配置时影响其他功能
 _dashscope_loaded = False
 def _ensure_dashscope_loaded() -> bool:
@@ -43,6 +159,11 @@ def _normalize_model_name_for_openrouter(model_name: str) -> str:
         return f"openai/{model_name}"
     return model_name
 
+# 合成并发上限与在途请求表：key 为合成参数 + 文本
+# 信号量与在途请求表都按事件循环各建一份（见 loop_local）
+_TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "8"))
+_TTS_TIMEOUT = aiohttp.ClientTimeout(total=60)
+
 # =====================
 # StepFun TTS 集成
 # 文档参考：`https://platform.stepfun.com/docs/guide/tts`、`https://platform.stepfun.com/docs/api-reference/audio/create_audio`
@@ -92,10 +213,23 @@ async def synthesize_tts_stepfun(text: str, voice: str = None, audio_format: str
         "Content-Type": "application/json",
         "Accept": "application/json, audio/mpeg, audio/mp3"
     }
-    try:
-        timeout = aiohttp.ClientTimeout(total=60)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, json=payload, headers=headers) as resp:
+    # 同样参数的合成请求在途时直接等待同一结果（如多个会话同时发送相同的兜底回复），并限制同时在途的合成数
+    key = (url, model, voice, audio_format, speed, pitch, text)
+    inflight = loop_local("tts_inflight", dict)
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_request_stepfun_tts(url, payload, headers, audio_format))
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _request_stepfun_tts(url: str, payload: dict, headers: dict, audio_format: str) -> Optional[str]:
+    """发送一次 StepFun 合成请求并把结果转为公网音频URL；失败返回 None"""
+    async with _loop_semaphore("tts", _TTS_CONCURRENCY):
+        try:
+            session = await get_http_session()
+            async with session.post(url, json=payload, headers=headers, timeout=_TTS_TIMEOUT) as resp:
                 ctype = resp.headers.get("Content-Type", "")
                 print(f"[TTS] HTTP {resp.status}, content-type={ctype}")
                 if resp.status != 200:
@@ -104,7 +238,7 @@ async def synthesize_tts_stepfun(text: str, voice: str = None, audio_format: str
                         if ctype.startswith("audio/"):
                             audio_bytes = await resp.read()
                             fname = f"speech_{uuid.uuid4().hex[:8]}.{audio_format or 'mp3'}"
-                            link = await _upload_bytes_public(audio_bytes, fname)
+                            link = await _publish_tts_audio(audio_bytes, fname)
                             print(f"[TTS] 二进制音频→transfer.sh 上传结果: {link}")
                             return link
                     except Exception:
@@ -141,7 +275,7 @@ async def synthesize_tts_stepfun(text: str, voice: str = None, audio_format: str
                                     base64_data = base64_data.split(",", 1)[1]
                                 audio_bytes = base64.b64decode(base64_data)
                                 fname = f"speech_{uuid.uuid4().hex[:8]}.{audio_format or 'mp3'}"
-                                link = await _upload_bytes_public(audio_bytes, fname)
+                                link = await _publish_tts_audio(audio_bytes, fname)
                                 print(f"[TTS] base64→transfer.sh 上传结果: {link}")
                                 return link
                             except Exception:
@@ -153,13 +287,29 @@ async def synthesize_tts_stepfun(text: str, voice: str = None, audio_format: str
                     audio_bytes = await resp.read()
                     if audio_bytes:
                         fname = f"speech_{uuid.uuid4().hex[:8]}.{audio_format or 'mp3'}"
-                        link = await _upload_bytes_public(audio_bytes, fname)
+                        link = await _publish_tts_audio(audio_bytes, fname)
                         print(f"[TTS] 二进制→transfer.sh 上传结果: {link}")
                         return link
                     return None
-    except Exception:
-        print("[TTS] StepFun 请求异常")
-        return None
+        except Exception:
+            print("[TTS] StepFun 请求异常")
+            return None
+
+# 已知时长的音频：url -> 时长毫秒。合成时手头已有音频数据，上传的同时解析时长，
+# 之后 get_audio_duration_ms 直接取用，不再把刚上传的文件重新下载一遍；下载探测得到的时长同样记录，重发同一URL时不再下载
+_AUDIO_DURATION_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+
+
+async def _publish_tts_audio(audio_bytes: bytes, filename: str) -> Optional[str]:
+    """上传合成的音频并同时解析其时长，返回公网链接"""
+    link, duration_ms = await asyncio.gather(
+        _upload_bytes_public(audio_bytes, filename),
+        _audio_duration_from_bytes(audio_bytes),
+    )
+    if link and duration_ms is not None:
+        _AUDIO_DURATION_CACHE[link] = duration_ms
+    return link
+
 
 async def _upload_bytes_public(data: bytes, filename: str) -> Optional[str]:
     """上传二进制到公共临时文件托管，返回公网可访问链接。
@@ -319,39 +469,42 @@ async def describe_image_urls(urls: List[str]) -> List[str]:
         print(f"🖼️ [DEBUG-视觉识别] 详细错误信息:\n{traceback.format_exc()}")
         return [f"[获取视觉模型客户端失败: {e}]" for _ in urls]
 
-    descriptions = []
     # 优先使用运行时的 vision_model；未显式配置则强制使用 z-ai/glm-4.5v（不再回退到 model_name，避免选到不支持图像的聊天模型）
     vision_model = _normalize_model_name_for_openrouter(_cfg.get("vision_model") or "z-ai/glm-4.5v")
     print(f"🖼️ [DEBUG-视觉识别] 将使用的视觉模型: {vision_model}")
 
-    for i, url in enumerate(urls, 1):
-        print(f"🖼️ [DEBUG-视觉识别] 开始处理第 {i} 张图片...")
-        try:
-            print(f"🖼️ [DEBUG-视觉识别] 正在调用视觉模型分析图片: {url[:100]}...")
-            response = await client.chat.completions.create(
-                model=vision_model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "请描述这张图片的内容："},
-                            {"type": "image_url", "image_url": {"url": url}}
-                        ]
-                    }
-                ],
-                max_tokens=300
-            )
-            print(f"🖼️ [DEBUG-视觉识别] 视觉模型调用完成，响应类型: {type(response)}")
-            description = response.choices[0].message.content.strip()
-            print(f"🖼️ [DEBUG-视觉识别] 图片 {i} 描述成功，长度: {len(description)} 字符")
-            print(f"🖼️ [DEBUG-视觉识别] 图片 {i} 描述内容: {description[:200]}...")
-        except Exception as e:
-            print(f"🖼️ [DEBUG-视觉识别] 图片 {i} 描述失败: {e}")
-            import traceback
-            print(f"🖼️ [DEBUG-视觉识别] 详细错误信息:\n{traceback.format_exc()}")
-            description = f"[图片描述失败: {e}]"
+    async def describe_one(i: int, url: str) -> str:
+        async with _loop_semaphore("image", _IMAGE_CONCURRENCY):
+            print(f"🖼️ [DEBUG-视觉识别] 开始处理第 {i} 张图片...")
+            try:
+                print(f"🖼️ [DEBUG-视觉识别] 正在调用视觉模型分析图片: {url[:100]}...")
+                response = await client.chat.completions.create(
+                    model=vision_model,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "text", "text": "请描述这张图片的内容："},
+                                {"type": "image_url", "image_url": {"url": url}}
+                            ]
+                        }
+                    ],
+                    max_tokens=300
+                )
+                print(f"🖼️ [DEBUG-视觉识别] 视觉模型调用完成，响应类型: {type(response)}")
+                description = response.choices[0].message.content.strip()
+                print(f"🖼️ [DEBUG-视觉识别] 图片 {i} 描述成功，长度: {len(description)} 字符")
+                print(f"🖼️ [DEBUG-视觉识别] 图片 {i} 描述内容: {description[:200]}...")
+            except Exception as e:
+                print(f"🖼️ [DEBUG-视觉识别] 图片 {i} 描述失败: {e}")
+                import traceback
+                print(f"🖼️ [DEBUG-视觉识别] 详细错误信息:\n{traceback.format_exc()}")
+                description = f"[图片描述失败: {e}]"
+
+            return description
 
-        descriptions.append(description)
+    # 多张图片并发识别，结果顺序与 urls 一致
+    descriptions = await asyncio.gather(*(describe_one(i, url) for i, url in enumerate(urls, 1)))
 
     print(f"🖼️ [DEBUG-视觉识别] 所有图片处理完成，共 {len(descriptions)} 个描述")
     return descriptions
@@ -412,12 +565,13 @@ async def transcribe_audio_urls(urls: List[str]) -> List[str]:
         print(f"🎵 [DEBUG-音频转录] 获取OpenAI客户端失败: {e}")
         return [f"[获取音频转录客户端失败: {e}]" for _ in urls]
 
-    transcriptions: List[str] = []
     whisper_model = _cfg.get("whisper_model", "whisper-1")
     print(f"🎵 [DEBUG-音频转录] 将使用的Whisper模型: {whisper_model}")
 
-    async with aiohttp.ClientSession() as session:
-        for i, url in enumerate(urls, 1):
+    session = await get_http_session()
+
+    async def transcribe_one(i: int, url: str) -> str:
+        async with _loop_semaphore("audio", _AUDIO_CONCURRENCY):
             print(f"🎵 [DEBUG-音频转录] 正在处理第 {i} 个音频: {url[:100]}...")
             try:
                 print(f"🎵 [DEBUG-音频转录] 下载音频文件...")
@@ -425,55 +579,56 @@ async def transcribe_audio_urls(urls: List[str]) -> List[str]:
                     status = resp.status
                     print(f"🎵 [DEBUG-音频转录] HTTP响应状态码: {status}")
 
-                    if resp.status == 200:
-                        audio_data = await resp.read()
-                        print(f"🎵 [DEBUG-音频转录] 音频数据下载完成，大小: {len(audio_data)} bytes")
+                    if resp.status != 200:
+                        error_msg = f"[语音获取失败: {resp.status}]"
+                        print(f"🎵 [DEBUG-音频转录] {error_msg}")
+                        return error_msg
 
-                        audio_file = io.BytesIO(audio_data)
-                        audio_file.name = "audio.mp3"
+                    audio_data = await resp.read()
+                    print(f"🎵 [DEBUG-音频转录] 音频数据下载完成，大小: {len(audio_data)} bytes")
 
-                        prompt = "请直接提取这段语音的核心内容，控制在200字以内，保留关键信息。"
-                        print(f"🎵 [DEBUG-音频转录] 转录提示词: {prompt}")
+                audio_file = io.BytesIO(audio_data)
+                audio_file.name = "audio.mp3"
 
-                        # 若未配置官方 OpenAI Key，跳过 Whisper 兜底
-                        if not os.getenv("OPENAI_API_KEY"):
-                            print("🎵 [DEBUG-音频转录] 未配置OPENAI_API_KEY，跳过音频转写")
-                            transcriptions.append("[未配置OPENAI_API_KEY，跳过音频转写]")
-                            continue
+                prompt = "请直接提取这段语音的核心内容，控制在200字以内，保留关键信息。"
+                print(f"🎵 [DEBUG-音频转录] 转录提示词: {prompt}")
 
-                        print("🎵 [DEBUG-音频转录] 正在调用Whisper API...")
-                        response = await client.audio.transcriptions.create(
-                            model=whisper_model,
-                            file=audio_file,
-                            prompt=prompt,
-                            response_format="text"
-                        )
+                # 若未配置官方 OpenAI Key，跳过 Whisper 兜底
+                if not os.getenv("OPENAI_API_KEY"):
+                    print("🎵 [DEBUG-音频转录] 未配置OPENAI_API_KEY，跳过音频转写")
+                    return "[未配置OPENAI_API_KEY，跳过音频转写]"
 
-                        transcribed_text = response.strip() if isinstance(response, str) else response.text.strip()
-                        print(f"🎵 [DEBUG-音频转录] Whisper转录完成，原始长度: {len(transcribed_text)} 字符")
+                print("🎵 [DEBUG-音频转录] 正在调用Whisper API...")
+                response = await client.audio.transcriptions.create(
+                    model=whisper_model,
+                    file=audio_file,
+                    prompt=prompt,
+                    response_format="text"
+                )
 
-                        if len(transcribed_text) > 150:
-                            print(f"🎵 [DEBUG-音频转录] 内容过长({len(transcribed_text)}字)，使用GPT提炼重要内容...")
-                            try:
-                                important_content = await extract_important_content(transcribed_text, max_length=100)
-                                transcriptions.append(important_content)
-                                print(f"🎵 [DEBUG-音频转录] 提炼完成，最终长度: {len(important_content)} 字")
-                            except Exception as e:
-                                print(f"🎵 [DEBUG-音频转录] 内容提炼失败: {e}")
-                                transcriptions.append(transcribed_text[:150] + "...")
-                        else:
-                            transcriptions.append(transcribed_text)
-                            print(f"🎵 [DEBUG-音频转录] 转录完成，长度: {len(transcribed_text)} 字")
-                    else:
-                        error_msg = f"[语音获取失败: {resp.status}]"
-                        transcriptions.append(error_msg)
-                        print(f"🎵 [DEBUG-音频转录] {error_msg}")
+                transcribed_text = response.strip() if isinstance(response, str) else response.text.strip()
+                print(f"🎵 [DEBUG-音频转录] Whisper转录完成，原始长度: {len(transcribed_text)} 字符")
             except Exception as e:
                 error_msg = f"[语音转录失败: {e}]"
-                transcriptions.append(error_msg)
                 print(f"🎵 [DEBUG-音频转录] {error_msg}")
                 import traceback
                 print(f"🎵 [DEBUG-音频转录] 详细错误信息:\n{traceback.format_exc()}")
+                return error_msg
+
+        if len(transcribed_text) > 150:
+            print(f"🎵 [DEBUG-音频转录] 内容过长({len(transcribed_text)}字)，使用GPT提炼重要内容...")
+            try:
+                important_content = await extract_important_content(transcribed_text, max_length=100)
+                print(f"🎵 [DEBUG-音频转录] 提炼完成，最终长度: {len(important_content)} 字")
+                return important_content
+            except Exception as e:
+                print(f"🎵 [DEBUG-音频转录] 内容提炼失败: {e}")
+                return transcribed_text[:150] + "..."
+        print(f"🎵 [DEBUG-音频转录] 转录完成，长度: {len(transcribed_text)} 字")
+        return transcribed_text
+
+    # 多段语音并发转写（受并发上限约束），结果顺序与 urls 一致
+    transcriptions = await asyncio.gather(*(transcribe_one(i, url) for i, url in enumerate(urls, 1)))
 
     print(f"🎵 [DEBUG-音频转录] 所有音频处理完成，共 {len(transcriptions)} 个转录结果")
     return transcriptions
@@ -554,17 +709,17 @@ async def _fetch_json_resilient(url: str, retries: int = 3, backoff_base: float
     for attempt in range(retries + 1):
         try:
             timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(url, ssl=False) as r:
-                    if r.status == 200:
-                        return await r.json(content_type=None)
-                    # 特殊处理405错误，提供更友好的错误信息
-                    elif r.status == 405:
-                        print(f"[DEBUG] HTTP 405 Method Not Allowed for URL: {url}")
-                        print("[DEBUG] 可能原因：LangSmith环境限制或服务器不支持GET方法")
-                        last_err = RuntimeError(f"HTTP 405 - Method Not Allowed (LangSmith环境可能存在访问限制)")
-                    else:
-                        last_err = RuntimeError(f"HTTP {r.status}")
+            session = await get_http_session()
+            async with session.get(url, ssl=False, timeout=timeout) as r:
+                if r.status == 200:
+                    return await r.json(content_type=None, loads=orjson.loads)
+                # 特殊处理405错误，提供更友好的错误信息
+                elif r.status == 405:
+                    print(f"[DEBUG] HTTP 405 Method Not Allowed for URL: {url}")
+                    print("[DEBUG] 可能原因：LangSmith环境限制或服务器不支持GET方法")
+                    last_err = RuntimeError(f"HTTP 405 - Method Not Allowed (LangSmith环境可能存在访问限制)")
+                else:
+                    last_err = RuntimeError(f"HTTP {r.status}")
         except Exception as e:
             last_err = e
         if attempt < retries:
@@ -877,7 +1032,7 @@ def parse_event_decision(response: str) -> dict:
             start = response.find("{")
             end = response.rfind("}") + 1
             json_str = response[start:end]
-            return json.loads(json_str)
+            return orjson.loads(json_str)
         else:
             raise ValueError("响应中没有找到有效的JSON")
     except Exception as e:
@@ -910,54 +1065,47 @@ async def describe_video_urls(urls: List[str]) -> List[str]:
         "ts", "mts", "m2ts", "divx", "xvid", "swf", "f4v", "f4p", "f4a", "f4b"
     }
     
-    descriptions = []
-    for url in urls:
-        try:
-            # 检查URL是否为支持的视频格式
-            url_lower = url.lower()
-            is_video = any(url_lower.endswith(f".{fmt}") for fmt in VIDEO_FORMATS) or any(f".{fmt}?" in url_lower for fmt in VIDEO_FORMATS)
-            
-            if not is_video:
-                print(f"[DEBUG] URL格式检查失败: {url}")
-                descriptions.append(f"[非视频格式或格式不支持: {url}]")
-                continue
-            
-            print(f"🎬 开始专业视频分析: {url}")
-            
-            # 方案1：多帧视频分析（云平台友好）
+    async def describe_one(url: str) -> str:
+        async with _loop_semaphore("video", _VIDEO_CONCURRENCY):
             try:
-                description = await _analyze_video_multiframe(url)
-                descriptions.append(description)
+                # 检查URL是否为支持的视频格式
+                url_lower = url.lower()
+                is_video = any(url_lower.endswith(f".{fmt}") for fmt in VIDEO_FORMATS) or any(f".{fmt}?" in url_lower for fmt in VIDEO_FORMATS)
+                
+                if not is_video:
+                    print(f"[DEBUG] URL格式检查失败: {url}")
+                    return f"[非视频格式或格式不支持: {url}]"
                 
-            except Exception as multiframe_error:
-                print(f"⚠️ 多帧视频分析失败: {multiframe_error}")
+                print(f"🎬 开始专业视频分析: {url}")
+                
+                # 方案1：多帧视频分析（云平台友好）
+                try:
+                    return await _analyze_video_multiframe(url)
+                except Exception as multiframe_error:
+                    print(f"⚠️ 多帧视频分析失败: {multiframe_error}")
                 
                 # 方案2：直接URL分析（降级）
                 try:
-                    description = await _analyze_video_url_direct(url)
-                    descriptions.append(description)
-                    
+                    return await _analyze_video_url_direct(url)
                 except Exception as direct_error:
                     print(f"⚠️ 直接URL分析失败: {direct_error}")
-                    
-                    # 方案3：智能URL分析
-                    try:
-                        description = await _analyze_video_url_intelligent(url)
-                        descriptions.append(description)
-                        
-                    except Exception as intelligent_error:
-                        print(f"⚠️ 智能URL分析失败: {intelligent_error}")
-                        
-                        # 方案4：降级处理 - 基本信息
-                        filename = url.split('/')[-1].split('?')[0] if '/' in url else url
-                        file_extension = filename.split('.')[-1].lower() if '.' in filename else "未知格式"
-                        description = f"视频文件：{filename}（{file_extension}格式）。当前环境限制，无法进行详细的视频内容分析。"
-                        descriptions.append(description)
-            
-        except Exception as e:
-            description = f"[视频处理失败: {e}]"
-            descriptions.append(description)
+                
+                # 方案3：智能URL分析
+                try:
+                    return await _analyze_video_url_intelligent(url)
+                except Exception as intelligent_error:
+                    print(f"⚠️ 智能URL分析失败: {intelligent_error}")
+                
+                # 方案4：降级处理 - 基本信息
+                filename = url.split('/')[-1].split('?')[0] if '/' in url else url
+                file_extension = filename.split('.')[-1].lower() if '.' in filename else "未知格式"
+                return DegradedResult(f"视频文件：{filename}（{file_extension}格式）。当前环境限制，无法进行详细的视频内容分析。")
+                
+            except Exception as e:
+                return f"[视频处理失败: {e}]"
     
+    # 多个视频并发分析（受并发上限约束），结果顺序与 urls 一致
+    descriptions = await asyncio.gather(*(describe_one(url) for url in urls))
     return descriptions
 
 async def _analyze_video_multiframe(video_url: str) -> str:
@@ -990,6 +1138,7 @@ async def _analyze_video_multiframe(video_url: str) -> str:
         
         # 4. 使用 aihubmix o4-mini 分析多个关键帧
         frame_descriptions = []
+        degraded = False
         if frame_images:
             try:
                 frame_descriptions = await _analyze_frames_with_aihubmix(frame_images, video_id)
@@ -997,6 +1146,8 @@ async def _analyze_video_multiframe(video_url: str) -> str:
             except Exception as frame_error:
                 print(f"⚠️ 关键帧分析失败: {frame_error}")
                 frame_descriptions = [f"第{i+1}帧：分析失败" for i in range(min(len(frame_images), 5))]
+            # 个别关键帧分析失败时结果不完整，不缓存
+            degraded = any(desc.endswith("分析失败") for desc in frame_descriptions)
         
         # 5. 使用 OpenAI Whisper 转录音频
         audio_transcription = ""
@@ -1007,6 +1158,7 @@ async def _analyze_video_multiframe(video_url: str) -> str:
             except Exception as audio_error:
                 print(f"⚠️ 音频转录失败: {audio_error}")
                 audio_transcription = "无法提取音频内容"
+            degraded = degraded or audio_transcription == "无法提取音频内容"
         
         # 6. 综合多模态信息生成视频描述
         try:
@@ -1016,7 +1168,9 @@ async def _analyze_video_multiframe(video_url: str) -> str:
             # 降级处理
             frame_summary = "；".join(frame_descriptions[:3]) if frame_descriptions else "无法提取视频帧"
             audio_summary = audio_transcription if audio_transcription != "无法提取音频内容" else "无音频"
-            result = f"🎬 视频内容：{frame_summary}。音频内容：{audio_summary}"
+            result = DegradedResult(f"🎬 视频内容：{frame_summary}。音频内容：{audio_summary}")
+        if degraded:
+            result = DegradedResult(result)
         
         # 7. 主动清理大内存对象（虽然Python会自动清理，但显式清理更安全）
         del video_data
@@ -1091,8 +1245,9 @@ async def _analyze_video_url_direct(video_url: str) -> str:
                     print(f"⚠️ 音频转录失败: {audio_error}")
                     audio_transcription = "无法提取音频内容"
                 
-                # 方案3：综合生成视频描述
-                return await _synthesize_video_description_simple(frame_description, audio_transcription, video_url)
+                # 方案3：综合生成视频描述（音频无法提取时结果不完整，标记为降级）
+                description = await _synthesize_video_description_simple(frame_description, audio_transcription, video_url)
+                return DegradedResult(description) if audio_transcription == "无法提取音频内容" else description
                 
         except Exception as aihubmix_error:
             print(f"⚠️ aihubmix分析失败: {aihubmix_error}")
@@ -1131,7 +1286,8 @@ async def _analyze_video_url_direct(video_url: str) -> str:
                 print(f"⚠️ 音频转录失败: {audio_error}")
                 audio_transcription = "无法提取音频内容"
             
-            return await _synthesize_video_description_simple(frame_description, audio_transcription, video_url)
+            description = await _synthesize_video_description_simple(frame_description, audio_transcription, video_url)
+            return DegradedResult(description) if audio_transcription == "无法提取音频内容" else description
             
         except Exception as openai_error:
             print(f"⚠️ OpenAI分析失败: {openai_error}")
@@ -1198,7 +1354,8 @@ async def _analyze_video_url_intelligent(video_url: str) -> str:
     
     description += " 当前环境限制，无法进行详细的视频内容分析。如需完整分析，建议使用支持视频处理的专业API。"
     
-    return f"🎬 {description}"
+    # 仅根据 URL 推测，不是实际识别结果
+    return DegradedResult(f"🎬 {description}")
 
 async def _synthesize_video_description_simple(frame_description: str, audio_transcription: str, video_url: str) -> str:
     """综合视频画面和音频信息生成简单描述"""
@@ -1250,17 +1407,17 @@ async def _synthesize_video_description_simple(frame_description: str, audio_tra
     except Exception as e:
         print(f"⚠️ 视频描述生成失败: {e}")
         # 降级处理：简单拼接
-        return f"🎬 视频内容：{frame_description}。音频内容：{audio_transcription}"
+        return DegradedResult(f"🎬 视频内容：{frame_description}。音频内容：{audio_transcription}")
 
 async def _download_video_to_memory(video_url: str) -> bytes:
     """流式下载视频数据到内存"""
-    async with aiohttp.ClientSession() as session:
-        async with session.get(video_url) as response:
-            if response.status == 200:
-                video_data = await response.read()
-                return video_data
-            else:
-                raise Exception(f"视频下载失败: {response.status}")
+    session = await get_http_session()
+    async with session.get(video_url) as response:
+        if response.status == 200:
+            video_data = await response.read()
+            return video_data
+        else:
+            raise Exception(f"视频下载失败: {response.status}")
 
 async def _extract_frames_from_memory(video_data: bytes, video_id: str) -> List[bytes]:
     """从内存中的视频数据提取关键帧"""
@@ -1792,7 +1949,7 @@ async def _synthesize_multiframe_video_description(frame_descriptions: List[str]
         if not frame_descriptions or all("分析失败" in desc for desc in frame_descriptions):
             frame_summary = f"成功提取了{len(frame_descriptions)}个关键帧，但分析失败"
         
-        return f"🎬 视频内容：{frame_summary}。音频内容：{audio_summary}"
+        return DegradedResult(f"🎬 视频内容：{frame_summary}。音频内容：{audio_summary}")
 
 def _get_memory_usage():
     """获取当前内存使用情况"""
@@ -1830,7 +1987,6 @@ async def describe_webpage_urls(urls: List[str]) -> List[str]:
         print("🌐 [DEBUG-外部链接识别] 没有网页URL需要处理，返回空列表")
         return []
 
-    import aiohttp
     from bs4 import BeautifulSoup
 
     headers_base = {
@@ -1859,40 +2015,40 @@ async def describe_webpage_urls(urls: List[str]) -> List[str]:
                 print(f"🌐 [DEBUG-外部链接识别] 检测到微信公众号，添加特殊请求头")
 
             print(f"🌐 [DEBUG-外部链接识别] 正在发起HTTP请求...")
-            async with aiohttp.ClientSession(headers=headers) as session:
-                async with session.get(url, timeout=15) as resp:
-                    status = resp.status
-                    print(f"🌐 [DEBUG-外部链接识别] HTTP响应状态码: {status}")
-
-                    text_body = await resp.text(errors="ignore")
-                    print(f"🌐 [DEBUG-外部链接识别] 获取响应内容，长度: {len(text_body)} 字符")
-
-                    if status != 200 or ("环境异常" in text_body and "去验证" in text_body):
-                        print(f"🌐 [DEBUG-外部链接识别] 检测到异常响应，使用Jina AI代理...")
-                        # 兜底：使用 Jina AI Reader 代理拉取纯文本
-                        proxy_url = f"https://r.jina.ai/{url}"
-                        try:
-                            print(f"🌐 [DEBUG-外部链接识别] 正在调用代理: {proxy_url}")
-                            async with session.get(proxy_url, timeout=20) as proxy_resp:
-                                proxy_status = proxy_resp.status
-                                print(f"🌐 [DEBUG-外部链接识别] 代理响应状态码: {proxy_status}")
-
-                                if proxy_resp.status == 200:
-                                    proxy_text = await proxy_resp.text(errors="ignore")
-                                    print(f"🌐 [DEBUG-外部链接识别] 代理获取内容成功，长度: {len(proxy_text)} 字符")
-                                    # 代理返回已是文本，直接进入后续提炼
-                                    html = f"<html><body><article>{proxy_text}</article></body></html>"
-                                    print(f"🌐 [DEBUG-外部链接识别] 使用代理内容进行解析")
-                                else:
-                                    print(f"🌐 [DEBUG-外部链接识别] 代理调用失败: HTTP {proxy_status}")
-                                    return f"[网页获取失败: HTTP {status}，代理 {proxy_resp.status}]"
-                        except Exception as proxy_err:
-                            print(f"🌐 [DEBUG-外部链接识别] 代理调用异常: {proxy_err}")
-                            return f"[网页获取失败: HTTP {status}，代理异常: {proxy_err}]"
-                    else:
-                        # 正常HTML
-                        html = text_body
-                        print(f"🌐 [DEBUG-外部链接识别] 使用原始HTML内容进行解析")
+            session = await get_http_session()
+            async with session.get(url, headers=headers, timeout=15) as resp:
+                status = resp.status
+                print(f"🌐 [DEBUG-外部链接识别] HTTP响应状态码: {status}")
+
+                text_body = await resp.text(errors="ignore")
+                print(f"🌐 [DEBUG-外部链接识别] 获取响应内容，长度: {len(text_body)} 字符")
+
+                if status != 200 or ("环境异常" in text_body and "去验证" in text_body):
+                    print(f"🌐 [DEBUG-外部链接识别] 检测到异常响应，使用Jina AI代理...")
+                    # 兜底：使用 Jina AI Reader 代理拉取纯文本
+                    proxy_url = f"https://r.jina.ai/{url}"
+                    try:
+                        print(f"🌐 [DEBUG-外部链接识别] 正在调用代理: {proxy_url}")
+                        async with session.get(proxy_url, headers=headers, timeout=20) as proxy_resp:
+                            proxy_status = proxy_resp.status
+                            print(f"🌐 [DEBUG-外部链接识别] 代理响应状态码: {proxy_status}")
+
+                            if proxy_resp.status == 200:
+                                proxy_text = await proxy_resp.text(errors="ignore")
+                                print(f"🌐 [DEBUG-外部链接识别] 代理获取内容成功，长度: {len(proxy_text)} 字符")
+                                # 代理返回已是文本，直接进入后续提炼
+                                html = f"<html><body><article>{proxy_text}</article></body></html>"
+                                print(f"🌐 [DEBUG-外部链接识别] 使用代理内容进行解析")
+                            else:
+                                print(f"🌐 [DEBUG-外部链接识别] 代理调用失败: HTTP {proxy_status}")
+                                return f"[网页获取失败: HTTP {status}，代理 {proxy_resp.status}]"
+                    except Exception as proxy_err:
+                        print(f"🌐 [DEBUG-外部链接识别] 代理调用异常: {proxy_err}")
+                        return f"[网页获取失败: HTTP {status}，代理异常: {proxy_err}]"
+                else:
+                    # 正常HTML
+                    html = text_body
+                    print(f"🌐 [DEBUG-外部链接识别] 使用原始HTML内容进行解析")
         except Exception as e:
             print(f"🌐 [DEBUG-外部链接识别] 网页获取异常: {e}")
             import traceback
@@ -1977,14 +2133,16 @@ async def describe_webpage_urls(urls: List[str]) -> List[str]:
             print(f"🌐 [DEBUG-外部链接识别] 详细错误信息:\n{traceback.format_exc()}")
             return f"[网页解析失败: {e}]"
 
-    # 顺序处理以控制并发，避免外部站点风控；如需更快可切换为gather
-    print(f"🌐 [DEBUG-外部链接识别] 开始顺序处理 {len(urls)} 个URL...")
-    results: List[str] = []
-    for i, u in enumerate(urls, 1):
-        print(f"🌐 [DEBUG-外部链接识别] 正在处理第 {i}/{len(urls)} 个URL: {u[:100]}...")
-        desc = await fetch_and_summarize(u)
-        results.append(desc)
-        print(f"🌐 [DEBUG-外部链接识别] 第 {i} 个URL处理完成，结果长度: {len(desc)} 字符")
+    # 低并发处理，兼顾速度与外部站点风控（并发上限见 _WEBPAGE_CONCURRENCY）
+    async def process_one(i: int, u: str) -> str:
+        async with _loop_semaphore("webpage", _WEBPAGE_CONCURRENCY):
+            print(f"🌐 [DEBUG-外部链接识别] 正在处理第 {i}/{len(urls)} 个URL: {u[:100]}...")
+            desc = await fetch_and_summarize(u)
+            print(f"🌐 [DEBUG-外部链接识别] 第 {i} 个URL处理完成，结果长度: {len(desc)} 字符")
+            return desc
+
+    print(f"🌐 [DEBUG-外部链接识别] 开始并发处理 {len(urls)} 个URL...")
+    results = await asyncio.gather(*(process_one(i, u) for i, u in enumerate(urls, 1)))
 
     print(f"🌐 [DEBUG-外部链接识别] 所有网页处理完成，共 {len(results)} 个结果")
     return results
@@ -2028,21 +2186,43 @@ async def get_audio_duration_ms(audio_url: str) -> Optional[int]:
     if not audio_url or not isinstance(audio_url, str):
         return None
 
+    # 本进程合成上传或已探测过的音频直接返回缓存的时长
+    duration_ms = _AUDIO_DURATION_CACHE.get(audio_url)
+    if duration_ms is not None:
+        print(f"[AUDIO] 音频时长: {duration_ms}毫秒 (缓存)")
+        return duration_ms
+
     try:
         # 下载音频文件
         timeout = aiohttp.ClientTimeout(total=30)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(audio_url) as response:
-                if response.status != 200:
-                    print(f"[AUDIO] 下载失败: HTTP {response.status}")
-                    return None
+        session = await get_http_session()
+        async with session.get(audio_url, timeout=timeout) as response:
+            if response.status != 200:
+                print(f"[AUDIO] 下载失败: HTTP {response.status}")
+                return None
 
-                # 读取音频数据
-                audio_data = await response.read()
-                if not audio_data:
-                    print("[AUDIO] 下载到的音频数据为空")
-                    return None
+            # 读取音频数据
+            audio_data = await response.read()
+            if not audio_data:
+                print("[AUDIO] 下载到的音频数据为空")
+                return None
 
+        duration_ms = await _audio_duration_from_bytes(audio_data)
+        if duration_ms is not None:
+            _AUDIO_DURATION_CACHE[audio_url] = duration_ms
+        return duration_ms
+
+    except Exception as e:
+        print(f"[AUDIO] 获取音频时长异常: {e}")
+        return None
+
+
+async def _audio_duration_from_bytes(audio_data: bytes) -> Optional[int]:
+    """从内存中的音频数据解析时长（毫秒）：mutagen → pydub → 按文件大小估算"""
+    if not audio_data:
+        return None
+
+    try:
         # 方案1：尝试使用mutagen（轻量级，无阻塞调用问题）
         try:
             from mutagen.mp3 import MP3
@@ -2060,7 +2240,6 @@ async def get_audio_duration_ms(audio_url: str) -> Optional[int]:
                     print(f"[AUDIO] Mutagen解析失败: {e}")
                     return None
 
-            import asyncio
             duration_ms = await asyncio.to_thread(_get_duration_mutagen, audio_data)
 
             if duration_ms is not None:
@@ -2115,7 +2294,7 @@ async def get_audio_duration_ms(audio_url: str) -> Optional[int]:
         return None
 
     except Exception as e:
-        print(f"[AUDIO] 获取音频时长异常: {e}")
+        print(f"[AUDIO] 解析音频时长异常: {e}")
         return None
 
 # =====================
@@ -2342,7 +2521,7 @@ async def select_relevant_meterials(materials: List[dict], user_message: str, co
 
             # 解析JSON结果
             try:
-                result = json.loads(result_text)
+                result = orjson.loads(result_text)
                 selected_name = result.get("selected_name")
                 material_type = result.get("material_type")
                 reason = result.get("reason", "")
@@ -2375,7 +2554,7 @@ async def select_relevant_meterials(materials: List[dict], user_message: str, co
                 print(f"[MATERIAL_SELECT] 未找到匹配材料: {selected_name}")
                 return None
 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 print(f"[MATERIAL_SELECT] JSON解析失败: {e}")
                 print(f"[MATERIAL_SELECT] 原始响应: {result_text}")
                 return None